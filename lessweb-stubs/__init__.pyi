@@ -14,11 +14,17 @@ from .application import (
     interceptor as interceptor,
     Application as Application,
 )
+from .container import (
+    Scope as Scope,
+)
 from .context import (
     Context as Context,
     Request as Request,
     Response as Response,
 )
+from .fileresponse import (
+    FileResponse as FileResponse,
+)
 from .storage import (
     Storage as Storage,
 )
@@ -31,6 +37,8 @@ from .bridge import (
 from .webapi import (
     BadParamError as BadParamError,
     NotFoundError as NotFoundError,
+    HttpError as HttpError,
+    NotModifiedError as NotModifiedError,
     Cookie as Cookie,
     HttpStatus as HttpStatus,
     ResponseStatus as ResponseStatus,
@@ -0,0 +1,59 @@
+import asyncio
+import queue
+import threading
+from concurrent.futures import Executor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional
+
+from lessweb.context import Context
+
+
+__all__ = ["SyncBodyReader", "AsgiBodyReader", "aiohttp_environ", "asgi_environ", "aiter_body", "aclose_body",
+           "LoopWaiter", "wait_coroutine", "run_sync", "BackgroundLoop"]
+
+
+class SyncBodyReader:
+    aread: Callable[[int], Awaitable[bytes]]
+    loop: asyncio.AbstractEventLoop
+    def __init__(self, read: Callable[[int], Awaitable[bytes]], loop: asyncio.AbstractEventLoop) -> None: ...
+    def read(self, size: int = -1) -> bytes: ...
+
+
+class AsgiBodyReader:
+    receive: Callable[[], Awaitable[Dict]]
+    buffer: bytes
+    more_body: bool
+    def __init__(self, receive: Callable[[], Awaitable[Dict]]) -> None: ...
+    async def read(self, size: int = -1) -> bytes: ...
+
+
+def aiohttp_environ(request: Any, script_name: str = '') -> Dict: ...
+
+
+def asgi_environ(scope: Dict) -> Dict: ...
+
+
+def aiter_body(body: Iterable[bytes], executor: Optional[Executor] = None) -> AsyncIterator[bytes]: ...
+
+
+async def aclose_body(body: Iterable[bytes], executor: Optional[Executor] = None) -> None: ...
+
+
+class LoopWaiter:
+    loop: asyncio.AbstractEventLoop
+    tasks: queue.SimpleQueue
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None: ...
+    def wait(self, coro: Awaitable) -> Any: ...
+    async def submit(self, fn: Callable[[], Any]) -> Any: ...
+
+
+def wait_coroutine(ctx: Context, loop: asyncio.AbstractEventLoop, coro: Awaitable) -> Any: ...
+
+
+async def run_sync(ctx: Context, fn: Callable[[], Any]) -> Any: ...
+
+
+class BackgroundLoop:
+    loop: asyncio.AbstractEventLoop
+    thread: threading.Thread
+    def __init__(self) -> None: ...
+    def run(self, coro: Awaitable) -> Any: ...
@@ -2,18 +2,32 @@
 Web application
 (from lessweb)
 """
-from typing import List, Any, Callable
+from concurrent.futures import Executor
+import socket
+from typing import List, Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Sequence, Tuple
 
 from lessweb.context import Context
+from lessweb.model import BindingPlan
 from lessweb.bridge import JsonBridgeFunc
 from lessweb.pluginproto import PluginProto
+from lessweb.router import Router
+from lessweb.container import Container, Scope
+from lessweb.compress import Compressor
+from lessweb.cache import ResponseCache
+from lessweb.coalesce import SingleFlight
+from lessweb.static import StaticAssets
+from lessweb.limiter import AIMDLimit, ConcurrencyLimiter
+from lessweb.background import BackgroundTasks
 
 
 __all__ = [
-    "Interceptor", "Mapping", "interceptor", "Application",
+    "Interceptor", "Mapping", "Pipeline", "interceptor", "Application", "route_options",
 ]
 
 
+route_options: tuple
+
+
 class Interceptor:
     pattern: str
     method: str
@@ -27,43 +41,120 @@ class Mapping:
     dealer: Callable
     doc: str
     patternobj: Any
-    def __init__(self, pattern, method, dealer, doc, patternobj) -> None: ...
+    options: Dict[str, Any]
+    pipeline: Optional[Pipeline]
+    def __init__(self, pattern, method, dealer, doc, patternobj, options=None) -> None: ...
 
 
 def build_controller(dealer): ...
 
 
+def wrap_controller(dealer, controller): ...
+
+
+async def prepare_services(ctx: Context, service_types: List[type]) -> None: ...
+
+
+async def bind_async(ctx: Context, plan: BindingPlan) -> Tuple[List, Dict[str, Any]]: ...
+
+
+def build_async_controller(dealer): ...
+
+
+def wrap_async_controller(dealer, controller): ...
+
+
 def interceptor(dealer): ...
 
 
+class Pipeline:
+    dealer: Callable
+    interceptors: List[Interceptor]
+    checks: List[int]
+    is_async: bool
+    chains: Dict[tuple, Callable]
+    def __init__(self, mapping: Mapping, interceptors: List[Interceptor], container: Optional[Container] = None) -> None: ...
+    def _build(self, hits: tuple) -> Callable: ...
+    def controller(self, ctx: Context) -> Callable: ...
+
+
 class Application(object):
     mapping: List[Mapping]
+    router: Router
     interceptors: List[Interceptor]
     response_bridges: List[Callable]
     response_encoder: Any
     encoding: str
     plugins: List[PluginProto]
-    def __init__(self, encoding:str='utf-8') -> None: ...
+    container: Container
+    max_body_size: Optional[int]
+    json_chunk_size: int
+    compressor: Optional[Compressor]
+    response_cache: ResponseCache
+    single_flight: SingleFlight
+    static_assets: List[StaticAssets]
+    limiter: Optional[ConcurrencyLimiter]
+    request_timeout: Optional[float]
+    timeout_header: Optional[str]
+    max_workers: Optional[int]
+    executor: Executor
+    background: BackgroundTasks
+    def __init__(self, encoding:str='utf-8', max_body_size:Optional[int]=None, max_workers:Optional[int]=None) -> None: ...
+    def _match(self, ctx: Context) -> Callable[[Context], Any]: ...
+    def _limiter_of(self, ctx: Context) -> Optional[ConcurrencyLimiter]: ...
+    @staticmethod
+    def _status_code(ctx: Context) -> int: ...
     def _handle_with_dealers(self, ctx: Context): ...
+    def _error_response(self, ctx: Context, e: Exception) -> Any: ...
+    def _internal_error(self, ctx: Context, e: Exception) -> str: ...
+    def _check_dealer(self, dealer: Callable): ...
     def add_interceptor(self, pattern: str, method: str, dealer: Callable): ...
+    def add_cache(self, pattern: str, ttl: float, key: Optional[Callable[[Context], Hashable]] = None,
+                  method: str = 'GET'): ...
+    def add_coalescing(self, pattern: str, params: Optional[Sequence[str]] = None, headers: Sequence[str] = (),
+                       method: str = 'GET', wait_timeout: float = ...): ...
+    def add_static(self, root: str = ..., prefix: str = ...) -> StaticAssets: ...
+    def static_url(self, name: str) -> str: ...
     def add_json_bridge(self, bridge_func: JsonBridgeFunc): ...
-    def add_mapping(self, pattern: str, method: str, dealer: Callable): ...
+    def add_mapping(self, pattern: str, method: str, dealer: Callable, **options): ...
     def add_connect_interceptor(self, pattern: str, dealer: Callable): ...
-    def add_connect_mapping(self, pattern: str, dealer: Callable): ...
+    def add_connect_mapping(self, pattern: str, dealer: Callable, **options): ...
     def add_delete_interceptor(self, pattern: str, dealer: Callable): ...
-    def add_delete_mapping(self, pattern: str, dealer: Callable): ...
+    def add_delete_mapping(self, pattern: str, dealer: Callable, **options): ...
     def add_get_interceptor(self, pattern: str, dealer: Callable): ...
-    def add_get_mapping(self, pattern: str, dealer: Callable): ...
+    def add_get_mapping(self, pattern: str, dealer: Callable, **options): ...
     def add_head_interceptor(self, pattern: str, dealer: Callable): ...
-    def add_head_mapping(self, pattern: str, dealer: Callable): ...
+    def add_head_mapping(self, pattern: str, dealer: Callable, **options): ...
     def add_options_interceptor(self, pattern: str, dealer: Callable): ...
-    def add_options_mapping(self, pattern: str, dealer: Callable): ...
+    def add_options_mapping(self, pattern: str, dealer: Callable, **options): ...
     def add_patch_interceptor(self, pattern: str, dealer: Callable): ...
-    def add_patch_mapping(self, pattern: str, dealer: Callable): ...
+    def add_patch_mapping(self, pattern: str, dealer: Callable, **options): ...
     def add_post_interceptor(self, pattern: str, dealer: Callable): ...
-    def add_post_mapping(self, pattern: str, dealer: Callable): ...
+    def add_post_mapping(self, pattern: str, dealer: Callable, **options): ...
     def add_put_interceptor(self, pattern: str, dealer: Callable): ...
-    def add_put_mapping(self, pattern: str, dealer: Callable): ...
+    def add_put_mapping(self, pattern: str, dealer: Callable, **options): ...
+    def add_service(self, service_type: type, scope: Scope = ...,
+                    factory: Optional[Callable[[Context], Any]] = None): ...
+    def enable_compression(self, min_size: int = ..., mimetypes: Optional[Sequence[str]] = None, level: int = 6): ...
+    def enable_load_shedding(self, limit: int, max_queue: int = 0, max_queue_time: float = 1.0,
+                             adaptive: Optional[AIMDLimit] = None, retry_after: int = 1): ...
     def add_plugin(self, plugin: PluginProto): ...
+    def post_fork(self): ...
+    def _render(self, ctx: Context, resp: Any) -> Tuple[Iterable[bytes], bool]: ...
+    def _respond(self, ctx: Context, resp: Any) -> Tuple[str, List[Tuple[str, str]], Iterable[bytes]]: ...
+    def _call(self, ctx: Context, controller: Callable[[Context], Any]) -> Any: ...
+    async def _await(self, ctx: Context, resp: Any) -> Any: ...
+    def _run_deferred(self, ctx: Context) -> None: ...
+    async def _arun_deferred(self, ctx: Context) -> None: ...
+    async def handle_async(self, ctx: Context, read: Callable[[int], Awaitable[bytes]]) \
+            -> Tuple[str, List[Tuple[str, str]], Iterable[bytes]]: ...
+    async def _dispatch_async(self, ctx: Context, controller: Callable[[Context], Any],
+                              read: Callable[[int], Awaitable[bytes]]) \
+            -> Tuple[str, List[Tuple[str, str]], Iterable[bytes]]: ...
+    def aiohttp_handler(self, homepath: str = ''): ...
+    def asgi(self): ...
     def wsgifunc(self, *middleware): ...
-    def run(self, wsgifunc=None, port:int=8080, homepath:str='', staticpath:str='static'): ...
+    def run(self, wsgifunc=None, port:int=8080, homepath:str='', staticpath:Optional[str]='static', workers:int=1,
+            engine:str='aiohttp', native:bool=False): ...
+    def _prefork(self, port: int, workers: int, serve: Callable[[socket.socket], None]) -> None: ...
+    def _run_native(self, port: int, homepath: str, staticpath: Optional[str], workers: int) -> None: ...
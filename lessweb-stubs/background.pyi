@@ -0,0 +1,37 @@
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+
+__all__ = ["DRAIN_TIMEOUT", "BackgroundTasks", "AfterBody"]
+
+
+DRAIN_TIMEOUT: float
+
+
+class BackgroundTasks:
+    workers: int
+    max_queue: int
+    queue: queue.Queue
+    threads: List[threading.Thread]
+    lock: threading.Lock
+    closed: bool
+    submitted: int
+    completed: int
+    failed: int
+    rejected: int
+    def __init__(self, workers: int = 2, max_queue: int = 1024) -> None: ...
+    def _start(self) -> None: ...
+    def submit(self, task: Callable[[], Any]) -> bool: ...
+    def run(self, task: Callable[[], Any]) -> None: ...
+    def _work(self) -> None: ...
+    def stats(self) -> Dict[str, int]: ...
+    def drain(self, timeout: Optional[float] = None) -> bool: ...
+
+
+class AfterBody:
+    body: Iterable[bytes]
+    callback: Callable[[], Any]
+    def __init__(self, body: Iterable[bytes], callback: Callable[[], Any]) -> None: ...
+    def __iter__(self) -> Iterator[bytes]: ...
+    def close(self) -> None: ...
@@ -1,5 +1,6 @@
 from datetime import datetime as Datetime
-from typing import Type, List, Callable, Union, Dict, Any
+from typing import Type, List, Callable, Union, Dict, Any, Optional, Iterator
+import mmap
 
 
 __all__ = ["uint", "Jsonizable", "ParamStr", "MultipartFile", "JsonBridgeFunc"]
@@ -13,8 +14,21 @@ class ParamStr(str): ...
 
 class MultipartFile:
     filename: str
-    value: bytes
-    def __init__(self, upfile): ...
+    content_type: str
+    file: Any
+    def __init__(self, upfile=None, *, filename: str = ..., file=None, content_type: str = ...): ...
+    @property
+    def value(self) -> bytes: ...
+    @property
+    def size(self) -> int: ...
+    def read(self, size: int = ...) -> bytes: ...
+    def seek(self, offset: int, whence: int = ...) -> int: ...
+    def chunks(self, chunk_size: int = ...) -> Iterator[bytes]: ...
+    def digest(self, name: str = ...) -> str: ...
+    def save_to(self, path: str) -> None: ...
+    def fileno(self) -> int: ...
+    def mmap(self) -> mmap.mmap: ...
+    def close(self) -> None: ...
     def __str__(self) -> str: ...
 
 
@@ -22,4 +36,5 @@ JsonBridgeFunc = Callable[[Any], Jsonizable]
 
 
 def default_response_bridge(obj: Any) -> Jsonizable: ...
+def model_dumper(obj: Any) -> Optional[Callable[[Any], Any]]: ...
 def make_response_encoder(bridge_funcs: List[JsonBridgeFunc]): ...
@@ -0,0 +1,42 @@
+from collections import OrderedDict
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union
+
+from lessweb.context import Context
+from lessweb.webapi import HttpStatus, ResponseStatus
+
+
+__all__ = ["CACHE_MAX_BYTES", "CacheEntry", "ResponseCache", "default_cache_key", "cache_interceptor"]
+
+
+CACHE_MAX_BYTES: int
+
+
+class CacheEntry:
+    body: bytes
+    status: Union[HttpStatus, ResponseStatus]
+    headers: List[Tuple[str, str]]
+    expires: float
+    size: int
+    def __init__(self, body: bytes, status: Union[HttpStatus, ResponseStatus], headers: List[Tuple[str, str]],
+                 expires: float) -> None: ...
+
+
+class ResponseCache:
+    max_bytes: int
+    size: int
+    entries: OrderedDict[Hashable, CacheEntry]
+    inflight: Dict[Hashable, Event]
+    lock: Lock
+    def __init__(self, max_bytes: int = ...) -> None: ...
+    def get(self, key: Hashable) -> Optional[CacheEntry]: ...
+    def put(self, key: Hashable, entry: CacheEntry) -> None: ...
+    def _remove(self, key: Hashable) -> None: ...
+    def clear(self) -> None: ...
+    def begin(self, key: Hashable) -> Optional[Event]: ...
+    def end(self, key: Hashable) -> None: ...
+
+
+def default_cache_key(ctx: Context) -> Hashable: ...
+def cache_interceptor(ttl: float, key: Optional[Callable[[Context], Hashable]] = None,
+                      wait_timeout: float = ...) -> Callable[[Context], Any]: ...
@@ -0,0 +1,39 @@
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, Union
+
+from lessweb.context import Context
+from lessweb.webapi import HttpStatus, ResponseStatus
+
+
+__all__ = ["COALESCE_WAIT_TIMEOUT", "Flight", "SingleFlight", "coalesce_key", "error_factory", "coalesce_interceptor"]
+
+
+COALESCE_WAIT_TIMEOUT: float
+
+
+class Flight:
+    event: Event
+    shared: bool
+    body: bytes
+    status: Union[HttpStatus, ResponseStatus]
+    headers: List[Tuple[str, str]]
+    make_error: Optional[Callable[[], Exception]]
+    followers: int
+    def __init__(self) -> None: ...
+
+
+class SingleFlight:
+    flights: Dict[Hashable, Flight]
+    lock: Lock
+    leaders: int
+    coalesced: int
+    def __init__(self) -> None: ...
+    def begin(self, key: Hashable) -> Tuple[Flight, bool]: ...
+    def end(self, key: Hashable, flight: Flight) -> None: ...
+    def stats(self) -> Dict[str, int]: ...
+
+
+def coalesce_key(ctx: Context, params: Optional[Sequence[str]] = None, headers: Sequence[str] = ()) -> Hashable: ...
+def error_factory(e: Exception) -> Optional[Callable[[], Exception]]: ...
+def coalesce_interceptor(params: Optional[Sequence[str]] = None, headers: Sequence[str] = (),
+                         wait_timeout: float = ...) -> Callable[[Context], Any]: ...
@@ -0,0 +1,27 @@
+from typing import FrozenSet, Iterable, Iterator, Optional, Sequence, Tuple
+
+from lessweb.context import Context
+
+
+__all__ = ["COMPRESS_MIN_SIZE", "compressible_mimetypes", "compressed_mimetypes", "accept_encoding",
+           "compress_stream", "Compressor"]
+
+
+COMPRESS_MIN_SIZE: int
+
+compressible_mimetypes: Tuple[str, ...]
+
+compressed_mimetypes: FrozenSet[str]
+
+
+def accept_encoding(header: str) -> Optional[str]: ...
+def compress_stream(chunks: Iterable[bytes], coding: str, level: int = ...) -> Iterator[bytes]: ...
+
+
+class Compressor:
+    min_size: int
+    mimetypes: Tuple[str, ...]
+    level: int
+    def __init__(self, min_size: int = ..., mimetypes: Optional[Sequence[str]] = None, level: int = ...) -> None: ...
+    def is_compressible(self, content_type: str) -> bool: ...
+    def apply(self, ctx: Context, chunks: Iterable[bytes], streaming: bool) -> Iterable[bytes]: ...
@@ -0,0 +1,46 @@
+from enum import Enum
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from lessweb.context import Context
+
+
+__all__ = ["Scope", "ServicePlan", "Container"]
+
+
+class Scope(Enum):
+    singleton: int = ...
+    request: int = ...
+    transient: int = ...
+
+
+class ServicePlan:
+    service_type: Type
+    scope: Scope
+    injections: List[Tuple[str, Callable[[Context], Any]]]
+    factory: Optional[Callable[[Context], Any]]
+    async_factory: bool
+    async_deps: List[ServicePlan]
+    is_async: bool
+    instance: Any
+    lock: Lock
+    get: Callable[[Context], Any]
+    def __init__(self, service_type: Type, scope: Scope, injections: List[Tuple[str, Callable[[Context], Any]]],
+                 factory: Optional[Callable[[Context], Any]] = None,
+                 async_deps: Optional[List[ServicePlan]] = None) -> None: ...
+    def create(self, ctx: Context, service_obj: Any = None) -> Any: ...
+    async def prepare(self, ctx: Context) -> None: ...
+    async def acreate(self, ctx: Context) -> Any: ...
+    async def aget(self, ctx: Context) -> Any: ...
+
+
+class Container:
+    default_scope: Scope
+    scopes: Dict[Type, Scope]
+    factories: Dict[Type, Callable[[Context], Any]]
+    plans: Dict[Type, ServicePlan]
+    def __init__(self, default_scope: Scope = ...) -> None: ...
+    def register(self, service_type: Type, scope: Scope, factory: Optional[Callable[[Context], Any]] = None) -> None: ...
+    def plan(self, service_type: Type, _path: Tuple[Type, ...] = ...) -> ServicePlan: ...
+    def fetch(self, ctx: Context, service_type: Type) -> Any: ...
+    async def afetch(self, ctx: Context, service_type: Type) -> Any: ...
@@ -1,4 +1,5 @@
-from typing import Any, Optional, Dict, List, Union, TYPE_CHECKING
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Dict, Iterator, List, Union, TYPE_CHECKING
+from datetime import datetime
 from requests.structures import CaseInsensitiveDict
 
 from lessweb.webapi import Cookie, HttpStatus, ResponseStatus, ParamInput
@@ -8,14 +9,21 @@ from lessweb.bridge import Jsonizable, ParamStr, MultipartFile
 __all__ = ["Request", "Response", "Context"]
 
 
+CHUNK_SIZE: int
+
+
+def read_chunks(fp, length: Optional[int], chunk_size: int = ...) -> Iterator[bytes]: ...
+
+
 if TYPE_CHECKING:
-    from lessweb.application import Application
+    from lessweb.application import Application, Mapping
 
 
 class Request:
     _cookies: Dict[str, str]
     _aliases: Dict[str, str]
     _params: Dict[str, Union[ParamStr, Jsonizable, None]]
+    _body_loaded: bool
     encoding: str
     environ: Dict
     env: Dict
@@ -33,8 +41,20 @@ class Request:
     json_input: Optional[Dict]
     param_input: ParamInput
     file_input: Dict[str, List[MultipartFile]]
+    upload_spool_size: int
+    max_body_size: Optional[int]
+    aread: Optional[Callable[[int], Awaitable[bytes]]]
     def __init__(self, encoding: str) -> None: ...
     def load(self, env) -> None: ...
+    def body_length(self) -> Optional[int]: ...
+    def check_body_size(self) -> None: ...
+    def body_stream(self, chunk_size: int = ...) -> Iterator[bytes]: ...
+    def _read_body(self, chunk_size: int = ...) -> Iterator[bytes]: ...
+    def load_body(self) -> None: ...
+    def body_pending(self) -> bool: ...
+    async def aload_body(self) -> None: ...
+    def abody_stream(self, chunk_size: int = ...) -> AsyncIterator[bytes]: ...
+    async def _aread_body(self, chunk_size: int = ...) -> AsyncIterator[bytes]: ...
     def set_alias(self, realname, queryname) -> None: ...
     def get_content_type(self) -> str: ...
     def is_json(self) -> bool: ...
@@ -48,6 +68,7 @@ class Request:
     def get_auth_bearer(self) -> Optional[str]: ...
     def get_input(self, key: str) -> Optional[Union[ParamStr, Jsonizable]]: ...
     def get_uploaded_files(self, key: str) -> List[MultipartFile]: ...
+    def is_fresh(self, etag: Optional[str] = None, last_modified: Optional[datetime] = None) -> bool: ...
 
 
 class Response:
@@ -71,6 +92,8 @@ class Response:
     def send_allow_methods(self, methods: List[str]) -> None: ...
     def send_redirect(self, location: str) -> None: ...
     def send_content_type(self, mimekey='html', encoding: str='') -> None: ...
+    def send_etag(self, etag: str, weak: bool = False) -> str: ...
+    def send_last_modified(self, last_modified: datetime) -> None: ...
 
 
 class Context(object):
@@ -79,6 +102,14 @@ class Context(object):
     request: Request
     response: Response
     box: Dict
+    mapping: Optional[Mapping]
+    deadline: Optional[float]
+    deferred: List[Callable[[], Any]]
     def __init__(self, app: 'Application') -> None: ...
     def __call__(self) -> Any: ...
+    def defer(self, fn: Callable, *args, **kwargs) -> None: ...
+    def remaining(self) -> Optional[float]: ...
+    def check_deadline(self) -> None: ...
+    def check_not_modified(self, etag: Optional[str] = None, last_modified: Optional[datetime] = None,
+                           weak: bool = False) -> None: ...
 
@@ -0,0 +1,31 @@
+import os
+from typing import BinaryIO, Dict, Iterable, Iterator, Optional, Tuple, Union
+
+from lessweb.context import Context
+
+
+__all__ = ["FILE_CHUNK_SIZE", "parse_range", "FileResponse"]
+
+
+FILE_CHUNK_SIZE: int
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]: ...
+
+
+class FileResponse:
+    file: Union[str, os.PathLike, BinaryIO]
+    content_type: Optional[str]
+    filename: Optional[str]
+    chunk_size: int
+    fp: Optional[BinaryIO]
+    offset: int
+    length: int
+    size: int
+    def __init__(self, file: Union[str, os.PathLike, BinaryIO], content_type: Optional[str] = None,
+                 filename: Optional[str] = None, chunk_size: int = ...) -> None: ...
+    def _guess_content_type(self) -> str: ...
+    def prepare(self, ctx: Context) -> None: ...
+    def wsgi_body(self, env: Dict) -> Iterable[bytes]: ...
+    def __iter__(self) -> Iterator[bytes]: ...
+    def close(self) -> None: ...
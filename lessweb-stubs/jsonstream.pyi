@@ -0,0 +1,13 @@
+import json
+from typing import Any, AsyncIterator, Iterable, Iterator
+
+
+__all__ = ["JSON_CHUNK_SIZE", "iter_json_array", "aiter_json_array", "iter_json_chunks"]
+
+
+JSON_CHUNK_SIZE: int
+
+
+def iter_json_array(chunks: Iterable[bytes], encoding: str = ...) -> Iterator[Any]: ...
+def aiter_json_array(chunks: AsyncIterator[bytes], encoding: str = ...) -> AsyncIterator[Any]: ...
+def iter_json_chunks(obj: Any, encoder: json.JSONEncoder, chunk_size: int = ...) -> Iterator[str]: ...
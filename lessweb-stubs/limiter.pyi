@@ -0,0 +1,43 @@
+import asyncio
+from threading import Event, Lock
+from typing import Any, Deque, Optional
+
+
+__all__ = ["AIMDLimit", "ConcurrencyLimiter"]
+
+
+class AIMDLimit:
+    target_latency: float
+    min_limit: int
+    max_limit: int
+    backoff: float
+    def __init__(self, target_latency: float, min_limit: int = 1, max_limit: int = 1000,
+                 backoff: float = 0.9) -> None: ...
+    def update(self, limit: float, latency: float, ok: bool) -> float: ...
+
+
+class _Waiter:
+    granted: bool
+    loop: Optional[asyncio.AbstractEventLoop]
+    event: Optional[Event]
+    future: Any
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None: ...
+    def grant(self) -> None: ...
+
+
+class ConcurrencyLimiter:
+    limit: float
+    max_queue: int
+    max_queue_time: float
+    adaptive: Optional[AIMDLimit]
+    retry_after: int
+    inflight: int
+    waiters: Deque[_Waiter]
+    lock: Lock
+    def __init__(self, limit: int, max_queue: int = 0, max_queue_time: float = 1.0,
+                 adaptive: Optional[AIMDLimit] = None, retry_after: int = 1) -> None: ...
+    def _try_acquire(self, waiter_loop: Any) -> Optional[_Waiter]: ...
+    def _give_up(self, waiter: _Waiter) -> bool: ...
+    def acquire(self) -> None: ...
+    async def aacquire(self) -> None: ...
+    def release(self, latency: Optional[float] = None, ok: bool = True) -> None: ...
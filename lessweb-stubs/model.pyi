@@ -3,11 +3,28 @@ from typing import Callable, Type, Dict, Any, List, Tuple
 from lessweb.context import Context
 
 
-__all__ = ['request_bridge']
+__all__ = ['request_bridge', 'model_loader', 'model_fetcher', 'BindingPlan', 'binding_plan']
 
 
+def register_service_type(cls: Type) -> None: ...
 def model_or_service(cls: Type) -> int: ...
 def fetch_service(ctx: Context, service_type: Type) -> Any: ...
+async def afetch_service(ctx: Context, service_type: Type) -> Any: ...
+def model_loader(target_type: Type) -> Callable[[Any], Any]: ...
 def request_bridge(inputval: Any, target_type: Type) -> Any: ...
+def model_fetcher(target_type: Type) -> Callable[[Context], Any]: ...
 def fetch_model(ctx: Context, target_type: Type) -> Any: ...
+def make_filler(realname: str, realtype: Type, has_default: bool, positional_only: bool) -> Callable[[Context], Any]: ...
+
+
+class BindingPlan:
+    arg_fillers: List[Callable[[Context], Any]]
+    kwarg_fillers: List[Tuple[str, Callable[[Context], Any]]]
+    service_types: List[Type]
+    reads_body: bool
+    def __init__(self, fn: Callable) -> None: ...
+    def bind(self, ctx: Context) -> Tuple[List, Dict[str, Any]]: ...
+
+
+def binding_plan(fn: Callable) -> BindingPlan: ...
 def fetch_param(ctx: Context, fn: Callable) -> Tuple[List, Dict[str, Any]]: ...
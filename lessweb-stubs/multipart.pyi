@@ -0,0 +1,16 @@
+from typing import Dict, Iterable, List, Optional
+
+from lessweb.bridge import ParamStr, MultipartFile
+
+
+__all__ = ["SPOOL_SIZE", "MAX_HEADER_SIZE", "multipart_boundary", "parse_multipart"]
+
+
+SPOOL_SIZE: int
+MAX_HEADER_SIZE: int
+
+
+def multipart_boundary(content_type: str) -> Optional[bytes]: ...
+def parse_multipart(chunks: Iterable[bytes], boundary: bytes, encoding: str,
+                    form_input: Dict[str, List[ParamStr]], file_input: Dict[str, List[MultipartFile]],
+                    spool_size: int = ...) -> None: ...
@@ -20,6 +20,9 @@ class DbPlugin:
     patterns: Iterable[str]
     db_session_maker: Any
     db_engine: Any
+    uri: str
+    echo: bool
+    autoflush: bool
     autocommit: bool
     def __init__(self,
                  uri: str,
@@ -27,9 +30,12 @@ class DbPlugin:
                  autoflush: bool=True,
                  autocommit: bool=False,
                  patterns: Iterable[str]=('.*',)): ...
+    def _connect(self) -> None: ...
     def processor(self, ctx: Context) -> Any: ...
+    def _set_statement_timeout(self, db: Session, remaining: float) -> bool: ...
     def init_app(self, app: Application) -> None: ...
     def teardown(self, exception: Exception) -> None: ...
+    def post_fork(self) -> None: ...
     @contextmanager
     def make_session(self) -> Iterator[Session]: ...
 
@@ -1,4 +1,4 @@
-from typing import Iterable, Any
+from typing import Iterable, Any, Dict, Optional
 from enum import Enum
 from redis import Redis, ConnectionPool
 
@@ -6,20 +6,27 @@ from lessweb.context import Context
 from lessweb.application import Application
 
 
-__all__ = ["RedisPlugin", "RedisServ"]
+__all__ = ["DeadlineRedis", "RedisPlugin", "RedisServ"]
 
 
 class RedisKey(Enum):
     session: int = ...
 
 
+class DeadlineRedis(Redis):
+    ctx: Optional[Context]
+    def parse_response(self, connection, command_name, **options) -> Any: ...
+
+
 class RedisPlugin:
     redis_pool: ConnectionPool
+    redis_options: Dict[str, Any]
     patterns: Iterable[str]
     def __init__(self, host: str, port:int=..., db:int=..., password: str=..., patterns: Iterable[str]=...) -> None: ...
     def processor(self, ctx: Context) -> Any: ...
     def init_app(self, app: Application) -> None: ...
     def teardown(self, exception: Exception) -> None: ...
+    def post_fork(self) -> None: ...
 
 
 class RedisServ:
@@ -8,3 +8,4 @@ __all__ = ["PluginProto"]
 class PluginProto(Protocol):
     def init_app(self, app: Any) -> None: ...
     def teardown(self, exception: Exception) -> None: ...
+    def post_fork(self) -> None: ...
@@ -0,0 +1,21 @@
+import socket
+from typing import Callable, Dict, Optional
+
+
+__all__ = ["listen_socket", "Supervisor"]
+
+
+def listen_socket(host: str, port: int, reuse_port: bool = False, backlog: int = 1024) -> socket.socket: ...
+
+
+class Supervisor:
+    worker: Callable[[int], None]
+    workers: int
+    restart_delay: float
+    children: Dict[int, int]
+    started: Dict[int, float]
+    stopping: bool
+    def __init__(self, worker: Callable[[int], None], workers: int, restart_delay: float = 1.0) -> None: ...
+    def spawn(self, index: int) -> int: ...
+    def stop(self, signum: int = ..., frame: Optional[object] = None) -> None: ...
+    def run(self) -> None: ...
@@ -0,0 +1,14 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+
+__all__ = ["split_pattern", "Router"]
+
+
+def split_pattern(pattern: str) -> Optional[List[Tuple[bool, str]]]: ...
+
+
+class Router:
+    routes: List[Any]
+    def __init__(self) -> None: ...
+    def add(self, route: Any) -> None: ...
+    def lookup(self, path: str, method: str) -> Tuple[Any, Dict[str, Any]]: ...
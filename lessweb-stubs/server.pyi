@@ -0,0 +1,89 @@
+import asyncio
+import socket
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from lessweb.webapi import HttpError
+
+
+__all__ = ["MAX_HEAD_SIZE", "KEEPALIVE_TIMEOUT", "READ_TIMEOUT", "DISCARD_LIMIT", "BadRequest", "MalformedBodyError", "parse_head",
+           "BodyReader", "HttpProtocol", "serve", "run_server"]
+
+
+MAX_HEAD_SIZE: int
+KEEPALIVE_TIMEOUT: float
+READ_TIMEOUT: float
+DISCARD_LIMIT: int
+
+
+class BadRequest(Exception):
+    status: str
+    def __init__(self, status: str = ...) -> None: ...
+
+
+class MalformedBodyError(HttpError):
+    def __init__(self) -> None: ...
+
+
+def _date_header() -> bytes: ...
+def parse_head(head: bytes) -> Tuple[str, str, str, List[Tuple[str, str]]]: ...
+
+
+class BodyReader:
+    protocol: HttpProtocol
+    length: Optional[int]
+    chunked: bool
+    expect: bool
+    done: bool
+    broken: bool
+    def __init__(self, protocol: HttpProtocol, length: Optional[int], chunked: bool, expect: bool) -> None: ...
+    async def _chunk_size(self) -> int: ...
+    async def read(self, size: int = -1) -> bytes: ...
+    async def _read(self, size: int) -> bytes: ...
+    async def discard(self) -> bool: ...
+
+
+class HttpProtocol(asyncio.Protocol):
+    app: Any
+    homepath: str
+    keepalive_timeout: float
+    read_timeout: float
+    idle: bool
+    transport: Optional[asyncio.Transport]
+    buffer: bytearray
+    eof: bool
+    reading_paused: bool
+    waiter: Optional[asyncio.Future]
+    drainer: Optional[asyncio.Future]
+    writing_paused: bool
+    env_base: Dict
+    task: Optional[asyncio.Task]
+    def __init__(self, app: Any, homepath: str = '', keepalive_timeout: float = ...,
+                 read_timeout: float = ...) -> None: ...
+    def connection_made(self, transport: asyncio.BaseTransport) -> None: ...
+    def data_received(self, data: bytes) -> None: ...
+    def eof_received(self) -> bool: ...
+    def connection_lost(self, exc: Optional[Exception]) -> None: ...
+    def pause_writing(self) -> None: ...
+    def resume_writing(self) -> None: ...
+    def _wake(self) -> None: ...
+    async def _fill(self) -> bool: ...
+    def _consume(self, size: int) -> bytes: ...
+    async def read_some(self, size: int) -> bytes: ...
+    async def read_line(self, limit: int) -> Optional[bytes]: ...
+    async def _read_head(self) -> Optional[bytes]: ...
+    async def drain(self) -> None: ...
+    def _environ(self, method: str, target: str, version: str, headers: List[Tuple[str, str]]) -> Dict: ...
+    def _body_reader(self, env: Dict, version: str) -> BodyReader: ...
+    @staticmethod
+    def _keep_alive(env: Dict, version: str) -> bool: ...
+    async def serve(self) -> None: ...
+    def _write_error(self, status: str) -> None: ...
+    async def respond(self, env: Dict, method: str, version: str, reader: BodyReader) -> bool: ...
+    async def _write_stream(self, body: Iterable[bytes], chunked: bool) -> None: ...
+
+
+async def serve(app: Any, host: str = ..., port: int = ..., homepath: str = '',
+                sock: Optional[socket.socket] = None, keepalive_timeout: float = ...,
+                read_timeout: float = ...) -> asyncio.Server: ...
+def run_server(app: Any, host: str = ..., port: int = ..., homepath: str = '',
+               sock: Optional[socket.socket] = None) -> None: ...
@@ -0,0 +1,39 @@
+from typing import Dict, Optional
+
+from lessweb.compress import Compressor
+from lessweb.context import Context
+from lessweb.fileresponse import FileResponse
+
+
+__all__ = ["IMMUTABLE_CACHE_CONTROL", "fingerprint", "StaticAsset", "StaticAssets"]
+
+
+IMMUTABLE_CACHE_CONTROL: str
+
+
+def fingerprint(name: str, digest: str) -> str: ...
+
+
+class StaticAsset:
+    name: str
+    path: str
+    hashed_name: str
+    content_type: str
+    gz_path: Optional[str]
+    def __init__(self, name: str, path: str, hashed_name: str, content_type: str,
+                 gz_path: Optional[str] = None) -> None: ...
+
+
+class StaticAssets:
+    root: str
+    prefix: str
+    compressor: Compressor
+    digest_size: int
+    manifest: Dict[str, StaticAsset]
+    hashed: Dict[str, StaticAsset]
+    def __init__(self, root: str, prefix: str = ..., compressor: Optional[Compressor] = None,
+                 digest_size: int = ...) -> None: ...
+    def build(self) -> None: ...
+    def _build_asset(self, name: str, path: str) -> StaticAsset: ...
+    def url(self, name: str) -> str: ...
+    def serve(self, ctx: Context, asset: str) -> FileResponse: ...
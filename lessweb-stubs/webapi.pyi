@@ -1,6 +1,5 @@
-from typing import Optional, Dict, List, Tuple
-import cgi
-from io import BytesIO
+from typing import Callable, Optional, Dict, Iterable, List, Tuple
+from datetime import datetime
 from http.cookies import Morsel, SimpleCookie, CookieError
 from urllib.parse import parse_qs, unquote
 from enum import Enum
@@ -9,7 +8,9 @@ from .bridge import ParamStr, MultipartFile
 
 
 __all__ = ["mimetypes", "hop_by_hop_headers", "http_methods", "ParamInput", "ResponseStatus", "HttpStatus",
-           "Cookie", "parse_cookie", "BadParamError", "NotFoundError"]
+           "Cookie", "parse_cookie", "http_date", "parse_http_date", "etag_matches", "BadParamError", "NotFoundError",
+           "HttpError", "PayloadTooLargeError", "NotModifiedError", "ServiceUnavailableError",
+           "GatewayTimeoutError"]
 
 
 mimetypes: Dict
@@ -23,9 +24,13 @@ class ParamInput:
     url_input: Dict[str, ParamStr]
     query_input: Dict[str, List[ParamStr]]
     form_input: Dict[str, List[ParamStr]]
+    on_demand: Optional[Callable[[], None]]
     def __init__(self) -> None: ...
     def load_query(self, query: str, encoding: str) -> None: ...
     def load_form(self, body: bytes, env: Dict, encoding: str, file_input: Dict[str, List[MultipartFile]]) -> None: ...
+    def load_form_stream(self, chunks: Iterable[bytes], env: Dict, encoding: str,
+                         file_input: Dict[str, List[MultipartFile]], spool_size: int = ...) -> None: ...
+    def _load_qs(self, qs: str, encoding: str) -> None: ...
     def load_url(self, groupdict: Dict) -> None: ...
 
 
@@ -41,6 +46,7 @@ class HttpStatus(Enum):
     Created: ResponseStatus = ...
     Accepted: ResponseStatus = ...
     NoContent: ResponseStatus = ...
+    PartialContent: ResponseStatus = ...
     MovedPermanently: ResponseStatus = ...
     Found: ResponseStatus = ...
     SeeOther: ResponseStatus = ...
@@ -55,10 +61,14 @@ class HttpStatus(Enum):
     Conflict: ResponseStatus = ...
     Gone: ResponseStatus = ...
     PreconditionFailed: ResponseStatus = ...
+    PayloadTooLarge: ResponseStatus = ...
     UnsupportedMediaType: ResponseStatus = ...
+    RangeNotSatisfiable: ResponseStatus = ...
     UnprocessableEntity: ResponseStatus = ...
     UnavailableForLegalReasons: ResponseStatus = ...
     InternalServerError: ResponseStatus = ...
+    ServiceUnavailable: ResponseStatus = ...
+    GatewayTimeout: ResponseStatus = ...
 
 
 class Cookie:
@@ -77,6 +87,11 @@ class Cookie:
 def parse_cookie(http_cookie: str)->Dict[str, str]: ...
 
 
+def http_date(dt: datetime) -> str: ...
+def parse_http_date(text: str) -> Optional[datetime]: ...
+def etag_matches(if_none_match: str, etag: str) -> bool: ...
+
+
 class BadParamError(Exception):
     param: str
     message: str
@@ -92,5 +107,32 @@ class NotFoundError(Exception):
     def __str__(self) -> str: ...
 
 
+class HttpError(Exception):
+    status: HttpStatus
+    message: str
+    headers: Dict[str, str]
+    def __init__(self, status: HttpStatus, message: str=..., headers: Optional[Dict[str, str]]=None) -> None: ...
+    def __repr__(self) -> str: ...
+    def __str__(self) -> str: ...
+
+
+class PayloadTooLargeError(HttpError):
+    max_size: int
+    def __init__(self, max_size: int) -> None: ...
+
+
+class NotModifiedError(HttpError):
+    def __init__(self) -> None: ...
+
+
+class ServiceUnavailableError(HttpError):
+    retry_after: int
+    def __init__(self, retry_after: int = 1) -> None: ...
+
+
+class GatewayTimeoutError(HttpError):
+    def __init__(self) -> None: ...
+
+
 def header_name_of_wsgi_key(wsgi_key: str) -> str: ...
 def wsgi_key_of_header_name(header_name: str) -> str: ...
\ No newline at end of file
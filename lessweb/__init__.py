@@ -11,10 +11,12 @@ __license__ = "MIT"
 # from . import application, context, model, storage, webapi
 
 from .application import interceptor, Application
+from .container import Scope
 from .context import Context, Request, Response
+from .fileresponse import FileResponse
 from .storage import Storage
 from .bridge import uint, ParamStr, MultipartFile, Jsonizable
-from .webapi import BadParamError, NotFoundError, Cookie, HttpStatus, ResponseStatus
+from .webapi import BadParamError, NotFoundError, HttpError, NotModifiedError, Cookie, HttpStatus, ResponseStatus
 from .utils import _nil, eafp
 from .client import Client
 from .service import Service
@@ -0,0 +1,230 @@
+"""
+asyncio adapters for the native aiohttp/ASGI entry points
+(from lessweb)
+"""
+import asyncio
+from concurrent.futures import Executor
+import queue
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+from urllib.parse import quote
+
+from .context import Context
+
+
+__all__ = ["SyncBodyReader", "AsgiBodyReader", "aiohttp_environ", "asgi_environ", "aiter_body", "aclose_body",
+           "LoopWaiter", "wait_coroutine", "run_sync", "BackgroundLoop"]
+
+
+_WAITERS = '_lessweb_loop_waiters'  # ctx.box中正在等待event loop的LoopWaiter栈
+
+
+class SyncBodyReader:
+    """
+    把async的read(size)包装成同步的wsgi.input，只能在executor线程中使用，
+    在event loop线程中读取会死锁，所以直接报错
+    """
+    def __init__(self, read: Callable[[int], Awaitable[bytes]], loop: asyncio.AbstractEventLoop) -> None:
+        self.aread: Callable[[int], Awaitable[bytes]] = read
+        self.loop: asyncio.AbstractEventLoop = loop
+
+    def read(self, size: int = -1) -> bytes:
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self.loop:
+            raise RuntimeError('Request body cannot be read synchronously on the event loop, '
+                               'await ctx.request.aload_body() or use ctx.request.abody_stream()')
+        return asyncio.run_coroutine_threadsafe(self.aread(size), self.loop).result()  # type: ignore
+
+
+class AsgiBodyReader:
+    """按需从ASGI的receive读取body"""
+    def __init__(self, receive: Callable[[], Awaitable[Dict]]) -> None:
+        self.receive: Callable[[], Awaitable[Dict]] = receive
+        self.buffer: bytes = b''
+        self.more_body: bool = True
+
+    async def read(self, size: int = -1) -> bytes:
+        while self.more_body and (size < 0 or len(self.buffer) < size):
+            message = await self.receive()
+            if message['type'] != 'http.request':  # http.disconnect
+                self.more_body = False
+                break
+            self.buffer += message.get('body', b'')
+            self.more_body = message.get('more_body', False)
+        if size < 0:
+            data, self.buffer = self.buffer, b''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+def _header_environ(env: Dict, headers: Iterable) -> None:
+    for name, value in headers:
+        key = name.upper().replace('-', '_')
+        if key == 'CONTENT_TYPE' or key == 'CONTENT_LENGTH':
+            env[key] = value
+        else:
+            key = 'HTTP_' + key
+            env[key] = env[key] + ',' + value if key in env else value
+
+
+def aiohttp_environ(request: Any, script_name: str = '') -> Dict:
+    """
+    从aiohttp.web.Request构造Request.load需要的environ，不复制body。
+    script_name为挂载的路径前缀，PATH_INFO是去掉前缀之后的部分
+    """
+    path = request.path
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    peername = request.transport.get_extra_info('peername') if request.transport is not None else None
+    env: Dict = {
+        'REQUEST_METHOD': request.method,
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path,
+        'QUERY_STRING': request.query_string,
+        'REQUEST_URI': request.raw_path,
+        'SERVER_PROTOCOL': 'HTTP/%d.%d' % request.version,
+        'REMOTE_ADDR': peername[0] if peername else '0.0.0.0',
+        'wsgi.url_scheme': request.scheme,
+    }
+    _header_environ(env, request.headers.items())
+    return env
+
+
+def asgi_environ(scope: Dict) -> Dict:
+    """从ASGI的http scope构造Request.load需要的environ"""
+    script_name = scope.get('root_path', '')
+    path = scope['path']
+    if script_name and path.startswith(script_name):
+        path = path[len(script_name):]
+    raw_path = scope.get('raw_path')
+    request_uri = raw_path.decode('latin-1') if raw_path else quote(scope['path'])
+    query = scope.get('query_string', b'').decode('latin-1')
+    client = scope.get('client')
+    env: Dict = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'REQUEST_URI': request_uri + ('?' + query if query else ''),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0] if client else '0.0.0.0',
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+    }
+    _header_environ(env, ((k.decode('latin-1'), v.decode('latin-1')) for k, v in scope.get('headers', [])))
+    return env
+
+
+async def aiter_body(body: Iterable[bytes], executor: Optional[Executor] = None) -> AsyncIterator[bytes]:
+    """list直接输出，其他可迭代对象(generator、FileResponse)在executor中迭代，因为它们可能阻塞"""
+    if isinstance(body, list):
+        for chunk in body:
+            yield chunk
+        return
+    loop = asyncio.get_running_loop()
+    iterator = iter(body)
+    end = object()
+    try:
+        while True:
+            chunk = await loop.run_in_executor(executor, next, iterator, end)
+            if chunk is end:
+                break
+            yield chunk  # type: ignore
+    finally:
+        await aclose_body(body, executor)
+
+
+async def aclose_body(body: Iterable[bytes], executor: Optional[Executor] = None) -> None:
+    """按WSGI的约定调用body.close()，例如结束generator、关闭FileResponse的文件"""
+    close = getattr(body, 'close', None)
+    if close is not None:
+        await asyncio.get_running_loop().run_in_executor(executor, close)
+
+
+def _set_result(future: asyncio.Future, value: Any) -> None:
+    if not future.done():
+        future.set_result(value)
+
+
+def _set_exception(future: asyncio.Future, exc: BaseException) -> None:
+    if not future.done():
+        future.set_exception(exc)
+
+
+class LoopWaiter:
+    """
+    executor线程中的同步代码(如同步interceptor的ctx())等待event loop上的coroutine。
+    等待期间这个线程替loop执行run_sync提交的同步函数，所以线程池满了也不会死锁
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self.loop: asyncio.AbstractEventLoop = loop
+        self.tasks: queue.SimpleQueue = queue.SimpleQueue()
+
+    def wait(self, coro: Awaitable) -> Any:
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)  # type: ignore
+        future.add_done_callback(lambda _: self.tasks.put(None))
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                return future.result()
+            fn, result = task
+            try:
+                value = fn()
+            except BaseException as e:
+                self.loop.call_soon_threadsafe(_set_exception, result, e)
+            else:
+                self.loop.call_soon_threadsafe(_set_result, result, value)
+
+    async def submit(self, fn: Callable[[], Any]) -> Any:
+        result = self.loop.create_future()
+        self.tasks.put((fn, result))
+        return await result
+
+
+def wait_coroutine(ctx: Context, loop: asyncio.AbstractEventLoop, coro: Awaitable) -> Any:
+    """在executor线程中阻塞等待loop上的coro"""
+    waiters: List[LoopWaiter] = ctx.box.setdefault(_WAITERS, [])
+    waiters.append(LoopWaiter(loop))
+    try:
+        return waiters[-1].wait(coro)
+    finally:
+        waiters.pop()
+
+
+async def run_sync(ctx: Context, fn: Callable[[], Any]) -> Any:
+    """
+    在ctx.app.executor中执行无参数的同步函数；外层有同步代码正在wait_coroutine时借用它的线程
+    """
+    waiters = ctx.box.get(_WAITERS)
+    if waiters:
+        return await waiters[-1].submit(fn)
+    return await asyncio.get_running_loop().run_in_executor(ctx.app.executor, fn)
+
+
+async def _capture(coro: Awaitable) -> Any:
+    try:
+        return True, await coro
+    except BaseException as e:
+        return False, e
+
+
+class BackgroundLoop:
+    """
+    在daemon线程中一直运行的event loop，WSGI服务器的线程用它执行async def的dealer。
+    每个请求asyncio.run一个新loop的话，async的单例service(连接池等)会在已关闭的loop上被再次使用
+    """
+    def __init__(self) -> None:
+        self.loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        self.thread: threading.Thread = threading.Thread(
+            target=self.loop.run_forever, name='lessweb-loop', daemon=True)
+        self.thread.start()
+
+    def run(self, coro: Awaitable) -> Any:
+        """在调用者线程中阻塞等待coro，CancelledError等BaseException原样抛出"""
+        ok, value = asyncio.run_coroutine_threadsafe(_capture(coro), self.loop).result()
+        if ok:
+            return value
+        raise value
@@ -2,31 +2,65 @@
 Web application
 (from lessweb)
 """
+import asyncio
+from concurrent.futures import Executor, ThreadPoolExecutor
 from datetime import datetime
+import functools
+import hashlib
+import inspect
 import itertools
 import json
 import logging
 import os
 import re
+import socket
+import threading
+import time
 import traceback
 from types import GeneratorType
-from typing import List, Any, Callable, Dict, Optional
+from typing import List, Any, Awaitable, Callable, Dict, Hashable, Iterable, Optional, Sequence, Tuple
 
-from .webapi import BadParamError, NotFoundError, HttpStatus
+from .webapi import BadParamError, NotFoundError, HttpError, HttpStatus, GatewayTimeoutError, parse_http_date
 from .webapi import http_methods
 from .context import Context
-from .model import fetch_param
+from .model import BindingPlan, binding_plan
 from .storage import Storage
 from .utils import eafp, re_standardize, makedir
 from .bridge import make_response_encoder, JsonBridgeFunc
 from .pluginproto import PluginProto
+from .router import Router, split_pattern
+from .container import Container, Scope
+from .jsonstream import JSON_CHUNK_SIZE, iter_json_chunks
+from .compress import COMPRESS_MIN_SIZE, Compressor
+from .cache import ResponseCache, cache_interceptor
+from .coalesce import COALESCE_WAIT_TIMEOUT, SingleFlight, coalesce_interceptor
+from .fileresponse import FileResponse
+from .static import StaticAssets
+from .aio import SyncBodyReader, AsgiBodyReader, aiohttp_environ, asgi_environ, aiter_body
+from .aio import BackgroundLoop, run_sync, wait_coroutine
+from .prefork import Supervisor, listen_socket
+from .limiter import AIMDLimit, ConcurrencyLimiter
+from .background import DRAIN_TIMEOUT, AfterBody, BackgroundTasks
+from .server import run_server
 
 
 __all__ = [
-    "Interceptor", "Mapping", "interceptor", "Application",
+    "Interceptor", "Mapping", "Pipeline", "interceptor", "Application", "route_options",
 ]
 
 
+# add_mapping(..., **options)支持的选项
+route_options = (
+    'max_body_size',  # 覆盖Application.max_body_size
+    'stream_json',  # 为True时，list/dict/generator响应逐个元素编码成JSON并分块输出
+    'json_chunk_size',  # 覆盖Application.json_chunk_size
+    'compress',  # 为False时不压缩这个route的响应
+    'etag',  # 为True时用响应body的hash作为ETag，并处理If-None-Match
+    'limiter',  # ConcurrencyLimiter，覆盖Application.limiter；为None时不限制这个route
+    'timeout',  # 请求的时限(秒)，覆盖Application.request_timeout
+)
+
+
 # Application.interceptors: List[Interceptor]
 class Interceptor:
     """Interceptor to定义拦截器based on path prefix"""
@@ -40,22 +74,26 @@ class Interceptor:
 # Application.mapping: List[Mapping]
 class Mapping:
     """Mapping to定义请求处理者和path的对应关系"""
-    def __init__(self, pattern, method, dealer, doc, patternobj) -> None:
+    def __init__(self, pattern, method, dealer, doc, patternobj, options=None) -> None:
         self.pattern: str = pattern
         self.method: str = method
         self.dealer: Callable = dealer
         self.doc: str = doc
         self.patternobj: Any = patternobj
+        self.options: Dict[str, Any] = options or {}
+        self.pipeline: Optional[Pipeline] = None
 
 
 def build_controller(dealer):
     """
     把接收多个参数的dealer转变成只接收一个参数(ctx)的函数
     """
+    plan = binding_plan(dealer)
+
     def _1_controller(ctx:Context):
         try:
-            args, params = fetch_param(ctx, dealer)
-        except BadParamError:
+            args, params = plan.bind(ctx)
+        except (BadParamError, HttpError):
             raise
         except Exception as e:
             raise BadParamError(message=str(e), param='')
@@ -64,24 +102,162 @@ def build_controller(dealer):
     return _1_controller
 
 
+def wrap_controller(dealer, controller):
+    """
+    用interceptor的dealer包装一个已经只接收ctx的controller
+    """
+    plan = binding_plan(dealer)
+
+    def _1_controller(ctx:Context):
+        ctx.app_stack.append(controller)
+        args, params = plan.bind(ctx)
+        result = dealer(*args, **params)
+        ctx.app_stack.pop()  # 有多次调用ctx()的可能性，比如批量删除
+        return result
+
+    return _1_controller
+
+
+async def prepare_services(ctx: Context, service_types: List[type]) -> None:
+    """在event loop上创建dealer依赖的async service，之后参数绑定时同步取得"""
+    container = ctx.app.container
+    for service_type in service_types:
+        plan = container.plan(service_type)
+        if plan.is_async:
+            await plan.prepare(ctx)
+
+
+async def bind_async(ctx: Context, plan: BindingPlan) -> Tuple[List, Dict[str, Any]]:
+    """
+    参数绑定需要读取还没有读取的body时在executor中绑定，与同步的路径一样按需读取、multipart写临时文件；
+    否则直接在event loop上绑定
+    """
+    if plan.reads_body and ctx.request.body_pending():
+        return await run_sync(ctx, functools.partial(plan.bind, ctx))
+    return plan.bind(ctx)
+
+
+def build_async_controller(dealer):
+    """
+    build_controller的async版本：async def的dealer在event loop上执行，同步的dealer交给executor
+    """
+    plan = binding_plan(dealer)
+    is_async = inspect.iscoroutinefunction(dealer)
+
+    async def _1_controller(ctx:Context):
+        await prepare_services(ctx, plan.service_types)
+        try:
+            args, params = await bind_async(ctx, plan)
+        except (BadParamError, HttpError):
+            raise
+        except Exception as e:
+            raise BadParamError(message=str(e), param='')
+        if is_async:
+            return await dealer(*args, **params)
+        return await run_sync(ctx, functools.partial(dealer, *args, **params))
+
+    return _1_controller
+
+
+def wrap_async_controller(dealer, controller):
+    """
+    wrap_controller的async版本，controller是async的。
+    async def的interceptor用await ctx()；同步的interceptor在executor中执行，ctx()阻塞等待controller
+    """
+    plan = binding_plan(dealer)
+    is_async = inspect.iscoroutinefunction(dealer)
+
+    async def _1_controller(ctx:Context):
+        if is_async:
+            ctx.app_stack.append(controller)
+        else:
+            loop = asyncio.get_running_loop()
+            ctx.app_stack.append(lambda ctx: wait_coroutine(ctx, loop, controller(ctx)))
+        await prepare_services(ctx, plan.service_types)
+        args, params = await bind_async(ctx, plan)
+        if is_async:
+            result = await dealer(*args, **params)
+        else:
+            result = await run_sync(ctx, functools.partial(dealer, *args, **params))
+        ctx.app_stack.pop()
+        return result
+
+    return _1_controller
+
+
 def interceptor(dealer):
     """
     为controller添加interceptor的decorator
     在dealer函数中调用ctx()，就会执行它修饰的controller
     """
     def _1_wrapper(fn):
-        def _1_1_controller(ctx:Context):
-            ctx.app_stack.append(build_controller(fn))
-            args, params = fetch_param(ctx, dealer)
-            result = dealer(*args, **params)
-            ctx.app_stack.pop()  # 有多次调用ctx()的可能性，比如批量删除
-            return result
-
-        return _1_1_controller
+        return wrap_controller(dealer, build_controller(fn))
 
     return _1_wrapper
 
 
+class Pipeline:
+    """
+    Pipeline to预先计算Mapping的interceptor链
+    能在注册时确定是否命中的interceptor直接编进链里，其余的在请求时检查，按命中组合缓存链
+    """
+    def __init__(self, mapping: Mapping, interceptors: List[Interceptor], container: Optional[Container] = None) -> None:
+        static_path = None
+        segments = split_pattern(mapping.pattern)
+        if segments is not None and not any(is_param for is_param, _ in segments):
+            static_path = '/'.join(text for _, text in segments)
+        self.dealer: Callable = mapping.dealer
+        self.interceptors: List[Interceptor] = []
+        self.checks: List[int] = []  # 需要在请求时检查的interceptors下标
+        for itr in interceptors:
+            if itr.method == '*':
+                method_hit: Optional[bool] = True
+            elif mapping.method == '*':
+                method_hit = None
+            else:
+                method_hit = itr.method == mapping.method
+            if static_path is not None:
+                path_hit: Optional[bool] = itr.patternobj.search(static_path) is not None
+            elif itr.patternobj.pattern == '^.*$':
+                path_hit = True
+            else:
+                path_hit = None
+            if method_hit is False or path_hit is False:
+                continue
+            if method_hit is None or path_hit is None:
+                self.checks.append(len(self.interceptors))
+            self.interceptors.append(itr)
+        dealers = [self.dealer] + [itr.dealer for itr in self.interceptors]
+        # 为True时整条链都是async的：async def的部分在event loop上执行，同步的部分交给executor
+        self.is_async: bool = any(inspect.iscoroutinefunction(d) for d in dealers) or \
+            (container is not None and any(container.plan(t).is_async
+                                           for d in dealers for t in binding_plan(d).service_types))
+        self.chains: Dict[tuple, Callable] = {}
+        if not self.checks:
+            self.chains[()] = self._build(())
+
+    def _build(self, hits: tuple) -> Callable:
+        build, wrap = (build_async_controller, wrap_async_controller) if self.is_async else \
+            (build_controller, wrap_controller)
+        f = build(self.dealer)
+        for i, itr in enumerate(self.interceptors):
+            if i in hits or i not in self.checks:
+                f = wrap(itr.dealer, f)
+        return f
+
+    def controller(self, ctx: Context) -> Callable:
+        if not self.checks:
+            return self.chains[()]
+        path, method = ctx.request.path, ctx.request.method
+        hits = tuple(i for i in self.checks
+                     if self.interceptors[i].patternobj.search(path)
+                     and self.interceptors[i].method in (method, '*'))
+        f = self.chains.get(hits)
+        if f is None:
+            f = self.chains[hits] = self._build(hits)
+        return f
+
+
 class Application(object):
     """
     Application to delegate requests based on path.
@@ -93,46 +269,117 @@ class Application(object):
         app.add_mapping('/hello', lambda ctx: 'Hello!')
         app.run(port=8080)
 
+    max_body_size: 请求body的上限(字节)，超过时返回413，None表示不限制
+    max_workers: 执行同步dealer的线程数，None为ThreadPoolExecutor的默认值
     """
-    def __init__(self, encoding:str='utf-8') -> None:
+    def __init__(self, encoding:str='utf-8', max_body_size:Optional[int]=None, max_workers:Optional[int]=None) -> None:
         self.mapping: List[Mapping] = []
+        self.router: Router = Router()
         self.interceptors: List[Interceptor] = []
         self.response_bridges: List[Callable] = []
         self.response_encoder: Any = make_response_encoder([])
         self.encoding: str = encoding
         self.plugins: List[PluginProto] = []
+        self.container: Container = Container()
+        self.max_body_size: Optional[int] = max_body_size
+        self.json_chunk_size: int = JSON_CHUNK_SIZE  # stream_json的route每次输出的大小
+        self.compressor: Optional[Compressor] = None  # 见enable_compression
+        self.response_cache: ResponseCache = ResponseCache()  # add_cache共用的缓存
+        self.single_flight: SingleFlight = SingleFlight()  # add_coalescing共用
+        self.static_assets: List[StaticAssets] = []
+        self.limiter: Optional[ConcurrencyLimiter] = None  # 见enable_load_shedding
+        self.background: BackgroundTasks = BackgroundTasks()  # 执行ctx.defer提交的任务
+        self.request_timeout: Optional[float] = None  # 请求的时限(秒)，超过时响应504，None表示不限时
+        self.timeout_header: Optional[str] = 'X-Request-Timeout'  # 客户端可以用这个header缩短时限(秒)
+        self.max_workers: Optional[int] = max_workers
+        # aiohttp_handler/asgi和async链中执行同步代码的线程池
+        self.executor: Executor = ThreadPoolExecutor(max_workers, thread_name_prefix='lessweb')
+        # wsgifunc中执行async def的dealer，第一次用到时才创建，所以不会在fork之前启动线程
+        self._wsgi_loop: Optional[BackgroundLoop] = None
+        self._wsgi_loop_lock = threading.Lock()
+
+    def _match(self, ctx: Context) -> Callable[[Context], Any]:
+        """找到route并做读取body之前的检查，返回要执行的controller"""
+        mapping, groupdict = self.router.lookup(ctx.request.path, ctx.request.method)
+        ctx.mapping = mapping
+        ctx.request.param_input.load_url(groupdict)
+        ctx.request.max_body_size = mapping.options.get('max_body_size', self.max_body_size)
+        timeout = mapping.options.get('timeout', self.request_timeout)
+        timeout_header = self.timeout_header
+        if timeout_header is not None:
+            header_timeout = eafp(lambda: float(ctx.request.get_header(timeout_header) or ''), None)
+            if header_timeout is not None and header_timeout >= 0 and (timeout is None or header_timeout < timeout):
+                timeout = header_timeout
+        if timeout is not None:
+            ctx.deadline = time.monotonic() + timeout
+        ctx.request.check_body_size()  # 在读取body之前就拒绝
+        return mapping.pipeline.controller(ctx)
+
+    def _limiter_of(self, ctx: Context) -> Optional[ConcurrencyLimiter]:
+        """route的limiter选项覆盖Application.limiter"""
+        if ctx.mapping is None:
+            return self.limiter
+        return ctx.mapping.options.get('limiter', self.limiter)
+
+    @staticmethod
+    def _status_code(ctx: Context) -> int:
+        status_wrap = ctx.response.get_status()
+        return (status_wrap.value if isinstance(status_wrap, HttpStatus) else status_wrap).code
 
     def _handle_with_dealers(self, ctx: Context):
-        def _1_mapping_match():
-            supported_methods = []
-            for mapping in self.mapping:
-                _ = mapping.patternobj.search(ctx.request.path)
-                if _:
-                    if mapping.method == ctx.request.method or mapping.method == '*':
-                        ctx.request.param_input.load_url(_.groupdict())
-                        return mapping.dealer
-                    elif mapping.method != 'OPTIONS':
-                        supported_methods.append(mapping.method)
-            # end: for
-            raise NotFoundError(methods=supported_methods)
-
         try:
-            f = build_controller(_1_mapping_match())
-            if f is None: return ''
-            for itr in self.interceptors:
-                if itr.patternobj.search(ctx.request.path) and (itr.method == ctx.request.method or itr.method == '*'):
-                    f = interceptor(itr.dealer)(f)
-            return f(ctx)
-        except BadParamError as e:
+            controller = self._match(ctx)
+            limiter = self._limiter_of(ctx)
+            if limiter is not None:
+                limiter.acquire()  # 超过限制时在参数绑定和读取body之前就拒绝
+        except (BadParamError, NotFoundError, HttpError) as e:
+            return self._error_response(ctx, e)
+        begin = time.monotonic()
+        ok = False
+        try:
+            resp = self._call(ctx, controller)
+            if inspect.isawaitable(resp):  # async def的dealer，WSGI服务器的线程中没有运行的event loop
+                resp = self._background_loop().run(self._await(ctx, resp))
+            ok = self._status_code(ctx) < 500
+            return resp
+        finally:
+            if limiter is not None:  # CancelledError等BaseException也要归还名额
+                limiter.release(time.monotonic() - begin, ok)
+
+    def _background_loop(self) -> BackgroundLoop:
+        with self._wsgi_loop_lock:
+            if self._wsgi_loop is None:
+                self._wsgi_loop = BackgroundLoop()
+            return self._wsgi_loop
+
+    def _error_response(self, ctx: Context, e: Exception) -> Any:
+        if isinstance(e, BadParamError):
             ctx.response.set_status(HttpStatus.BadRequest)
             return {'message': e.message, 'param': e.param}
-        except NotFoundError as e:
+        elif isinstance(e, NotFoundError):
             if e.methods:
                 ctx.response.send_allow_methods(e.methods)
                 ctx.response.set_status(HttpStatus.MethodNotAllowed)
             else:
                 ctx.response.set_status(HttpStatus.NotFound)
             return repr(e)
+        elif isinstance(e, HttpError):
+            ctx.response.set_status(e.status)
+            for name, value in e.headers.items():
+                ctx.response.set_header(name, value)
+            return e.message
+        return self._internal_error(ctx, e)
+
+    def _internal_error(self, ctx: Context, e: Exception) -> str:
+        logging.exception(e)
+        ctx.response.send_content_type(encoding=self.encoding)
+        ctx.response.set_status(HttpStatus.InternalServerError)
+        return traceback.format_exc()
+
+    def _check_dealer(self, dealer: Callable):
+        """不支持的参数类型和service的循环依赖在注册时就报错"""
+        for service_type in binding_plan(dealer).service_types:
+            self.container.plan(service_type)
 
     def add_interceptor(self, pattern: str, method: str, dealer: Callable):
         """
@@ -143,18 +390,85 @@ class Application(object):
             app.add_interceptor(lambda ctx: ctx() + ' world!')
             app.add_mapping('/hello', 'GET', lambda ctx: 'Hello')
             app.run()
+
+        dealer可以是async def，这时用await ctx()执行后面的interceptor和dealer
         """
         assert isinstance(pattern, str), 'pattern:[{}] should be RegExp str'.format(pattern)
         method = method.upper()
         assert method == '*' or method in http_methods, 'Method:[{}] should be * or one of {}'.format(method, http_methods)
         patternobj = re.compile(re_standardize(pattern))
+        self._check_dealer(dealer)
         self.interceptors.insert(0, Interceptor(pattern, method, dealer, patternobj))
+        for mapping in self.mapping:
+            mapping.pipeline = Pipeline(mapping, self.interceptors, self.container)
+
+    def add_cache(self, pattern: str, ttl: float, key: Optional[Callable[[Context], Hashable]] = None,
+                  method: str = 'GET'):
+        """
+        缓存匹配pattern的响应(编码后的body、status和headers)ttl秒，命中时跳过参数绑定、dealer和JSON编码。
+        key默认为method、path加上url/query/form参数。
+        add_cache之前添加的interceptor在缓存之内，之后添加的interceptor会从ctx()得到bytes。
+        缓存的内存上限见app.response_cache.max_bytes
+
+        Example:
+
+            from lessweb import Application
+            app = Application()
+            app.add_get_mapping('/rank', get_rank)
+            app.add_cache('/rank', ttl=5)
+            app.add_cache('/user/.*', ttl=60, key=lambda ctx: ctx.request.get_cookie('lang'))
+        """
+        self.add_interceptor(pattern, method, cache_interceptor(ttl, key))
+
+    def add_coalescing(self, pattern: str, params: Optional[Sequence[str]] = None, headers: Sequence[str] = (),
+                       method: str = 'GET', wait_timeout: float = COALESCE_WAIT_TIMEOUT):
+        """
+        合并匹配pattern的同时到达的相同请求：只有第一个请求执行dealer，其他请求等待并共享它编码后的body、status和headers。
+        key为method、path、params指定的url/query参数(None表示全部)和headers指定的请求header。
+        与add_cache不同，第一个请求完成后不保留结果。统计见app.single_flight.stats()
+
+        Example:
+
+            from lessweb import Application
+            app = Application()
+            app.add_get_mapping('/report', get_report)
+            app.add_coalescing('/report', params=['day'], headers=['Accept-Language'])
+        """
+        self.add_interceptor(pattern, method, coalesce_interceptor(params, headers, wait_timeout))
+
+    def add_static(self, root: str = 'static', prefix: str = '/static/') -> StaticAssets:
+        """
+        扫描root下的静态文件，生成带内容hash的URL和.gz文件，并添加prefix下的GET/HEAD mapping。
+        带hash的URL以Cache-Control: immutable响应，客户端接受gzip时直接返回.gz文件。
+        文件变化后需要重启(或调用返回值的build方法)
+
+        Example:
+
+            from lessweb import Application
+            app = Application()
+            app.add_static('static', '/static/')
+            app.static_url('js/app.js')  # => '/static/js/app.3f2a1b9c0d4e.js'
+        """
+        assets = StaticAssets(root, prefix)
+        assets.build()
+        pattern = '^%s(?P<asset>.+)$' % re.escape(assets.prefix)
+        self.add_get_mapping(pattern, assets.serve, compress=False)
+        self.add_head_mapping(pattern, assets.serve, compress=False)
+        self.static_assets.append(assets)
+        return assets
+
+    def static_url(self, name: str) -> str:
+        """静态文件的逻辑名转为带指纹的URL，用第一个包含name的add_static"""
+        for assets in self.static_assets:
+            if name in assets.manifest:
+                return assets.url(name)
+        return self.static_assets[0].url(name) if self.static_assets else name
 
     def add_json_bridge(self, bridge_func: JsonBridgeFunc):
         self.response_bridges.append(bridge_func)
         self.response_encoder = make_response_encoder(self.response_bridges)
 
-    def add_mapping(self, pattern: str, method: str, dealer: Callable):
+    def add_mapping(self, pattern: str, method: str, dealer: Callable, **options):
         """
         Example:
 
@@ -163,73 +477,434 @@ class Application(object):
                 return 'Hello %s!' % name
             app = Application()
             app.add_mapping('/hello/(?P<name>.+)', 'GET', say_hello)
+            app.add_mapping('/upload', 'POST', upload, max_body_size=100 * 1024 * 1024)
+            app.add_mapping('/export', 'GET', export_rows, stream_json=True)
+            app.add_mapping('/status', 'GET', get_status, etag=True)
             app.run()
+
+        options: 见route_options
         """
         assert isinstance(pattern, str), 'pattern:[{}] should be RegExp str'.format(pattern)
         method = method.upper()
         assert method == '*' or method in http_methods, 'Method:[{}] should be * or one of {}'.format(method, http_methods)
+        for key in options:
+            assert key in route_options, 'Option:[{}] should be one of {}'.format(key, route_options)
         patternobj = re.compile(re_standardize(pattern))
-        self.mapping.append(Mapping(pattern, method, dealer, '', patternobj))
+        self._check_dealer(dealer)
+        mapping = Mapping(pattern, method, dealer, '', patternobj, options)
+        mapping.pipeline = Pipeline(mapping, self.interceptors, self.container)
+        self.mapping.append(mapping)
+        self.router.add(mapping)
 
     # add_*_interceptor / add_*_mapping are generated by code below:
     """
     for m in ['CONNECT', 'DELETE', 'GET', 'HEAD', 'OPTIONS', 'PATCH', 'POST', 'PUT']:
         print(("def add_{m}_interceptor(self, pattern, dealer): return self.add_interceptor(pattern, '{M}', dealer)\n"
-        "def add_{m}_mapping(self, pattern, dealer, view=None): return self.add_mapping(pattern, '{M}', dealer, view)\n")
+        "def add_{m}_mapping(self, pattern, dealer, **options): return self.add_mapping(pattern, '{M}', dealer, **options)\n")
         .format(m=m.lower(), M=m))
     """
     def add_connect_interceptor(self, pattern: str, dealer: Callable):
         return self.add_interceptor(pattern, 'CONNECT', dealer)
 
-    def add_connect_mapping(self, pattern: str, dealer: Callable):
-        return self.add_mapping(pattern, 'CONNECT', dealer)
+    def add_connect_mapping(self, pattern: str, dealer: Callable, **options):
+        return self.add_mapping(pattern, 'CONNECT', dealer, **options)
 
     def add_delete_interceptor(self, pattern: str, dealer: Callable):
         return self.add_interceptor(pattern, 'DELETE', dealer)
 
-    def add_delete_mapping(self, pattern: str, dealer: Callable):
-        return self.add_mapping(pattern, 'DELETE', dealer)
+    def add_delete_mapping(self, pattern: str, dealer: Callable, **options):
+        return self.add_mapping(pattern, 'DELETE', dealer, **options)
 
     def add_get_interceptor(self, pattern: str, dealer: Callable):
         return self.add_interceptor(pattern, 'GET', dealer)
 
-    def add_get_mapping(self, pattern: str, dealer: Callable):
-        return self.add_mapping(pattern, 'GET', dealer)
+    def add_get_mapping(self, pattern: str, dealer: Callable, **options):
+        return self.add_mapping(pattern, 'GET', dealer, **options)
 
     def add_head_interceptor(self, pattern: str, dealer: Callable):
         return self.add_interceptor(pattern, 'HEAD', dealer)
 
-    def add_head_mapping(self, pattern: str, dealer: Callable):
-        return self.add_mapping(pattern, 'HEAD', dealer)
+    def add_head_mapping(self, pattern: str, dealer: Callable, **options):
+        return self.add_mapping(pattern, 'HEAD', dealer, **options)
 
     def add_options_interceptor(self, pattern: str, dealer: Callable):
         return self.add_interceptor(pattern, 'OPTIONS', dealer)
 
-    def add_options_mapping(self, pattern: str, dealer: Callable):
-        return self.add_mapping(pattern, 'OPTIONS', dealer)
+    def add_options_mapping(self, pattern: str, dealer: Callable, **options):
+        return self.add_mapping(pattern, 'OPTIONS', dealer, **options)
 
     def add_patch_interceptor(self, pattern: str, dealer: Callable):
         return self.add_interceptor(pattern, 'PATCH', dealer)
 
-    def add_patch_mapping(self, pattern: str, dealer: Callable):
-        return self.add_mapping(pattern, 'PATCH', dealer)
+    def add_patch_mapping(self, pattern: str, dealer: Callable, **options):
+        return self.add_mapping(pattern, 'PATCH', dealer, **options)
 
     def add_post_interceptor(self, pattern: str, dealer: Callable):
         return self.add_interceptor(pattern, 'POST', dealer)
 
-    def add_post_mapping(self, pattern: str, dealer: Callable):
-        return self.add_mapping(pattern, 'POST', dealer)
+    def add_post_mapping(self, pattern: str, dealer: Callable, **options):
+        return self.add_mapping(pattern, 'POST', dealer, **options)
 
     def add_put_interceptor(self, pattern: str, dealer: Callable):
         return self.add_interceptor(pattern, 'PUT', dealer)
 
-    def add_put_mapping(self, pattern: str, dealer: Callable):
-        return self.add_mapping(pattern, 'PUT', dealer)
+    def add_put_mapping(self, pattern: str, dealer: Callable, **options):
+        return self.add_mapping(pattern, 'PUT', dealer, **options)
+
+    def add_service(self, service_type: type, scope: Scope = Scope.request,
+                    factory: Optional[Callable[[Context], Any]] = None):
+        """
+        factory(ctx)用来构造service实例，可以是async def；用到async service的route整条链都是async的
+
+        Example:
+
+            from lessweb import Application, Scope
+            app = Application()
+            app.add_service(ConfigServ, Scope.singleton)
+            app.add_service(AuditServ, Scope.transient)
+            app.add_service(HttpServ, Scope.singleton, factory=create_http_serv)  # async def create_http_serv(ctx)
+        """
+        self.container.register(service_type, scope, factory)
+        for mapping in self.mapping:
+            mapping.pipeline = Pipeline(mapping, self.interceptors, self.container)
+
+    def enable_compression(self, min_size: int = COMPRESS_MIN_SIZE, mimetypes: Optional[Sequence[str]] = None,
+                           level: int = 6):
+        """
+        按Accept-Encoding对响应做gzip/deflate压缩，流式响应逐块压缩。
+        min_size以下的body不压缩；mimetypes为允许压缩的Content-Type，以/结尾的表示前缀，默认见compressible_mimetypes
+
+        Example:
+
+            from lessweb import Application
+            app = Application()
+            app.enable_compression(min_size=512)
+            app.add_get_mapping('/raw', get_raw, compress=False)
+        """
+        self.compressor = Compressor(min_size, mimetypes, level)
+
+    def enable_load_shedding(self, limit: int, max_queue: int = 0, max_queue_time: float = 1.0,
+                             adaptive: Optional[AIMDLimit] = None, retry_after: int = 1):
+        """
+        限制同时处理的请求数，超过limit时最多max_queue个请求排队max_queue_time秒，其余的立即响应503和Retry-After。
+        拒绝发生在参数绑定和读取body之前；adaptive不为None时limit随请求耗时调整。
+        route可以用limiter选项指定自己的ConcurrencyLimiter，或者用limiter=None不受限制(如健康检查)
+
+        Example:
+
+            from lessweb import Application
+            from lessweb.limiter import AIMDLimit, ConcurrencyLimiter
+            app = Application()
+            app.enable_load_shedding(64, max_queue=128, max_queue_time=0.5, adaptive=AIMDLimit(target_latency=0.3))
+            app.add_get_mapping('/report', get_report, limiter=ConcurrencyLimiter(4))
+            app.add_get_mapping('/health', get_health, limiter=None)
+        """
+        self.limiter = ConcurrencyLimiter(limit, max_queue, max_queue_time, adaptive, retry_after)
 
     def add_plugin(self, plugin: PluginProto):
         self.plugins.append(plugin)
         plugin.init_app(self)
 
+    def post_fork(self):
+        """
+        在fork出的子进程中调用：重新创建线程池，并调用plugin的post_fork重新创建连接池等资源
+        """
+        self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='lessweb')
+        self.background = BackgroundTasks(self.background.workers, self.background.max_queue)
+        self._wsgi_loop, self._wsgi_loop_lock = None, threading.Lock()  # loop的线程没有被fork过来
+        for plugin in self.plugins:
+            post_fork = getattr(plugin, 'post_fork', None)
+            if post_fork is not None:
+                post_fork()
+
+    def _render(self, ctx: Context, resp: Any) -> Tuple[Iterable[bytes], bool]:
+        """
+        把dealer的返回值编码成bytes，没有Content-Type时按返回值设置
+        :return: (chunks, streaming)，streaming为False时chunks是只有一个bytes的list
+        """
+        def _1_peep(iterator):
+            """Peeps into an iterator by doing an iteration
+            and returns an equivalent iterator.
+            """
+            # wsgi requires the headers first
+            # so we need to do an iteration
+            # and save the result for later
+            try:
+                firstchunk = next(iterator)
+            except StopIteration:
+                firstchunk = b''
+            return itertools.chain([firstchunk], iterator)
+
+        def _2_encode(r) -> bytes:
+            if isinstance(r, bytes):
+                return r
+            elif isinstance(r, str):
+                return r.encode(self.encoding, 'replace')
+            elif r is None:
+                return b''
+            else:
+                return str(r).encode(self.encoding)
+
+        if isinstance(resp, FileResponse):
+            resp.prepare(ctx)
+            return resp, True
+        mimekey = 'html'
+        resp_content_type = ctx.response.get_header('Content-Type')
+        wants_json = not resp_content_type or 'json' in resp_content_type.lower()
+        options = ctx.mapping.options if ctx.mapping is not None else {}
+        if options.get('stream_json') and wants_json and \
+                not isinstance(resp, (bytes, str)) and resp is not None:
+            chunk_size = options.get('json_chunk_size', self.json_chunk_size)
+            chunks = iter_json_chunks(resp, self.response_encoder(ensure_ascii=False), chunk_size)
+            result, streaming = _1_peep(map(_2_encode, chunks)), True
+            mimekey = 'json'
+        elif isinstance(resp, GeneratorType):
+            result, streaming = _1_peep(map(_2_encode, resp)), True
+        else:
+            if not isinstance(resp, (bytes, str)) and resp is not None:
+                if wants_json:
+                    resp = json.dumps(resp, ensure_ascii=False, cls=self.response_encoder)
+                    mimekey = 'json'
+                else:
+                    resp = str(resp)
+            result, streaming = [_2_encode(resp)], False
+        if not resp_content_type:
+            ctx.response.send_content_type(mimekey=mimekey, encoding=self.encoding)
+        return result, streaming
+
+    def _respond(self, ctx: Context, resp: Any) -> Tuple[str, List[Tuple[str, str]], Iterable[bytes]]:
+        """
+        编码dealer的返回值，处理条件请求、压缩和Content-Length
+        :return: (status_text, headers, body)，body为FileResponse时由调用者决定如何发送
+        """
+        try:
+            result, streaming = self._render(ctx, resp)
+        except Exception as e:  # 例如FileResponse的文件不存在时404
+            result, streaming = self._render(ctx, self._error_response(ctx, e))
+
+        def _1_not_modified(result):
+            """route有etag选项时用body的hash作为ETag；客户端缓存仍然有效时改为304"""
+            response = ctx.response
+            if response.get_status() == HttpStatus.NotModified:
+                return []
+            if response.get_status() != HttpStatus.OK or ctx.request.method not in ('GET', 'HEAD'):
+                return result
+            if not streaming and ctx.mapping is not None and ctx.mapping.options.get('etag') and \
+                    not response.get_header('ETag'):
+                response.send_etag(hashlib.blake2b(result[0], digest_size=16).hexdigest(), weak=True)
+            etag = response.get_header('ETag')
+            last_modified = response.get_header('Last-Modified')
+            if (etag or last_modified) and \
+                    ctx.request.is_fresh(etag, parse_http_date(last_modified) if last_modified else None):
+                response.set_status(HttpStatus.NotModified)
+                return []
+            return result
+
+        if not isinstance(result, FileResponse):  # FileResponse自己处理条件请求和Range，也不压缩
+            result = _1_not_modified(result)
+            if self.compressor is not None and \
+                    (ctx.mapping is None or ctx.mapping.options.get('compress', True)):
+                result = self.compressor.apply(ctx, result, streaming)
+        status_wrap = ctx.response.get_status()
+        status_core = status_wrap.value if isinstance(status_wrap, HttpStatus) else status_wrap
+        status_text = f'{status_core.code} {status_core.reason}'
+        if not streaming:
+            # 非流式的body编码成一个bytes，带上Content-Length，服务器就不需要chunked或关闭连接
+            body = b''.join(result)
+            result = [body]
+            if status_core.code not in (204, 304):
+                ctx.response.set_header('Content-Length', str(len(body)))
+        elif not isinstance(result, FileResponse):
+            result = itertools.chain(result, (b'',))
+        headers = list(ctx.response._headers.items())
+        for cookie in ctx.response._cookies.values():
+            headers.append(('Set-Cookie', cookie.dumps()))
+        return status_text, headers, result
+
+    def _call(self, ctx: Context, controller: Callable[[Context], Any]) -> Any:
+        """
+        执行controller并把异常转换成响应。同步的dealer不能中途取消，返回时已经超过ctx.deadline的话丢弃结果并响应504；
+        async def的dealer返回awaitable，由_await在超时时取消
+        """
+        try:
+            ctx.check_deadline()  # 排队时已经超时的请求不再执行
+            resp = controller(ctx)
+            if not inspect.isawaitable(resp):
+                ctx.check_deadline()
+            return resp
+        except (BadParamError, NotFoundError, HttpError) as e:
+            return self._error_response(ctx, e)
+        except Exception as e:
+            return self._internal_error(ctx, e)
+
+    async def _await(self, ctx: Context, resp: Any) -> Any:
+        """async def的dealer返回的是awaitable，错误和同步dealer一样处理；超过ctx.deadline时取消并响应504"""
+        try:
+            remaining = ctx.remaining()
+            if remaining is None:
+                return await resp
+            return await asyncio.wait_for(resp, remaining)
+        except asyncio.TimeoutError as e:
+            if ctx.remaining() == 0:
+                return self._error_response(ctx, GatewayTimeoutError())
+            return self._internal_error(ctx, e)
+        except (BadParamError, NotFoundError, HttpError) as e:
+            return self._error_response(ctx, e)
+        except Exception as e:
+            return self._internal_error(ctx, e)
+
+    def _run_deferred(self, ctx: Context) -> None:
+        """响应发送完之后提交ctx.defer的任务，队列满时在当前线程执行"""
+        tasks, ctx.deferred = ctx.deferred, []
+        for task in tasks:
+            if not self.background.submit(task):
+                self.background.run(task)
+
+    async def _arun_deferred(self, ctx: Context) -> None:
+        """_run_deferred的async版本，队列满时在self.executor中执行并等待"""
+        tasks, ctx.deferred = ctx.deferred, []
+        for task in tasks:
+            if not self.background.submit(task):
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.background.run, task)
+
+    async def handle_async(self, ctx: Context, read: Callable[[int], Awaitable[bytes]]) \
+            -> Tuple[str, List[Tuple[str, str]], Iterable[bytes]]:
+        """
+        aiohttp_handler/asgi共用的处理流程，read(size)是读取请求body的coroutine。
+        route在event loop上查找；async def的dealer在loop上执行，需要时用aload_body/abody_stream读取body；
+        同步的dealer和响应编码在self.executor中执行，需要body时从executor线程回到loop读取
+        """
+        limiter = None
+        try:
+            controller = self._match(ctx)
+            limiter = self._limiter_of(ctx)
+            if limiter is not None:
+                await limiter.aacquire()  # 在event loop上排队，不占用线程
+        except (BadParamError, NotFoundError, HttpError) as e:
+            return self._respond(ctx, self._error_response(ctx, e))
+        except Exception as e:
+            return self._respond(ctx, self._internal_error(ctx, e))
+        if limiter is None:
+            return await self._dispatch_async(ctx, controller, read)
+        begin = time.monotonic()
+        try:
+            return await self._dispatch_async(ctx, controller, read)
+        finally:
+            limiter.release(time.monotonic() - begin, self._status_code(ctx) < 500)
+
+    async def _dispatch_async(self, ctx: Context, controller: Callable[[Context], Any],
+                              read: Callable[[int], Awaitable[bytes]]) \
+            -> Tuple[str, List[Tuple[str, str]], Iterable[bytes]]:
+        loop = asyncio.get_running_loop()
+        try:
+            # body不预先读取：executor中的同步代码通过SyncBodyReader读取，async dealer用aload_body/abody_stream
+            ctx.request.env['wsgi.input'] = SyncBodyReader(read, loop)
+            ctx.request.aread = read
+            pipeline = ctx.mapping.pipeline if ctx.mapping is not None else None
+            if pipeline is not None and pipeline.is_async:
+                resp = controller(ctx)
+                if inspect.isawaitable(resp):
+                    resp = await self._await(ctx, resp)
+            else:
+                return await loop.run_in_executor(
+                    self.executor, lambda: self._respond(ctx, self._call(ctx, controller)))
+        except (BadParamError, NotFoundError, HttpError) as e:
+            resp = self._error_response(ctx, e)
+        except Exception as e:
+            resp = self._internal_error(ctx, e)
+        return self._respond(ctx, resp)
+
+    def aiohttp_handler(self, homepath: str = ''):
+        """
+        原生的aiohttp handler，不经过WSGI和线程桥接，从aiohttp.web.Request直接构造Context。
+        homepath是挂载的路径前缀
+
+        Example:
+
+            from aiohttp import web
+            from lessweb import Application
+            app = Application()
+            app.add_get_mapping('/hello', say_hello)
+            aioapp = web.Application()
+            aioapp.router.add_route('*', '/api/{path_info:.*}', app.aiohttp_handler('/api'))
+            web.run_app(aioapp)
+        """
+        from aiohttp import web
+        from multidict import CIMultiDict
+
+        async def handler(request):
+            ctx = Context(self)
+            ctx.request.load(aiohttp_environ(request, homepath))
+            status_text, headers, body = await self.handle_async(ctx, request.content.read)
+            code, _, reason = status_text.partition(' ')
+            if isinstance(body, list):
+                # aiohttp自己计算Content-Length
+                headers = [(k, v) for k, v in headers if k.lower() != 'content-length']
+                response = web.Response(body=body[0], status=int(code), reason=reason, headers=CIMultiDict(headers))
+                if not ctx.deferred:
+                    return response
+                await response.prepare(request)
+                await response.write_eof()
+            else:
+                response = web.StreamResponse(status=int(code), reason=reason, headers=CIMultiDict(headers))
+                await response.prepare(request)
+                if request.method == 'HEAD':
+                    body = []
+                async for chunk in aiter_body(body, self.executor):
+                    if chunk:
+                        await response.write(chunk)
+                await response.write_eof()
+            if ctx.deferred:
+                await self._arun_deferred(ctx)
+            return response
+
+        return handler
+
+    def asgi(self):
+        """
+        ASGI 3.0 application，可以用uvicorn/hypercorn等服务器运行
+
+        Example:
+
+            from lessweb import Application
+            app = Application()
+            app.add_get_mapping('/hello', say_hello)
+            application = app.asgi()  # uvicorn module:application
+        """
+        async def asgi_app(scope, receive, send):
+            if scope['type'] == 'lifespan':
+                while True:
+                    message = await receive()
+                    if message['type'] == 'lifespan.startup':
+                        await send({'type': 'lifespan.startup.complete'})
+                    elif message['type'] == 'lifespan.shutdown':
+                        await asyncio.get_running_loop().run_in_executor(None, self.background.drain, DRAIN_TIMEOUT)
+                        await send({'type': 'lifespan.shutdown.complete'})
+                        return
+            if scope['type'] != 'http':
+                raise ValueError('Unsupported ASGI scope type: {}'.format(scope['type']))
+            ctx = Context(self)
+            ctx.request.load(asgi_environ(scope))
+            status_text, headers, body = await self.handle_async(ctx, AsgiBodyReader(receive).read)
+            await send({
+                'type': 'http.response.start',
+                'status': int(status_text.split(' ', 1)[0]),
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers],
+            })
+            if isinstance(body, list):
+                await send({'type': 'http.response.body', 'body': body[0] if scope['method'] != 'HEAD' else b''})
+            else:
+                if scope['method'] == 'HEAD':
+                    body = []
+                async for chunk in aiter_body(body, self.executor):
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                await send({'type': 'http.response.body', 'body': b''})
+            if ctx.deferred:
+                await self._arun_deferred(ctx)
+
+        return asgi_app
+
     def wsgifunc(self, *middleware):
         """
             Example:
@@ -241,71 +916,29 @@ class Application(object):
                 application = app.wsgifunc()
         """
         def wsgi(env, start_resp):
-            def _1_peep(iterator):
-                """Peeps into an iterator by doing an iteration
-                and returns an equivalent iterator.
-                """
-                # wsgi requires the headers first
-                # so we need to do an iteration
-                # and save the result for later
-                try:
-                    firstchunk = next(iterator)
-                except StopIteration:
-                    firstchunk = ''
-                return itertools.chain([firstchunk], iterator)
-
             ctx = Context(self)
             ctx.request.load(env)
             try:
-                mimekey = 'html'
                 resp = self._handle_with_dealers(ctx)
-                resp_content_type = ctx.response.get_header('Content-Type')
-                if isinstance(resp, GeneratorType):
-                    result = _1_peep(resp)
-                else:
-                    if not isinstance(resp, (bytes, str)) and resp is not None:
-                        if not resp_content_type or \
-                                (resp_content_type and 'json' in resp_content_type.lower()):
-                            resp = json.dumps(resp, ensure_ascii=False, cls=self.response_encoder)
-                            mimekey = 'json'
-                        else:
-                            resp = str(resp)
-                    result = (resp,)
-                if not resp_content_type:
-                    ctx.response.send_content_type(mimekey=mimekey, encoding=self.encoding)
             except Exception as e:
-                logging.exception(e)
-                ctx.response.send_content_type(encoding=self.encoding)
-                ctx.response.set_status(HttpStatus.InternalServerError)
-                result = (traceback.format_exc(),)
-
-            def _2_build_result(result):
-                for r in result:
-                    if isinstance(r, bytes):
-                        yield r
-                    elif isinstance(r, str):
-                        yield r.encode(self.encoding, 'replace')
-                    elif r is None:
-                        yield b''
-                    else:
-                        yield str(r).encode(self.encoding)
-
-            result = _2_build_result(result)
-            status_wrap = ctx.response.get_status()
-            status_core = status_wrap.value if isinstance(status_wrap, HttpStatus) else status_wrap
-            status_text = f'{status_core.code} {status_core.reason}'
-            headers = list(ctx.response._headers.items())
-            for cookie in ctx.response._cookies.values():
-                headers.append(('Set-Cookie', cookie.dumps()))
+                resp = self._internal_error(ctx, e)
+            status_text, headers, result = self._respond(ctx, resp)
             start_resp(status_text, headers)
-            return itertools.chain(result, (b'',))
+            if isinstance(result, FileResponse):
+                result = result.wsgi_body(env)  # 不包装，以免妨碍服务器识别wsgi.file_wrapper
+            elif not isinstance(result, list):  # generator中也可能调用ctx.defer
+                return AfterBody(result, lambda: self._run_deferred(ctx))
+            if ctx.deferred:
+                return AfterBody(result, lambda: self._run_deferred(ctx))
+            return result
 
         for m in middleware:
             wsgi = m(wsgi)
 
         return wsgi
 
-    def run(self, wsgifunc=None, port:int=8080, homepath:str='', staticpath:Optional[str]='static'):
+    def run(self, wsgifunc=None, port:int=8080, homepath:str='', staticpath:Optional[str]='static', workers:int=1,
+            engine:str='aiohttp', native:bool=False):
         """
         Example:
 
@@ -314,20 +947,64 @@ class Application(object):
             app.add_interceptor('/', '*', lambda ctx: ctx() + ' world!')
             app.add_mapping('/hello', lambda ctx: 'Hello')
             app.run(port=80, homepath='/api')
-        """
-        from aiohttp import web
-        from aiohttp_wsgi import WSGIHandler  # type: ignore
-        app = web.Application()
-        if wsgifunc is None:
-            wsgifunc = self.wsgifunc()
 
+        默认经过aiohttp_wsgi在线程池中执行wsgifunc(没有指定时为self.wsgifunc())；
+        native=True时用原生的aiohttp_handler，async def的dealer多时更快，同步的dealer比WSGI慢。
+        workers大于1时fork出workers个进程，通过SO_REUSEPORT监听同一个端口，崩溃的进程会被重启；
+        fork之前完成所有初始化，子进程中调用post_fork。
+        engine='lessweb'时用lessweb.server内置的HTTP/1.1服务器，不依赖aiohttp，
+        这时staticpath通过add_static在homepath下的/static/提供
+        """
         if homepath.endswith('/'):
             homepath = homepath[:-1]
         if homepath and homepath[0] != '/':
             homepath = '/' + homepath
+        if engine == 'lessweb':
+            assert wsgifunc is None, 'wsgifunc is not supported by the lessweb engine'
+            self._run_native(port, homepath, staticpath, workers)
+            return
+        assert engine == 'aiohttp', 'engine:[{}] should be aiohttp or lessweb'.format(engine)
+        assert not (native and wsgifunc is not None), 'wsgifunc is not supported when native=True'
+
+        from aiohttp import web
+        app = web.Application()
 
         if staticpath is not None:
             makedir(staticpath)
             app.router.add_static(prefix='/static/', path=staticpath)
-        app.router.add_route("*", homepath + "/{path_info:.*}", WSGIHandler(wsgifunc))
-        web.run_app(app, port=port)
+        if native:
+            handler = self.aiohttp_handler(homepath)
+        else:
+            from aiohttp_wsgi import WSGIHandler  # type: ignore
+            handler = WSGIHandler(wsgifunc if wsgifunc is not None else self.wsgifunc())
+        app.router.add_route("*", homepath + "/{path_info:.*}", handler)
+
+        async def drain_background(_):
+            await asyncio.get_running_loop().run_in_executor(None, self.background.drain, DRAIN_TIMEOUT)
+        app.on_cleanup.append(drain_background)
+        if workers <= 1:
+            web.run_app(app, port=port)
+            return
+        self._prefork(port, workers, lambda sock: web.run_app(app, sock=sock, print=None))
+
+    def _prefork(self, port: int, workers: int, serve: Callable[[socket.socket], None]) -> None:
+        """fork出workers个进程，每个进程post_fork之后执行serve(sock)"""
+        reuse_port = hasattr(socket, 'SO_REUSEPORT')
+        # 不支持SO_REUSEPORT时，所有子进程共用父进程listen的socket
+        shared_sock = None if reuse_port else listen_socket('0.0.0.0', port)
+
+        def worker(index: int):
+            self.post_fork()
+            serve(listen_socket('0.0.0.0', port, reuse_port=True) if reuse_port else shared_sock)  # type: ignore
+
+        logging.info('======== Running on http://0.0.0.0:%d with %d workers ========', port, workers)
+        Supervisor(worker, workers).run()
+
+    def _run_native(self, port: int, homepath: str, staticpath: Optional[str], workers: int) -> None:
+        if staticpath is not None:
+            makedir(staticpath)
+            self.add_static(staticpath, '/static/')
+        if workers <= 1:
+            run_server(self, port=port, homepath=homepath)
+            return
+        self._prefork(port, workers, lambda sock: run_server(self, homepath=homepath, sock=sock))
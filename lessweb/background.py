@@ -0,0 +1,126 @@
+"""
+Background tasks deferred until the response is sent
+(from lessweb)
+"""
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+
+__all__ = ["DRAIN_TIMEOUT", "BackgroundTasks", "AfterBody"]
+
+
+DRAIN_TIMEOUT = 30.0  # 关闭服务器时等待后台任务的最长秒数
+
+
+class BackgroundTasks:
+    """
+    ctx.defer提交的任务在响应发送完之后放进有界队列，由workers个后台线程执行。
+    队列满时submit返回False，由调用者(发送响应的线程)自己执行，这样提交得太快的请求会被拖慢(backpressure)。
+    任务的异常会被记录日志，不影响其他任务
+    """
+    def __init__(self, workers: int = 2, max_queue: int = 1024) -> None:
+        self.workers: int = workers
+        self.max_queue: int = max_queue
+        self.queue: queue.Queue = queue.Queue(max_queue)
+        self.threads: List[threading.Thread] = []
+        self.lock: threading.Lock = threading.Lock()
+        self.closed: bool = False
+        # metrics
+        self.submitted: int = 0
+        self.completed: int = 0
+        self.failed: int = 0
+        self.rejected: int = 0  # 因为队列满而由调用者执行的任务数
+
+    def _start(self) -> None:
+        """第一次submit时才创建线程，所以fork之前创建的BackgroundTasks没有线程"""
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name='lessweb-background-%d' % i, daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, task: Callable[[], Any]) -> bool:
+        """:return: False表示队列已满或已经关闭，调用者应该用run(task)自己执行"""
+        if self.closed:
+            return False
+        if not self.threads:
+            self._start()
+        try:
+            self.queue.put_nowait(task)
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.submitted += 1
+        return True
+
+    def run(self, task: Callable[[], Any]) -> None:
+        try:
+            task()
+        except Exception:
+            logging.exception('Deferred task %r failed', task)
+            with self.lock:
+                self.failed += 1
+        with self.lock:
+            self.completed += 1
+
+    def _work(self) -> None:
+        while True:
+            task = self.queue.get()
+            try:
+                if task is None:
+                    return
+                self.run(task)
+            finally:
+                self.queue.task_done()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'pending': self.queue.qsize(), 'submitted': self.submitted, 'completed': self.completed,
+                    'failed': self.failed, 'rejected': self.rejected}
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        停止接收新任务，等待队列中的任务执行完
+        :return: 在timeout秒内执行完时返回True
+        """
+        self.closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.queue.all_tasks_done.wait(remaining)
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+        return True
+
+
+class AfterBody:
+    """
+    WSGI服务器迭代完body之后会调用close()，这时执行callback
+    """
+    def __init__(self, body: Iterable[bytes], callback: Callable[[], Any]) -> None:
+        self.body: Iterable[bytes] = body
+        self.callback: Callable[[], Any] = callback
+
+    def __iter__(self) -> Iterator[bytes]:
+        return iter(self.body)
+
+    def close(self) -> None:
+        try:
+            close = getattr(self.body, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            self.callback()
@@ -3,8 +3,12 @@ from enum import Enum
 from datetime import datetime as Datetime, date as Date, time as Time
 from json import JSONEncoder
 from itertools import chain
-from typing import Type, List, Callable, Union, Dict, Any, TypeVar
+from io import BytesIO
+from typing import Type, List, Callable, Union, Dict, Any, Optional, TypeVar, Iterator, get_type_hints
 import base64
+import hashlib
+import mmap
+import os
 import dateutil.parser
 import json
 from .storage import Storage
@@ -28,12 +32,67 @@ class ParamStr(str):
 
 
 class MultipartFile:
+    """
+    上传的文件。内容在file里(小文件在内存，大文件在临时文件)，按需读取，不要轻易访问value
+    """
     filename: str
-    value: bytes
-
-    def __init__(self, upfile):
-        self.filename = upfile.filename
-        self.value = upfile.value
+    content_type: str
+    file: Any
+
+    def __init__(self, upfile=None, *, filename: str = '', file=None, content_type: str = ''):
+        if upfile is not None:  # 兼容cgi.FieldStorage的item
+            filename, file, content_type = upfile.filename, BytesIO(upfile.value), getattr(upfile, 'type', '')
+        self.filename = filename
+        self.file = BytesIO() if file is None else file
+        self.content_type = content_type
+
+    @property
+    def value(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    @property
+    def size(self) -> int:
+        pos = self.file.tell()
+        size = self.file.seek(0, os.SEEK_END)
+        self.file.seek(pos)
+        return size
+
+    def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        return self.file.seek(offset, whence)
+
+    def chunks(self, chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+        self.file.seek(0)
+        while True:
+            data = self.file.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+    def digest(self, name: str = 'sha256') -> str:
+        h = hashlib.new(name)
+        for data in self.chunks():
+            h.update(data)
+        return h.hexdigest()
+
+    def save_to(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            for data in self.chunks():
+                f.write(data)
+
+    def fileno(self) -> int:
+        if hasattr(self.file, 'rollover'):  # SpooledTemporaryFile先落盘
+            self.file.rollover()
+        return self.file.fileno()
+
+    def mmap(self) -> mmap.mmap:
+        return mmap.mmap(self.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self) -> None:
+        self.file.close()
 
     def __str__(self) -> str:
         return f'<MultipartFile filename={self.filename} value={str(self.value)}>'
@@ -52,20 +111,67 @@ def default_response_bridge(obj: Any) -> Jsonizable:
     return None
 
 
+_missing = object()
+
+
+def model_dumper(obj: Any) -> Optional[Callable[[Any], Any]]:
+    """
+    :return: 按type(obj)预先计算好字段名的函数，结果与Storage.of(obj)相同；不是model时返回None
+    """
+    try:
+        if not Storage.type_hints(type(obj)):
+            return None
+        names = [name[1:] if name[0] == '_' else name for name in get_type_hints(obj)]
+    except:
+        return None
+
+    def _1_dump(obj: Any) -> Any:
+        result = {}
+        try:
+            for name in names:
+                value = getattr(obj, name, _missing)
+                if value is not _missing:
+                    result[name] = value
+        except:
+            return None
+        return result
+
+    return _1_dump
+
+
+def _dump_none(obj: Any) -> Any:
+    return None
+
+
 def make_response_encoder(bridge_funcs: List[JsonBridgeFunc]):
+    """
+    每个具体类型第一次出现时按顺序尝试bridge_funcs、default_response_bridge和model_dumper，
+    记住处理它的函数，之后同类型的对象直接调用。
+    所以bridge函数应该只根据类型决定是否处理；记住的函数返回None时会重新按顺序尝试
+    """
+    all_funcs = list(chain(bridge_funcs, [default_response_bridge]))
+    handlers: Dict[type, Callable[[Any], Any]] = {}
+
+    def convert(obj: Any) -> Any:
+        cls = type(obj)
+        handler = handlers.get(cls)
+        if handler is not None:
+            dest_val = handler(obj)
+            if dest_val is not None or handler is _dump_none:
+                return dest_val
+        for bridge_func in all_funcs:
+            dest_val = bridge_func(obj)
+            if dest_val is not None:
+                handlers[cls] = bridge_func
+                return dest_val
+        handler = handlers[cls] = model_dumper(obj) or _dump_none
+        return handler(obj)
+
     class ResponseEncoder(JSONEncoder):
         def default(self, obj):
             if obj is None:
                 return obj
-            for bridge_func in chain(bridge_funcs, [default_response_bridge]):
-                dest_val = bridge_func(obj)
-                if dest_val is not None:
-                    return dest_val
-            try:
-                if Storage.type_hints(type(obj)):
-                    return Storage.of(obj)
-            except:
-                pass
+            return convert(obj)
 
     return ResponseEncoder
 
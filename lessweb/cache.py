@@ -0,0 +1,147 @@
+"""
+In-process response cache
+(from lessweb)
+"""
+from collections import OrderedDict
+from threading import Event, Lock
+from time import monotonic
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple, Union, cast
+
+from .context import Context
+from .webapi import HttpStatus, ResponseStatus
+
+
+__all__ = ["CACHE_MAX_BYTES", "CacheEntry", "ResponseCache", "default_cache_key", "cache_interceptor"]
+
+
+CACHE_MAX_BYTES = 64 * 1024 * 1024  # ResponseCache默认的内存上限
+_ENTRY_OVERHEAD = 256  # 每个entry除body和headers以外的大致内存占用
+
+
+class CacheEntry:
+    __slots__ = ('body', 'status', 'headers', 'expires', 'size')
+
+    def __init__(self, body: bytes, status: Union[HttpStatus, ResponseStatus], headers: List[Tuple[str, str]],
+                 expires: float) -> None:
+        self.body: bytes = body
+        self.status: Union[HttpStatus, ResponseStatus] = status
+        self.headers: List[Tuple[str, str]] = headers
+        self.expires: float = expires
+        self.size: int = len(body) + sum(len(k) + len(v) for k, v in headers) + _ENTRY_OVERHEAD
+
+
+class ResponseCache:
+    """
+    按最近使用顺序淘汰的响应缓存，所有entry的size之和不超过max_bytes。
+    同一个key同时未命中时，只有一个请求(leader)去计算，其他请求等它完成后直接读缓存
+    """
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES) -> None:
+        self.max_bytes: int = max_bytes
+        self.size: int = 0
+        self.entries: 'OrderedDict[Hashable, CacheEntry]' = OrderedDict()
+        self.inflight: Dict[Hashable, Event] = {}
+        self.lock: Lock = Lock()
+
+    def get(self, key: Hashable) -> Optional[CacheEntry]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires <= monotonic():
+                self._remove(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, entry: CacheEntry) -> None:
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            if entry.size > self.max_bytes:
+                return
+            self.entries[key] = entry
+            self.size += entry.size
+            while self.size > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def _remove(self, key: Hashable) -> None:
+        self.size -= self.entries.pop(key).size
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def begin(self, key: Hashable) -> Optional[Event]:
+        """
+        :return: None表示当前请求成为leader，计算完成后必须调用end(key)；否则返回需要等待的Event
+        """
+        with self.lock:
+            event = self.inflight.get(key)
+            if event is None:
+                self.inflight[key] = Event()
+            return event
+
+    def end(self, key: Hashable) -> None:
+        with self.lock:
+            event = self.inflight.pop(key, None)
+        if event is not None:
+            event.set()
+
+
+def default_cache_key(ctx: Context) -> Hashable:
+    """url参数、query参数和form参数，与顺序无关"""
+    param = ctx.request.param_input
+    return (tuple(sorted(param.url_input.items())),
+            tuple(sorted((k, tuple(v)) for k, v in param.query_input.items())),
+            tuple(sorted((k, tuple(v)) for k, v in param.form_input.items())))
+
+
+def cache_interceptor(ttl: float, key: Optional[Callable[[Context], Hashable]] = None,
+                      wait_timeout: float = 30.0) -> Callable[[Context], Any]:
+    """
+    :param ttl: 缓存有效的秒数
+    :param key: 从ctx计算缓存key，默认为default_cache_key，实际的key还会加上method和path
+    :param wait_timeout: 等待leader的最长秒数，超时后自己计算
+    :return: 缓存编码后body、status和headers的interceptor；命中时直接返回bytes，不执行后面的interceptor和dealer。
+        只缓存200、没有Set-Cookie的非流式响应，stream_json的route不经过缓存
+    """
+    key_func = key or default_cache_key
+
+    def _1_restore(ctx: Context, entry: CacheEntry) -> bytes:
+        ctx.response.set_status(entry.status)
+        for name, value in entry.headers:
+            ctx.response.set_header(name, value)
+        return entry.body
+
+    def _1_cache(ctx: Context) -> Any:
+        if ctx.mapping is not None and ctx.mapping.options.get('stream_json'):
+            return ctx()
+        cache: ResponseCache = ctx.app.response_cache
+        cache_key = (ctx.request.method, ctx.request.path, key_func(ctx))
+        leader = False
+        while True:
+            entry = cache.get(cache_key)
+            if entry is not None:
+                return _1_restore(ctx, entry)
+            event = cache.begin(cache_key)
+            if event is None:
+                leader = True
+                break
+            if not event.wait(wait_timeout):
+                break
+        try:
+            result, streaming = ctx.app._render(ctx, ctx())
+            if streaming:
+                return (chunk for chunk in result)
+            body = cast(List[bytes], result)[0]  # 非流式时是只有一个bytes的list
+            if ctx.response.get_status() == HttpStatus.OK and not ctx.response._cookies:
+                cache.put(cache_key, CacheEntry(body, ctx.response.get_status(),
+                                                list(ctx.response._headers.items()), monotonic() + ttl))
+            return body
+        finally:
+            if leader:
+                cache.end(cache_key)
+
+    return _1_cache
@@ -0,0 +1,151 @@
+"""
+Single-flight request coalescing
+(from lessweb)
+"""
+from threading import Event, Lock
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple, Union, cast
+
+from .context import Context
+from .webapi import BadParamError, HttpError, HttpStatus, NotFoundError, ResponseStatus
+
+
+__all__ = ["COALESCE_WAIT_TIMEOUT", "Flight", "SingleFlight", "coalesce_key", "error_factory", "coalesce_interceptor"]
+
+
+COALESCE_WAIT_TIMEOUT = 30.0  # 等待leader的最长秒数
+
+
+class Flight:
+    """一个key正在进行中的计算。leader完成后设置结果，shared为False时follower需要自己计算"""
+    __slots__ = ('event', 'shared', 'body', 'status', 'headers', 'make_error', 'followers')
+
+    def __init__(self) -> None:
+        self.event: Event = Event()
+        self.shared: bool = False
+        self.body: bytes = b''
+        self.status: Union[HttpStatus, ResponseStatus] = HttpStatus.OK
+        self.headers: List[Tuple[str, str]] = []
+        self.make_error: Optional[Callable[[], Exception]] = None  # leader抛出的异常，每个follower重新创建一个
+        self.followers: int = 0
+
+
+class SingleFlight:
+    """
+    同一个key同时只有一个请求(leader)在计算，其他请求(follower)等待并共享leader的结果。
+    与ResponseCache不同，leader完成后立即删除Flight，不保留任何结果
+    """
+    def __init__(self) -> None:
+        self.flights: Dict[Hashable, Flight] = {}
+        self.lock: Lock = Lock()
+        # metrics
+        self.leaders: int = 0
+        self.coalesced: int = 0  # 共享了leader结果的follower数
+
+    def begin(self, key: Hashable) -> Tuple[Flight, bool]:
+        """:return: (flight, 是否leader)；leader计算完成后必须调用end(key, flight)"""
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                self.leaders += 1
+                return flight, True
+            flight.followers += 1
+            return flight, False
+
+    def end(self, key: Hashable, flight: Flight) -> None:
+        with self.lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+            if flight.shared:
+                self.coalesced += flight.followers
+        flight.event.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self.lock:
+            return {'inflight': len(self.flights), 'leaders': self.leaders, 'coalesced': self.coalesced}
+
+
+def coalesce_key(ctx: Context, params: Optional[Sequence[str]] = None, headers: Sequence[str] = ()) -> Hashable:
+    """
+    method、path、url/query参数和指定的请求header。params为None时包含所有url/query参数，与顺序无关
+    """
+    request = ctx.request
+    param = request.param_input
+    if params is None:
+        selected: Tuple = (tuple(sorted(param.url_input.items())),
+                           tuple(sorted((k, tuple(v)) for k, v in param.query_input.items())))
+    else:
+        selected = tuple((name, param.url_input.get(name), tuple(param.query_input.get(name, ()))) for name in params)
+    return request.method, request.path, selected, tuple(request.get_header(name) for name in headers)
+
+
+def error_factory(e: Exception) -> Optional[Callable[[], Exception]]:
+    """
+    只保存异常的status、message等字段，follower各自抛出新的异常对象，不共享leader的异常和traceback。
+    Application按status响应的HttpError、BadParamError和NotFoundError之外的异常返回None
+    """
+    if isinstance(e, HttpError):
+        status, message, headers = e.status, e.message, dict(e.headers)
+
+        def _1_http_error() -> Exception:
+            error = HttpError(status, headers=dict(headers))
+            error.message = message  # NotModifiedError等message为空的子类
+            return error
+
+        return _1_http_error
+    if isinstance(e, BadParamError):
+        message, param = e.message, e.param
+        return lambda: BadParamError(message, param)
+    if isinstance(e, NotFoundError):
+        methods = list(e.methods)
+        return lambda: NotFoundError(list(methods))
+    return None
+
+
+def coalesce_interceptor(params: Optional[Sequence[str]] = None, headers: Sequence[str] = (),
+                         wait_timeout: float = COALESCE_WAIT_TIMEOUT) -> Callable[[Context], Any]:
+    """
+    :param params: 参与key的url/query参数名，None表示全部
+    :param headers: 参与key的请求header名，例如Accept-Language
+    :param wait_timeout: follower等待leader的最长秒数(不超过ctx.remaining())，超时后自己计算
+    :return: 合并同时到达的相同请求的interceptor：follower得到leader编码后的body、status和headers，
+        leader抛出的HttpError、BadParamError和NotFoundError也会在follower中抛出(见error_factory)。
+        流式响应、设置了cookie的响应和其他异常不共享，follower自己计算
+    """
+    def _1_coalesce(ctx: Context) -> Any:
+        if ctx.mapping is not None and ctx.mapping.options.get('stream_json'):
+            return ctx()
+        group: SingleFlight = ctx.app.single_flight
+        key = coalesce_key(ctx, params, headers)
+        flight, leader = group.begin(key)
+        if not leader:
+            remaining = ctx.remaining()
+            timeout = wait_timeout if remaining is None else min(wait_timeout, remaining)
+            if flight.event.wait(timeout) and flight.shared:
+                if flight.make_error is not None:
+                    raise flight.make_error()
+                ctx.response.set_status(flight.status)
+                for name, value in flight.headers:
+                    ctx.response.set_header(name, value)
+                return flight.body
+            ctx.check_deadline()
+            return ctx()
+        try:
+            try:
+                result, streaming = ctx.app._render(ctx, ctx())
+            except Exception as e:
+                flight.make_error = error_factory(e)
+                flight.shared = flight.make_error is not None
+                raise
+            if streaming:
+                return (chunk for chunk in result)
+            flight.body = cast(List[bytes], result)[0]  # 非流式时是只有一个bytes的list
+            if not ctx.response._cookies:
+                flight.status = ctx.response.get_status()
+                flight.headers = list(ctx.response._headers.items())
+                flight.shared = True
+            return flight.body
+        finally:
+            group.end(key, flight)
+
+    return _1_coalesce
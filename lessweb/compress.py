@@ -0,0 +1,128 @@
+"""
+gzip/deflate response compression
+(from lessweb)
+"""
+import zlib
+from typing import Iterable, Iterator, Optional, Sequence, Tuple, TYPE_CHECKING
+
+from .webapi import HttpStatus, mimetypes
+
+if TYPE_CHECKING:
+    from .context import Context
+
+
+__all__ = ["COMPRESS_MIN_SIZE", "compressible_mimetypes", "compressed_mimetypes", "accept_encoding",
+           "compress_stream", "Compressor"]
+
+
+COMPRESS_MIN_SIZE = 1024  # 小于这个大小的body不压缩
+
+# 默认压缩的Content-Type，以/结尾的表示前缀
+compressible_mimetypes = (
+    'text/', 'application/json', 'application/javascript', 'application/xml', 'application/xhtml+xml',
+    'application/rss+xml', 'application/atom+xml', 'image/svg+xml',
+)
+
+# 本身已经压缩过的Content-Type，即使在allowlist中也不压缩
+compressed_mimetypes = frozenset(mimetypes[key] for key in (
+    'jpg', 'png', 'gif', 'webp', 'mp3', 'm4a', 'ogg', 'mp4', 'm4v', 'mov', 'webm', 'flv', 'mpg', 'avi', 'wmv',
+    '3gp', 'zip', '7z', 'rar', 'jar', 'xpi', 'docx', 'xlsx', 'pptx', 'woff', 'kmz', 'pdf',
+))
+
+_wbits = {'gzip': 16 + zlib.MAX_WBITS, 'deflate': zlib.MAX_WBITS}
+
+
+def accept_encoding(header: str) -> Optional[str]:
+    """
+    按Accept-Encoding选择gzip或deflate，q值相同时优先gzip
+
+        >>> accept_encoding('gzip, deflate, br')
+        'gzip'
+        >>> accept_encoding('gzip;q=0.5, deflate')
+        'deflate'
+        >>> accept_encoding('*;q=0, identity') is None
+        True
+        >>> accept_encoding('*')
+        'gzip'
+
+    """
+    qvalues = {}
+    for item in header.split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        qvalues[coding] = q
+    star = qvalues.get('*', 0.0)
+    best, best_q = None, 0.0
+    for coding in ('gzip', 'deflate'):
+        q = qvalues.get(coding, star)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress_stream(chunks: Iterable[bytes], coding: str, level: int = 6) -> Iterator[bytes]:
+    """逐块压缩，每块都做Z_SYNC_FLUSH，所以客户端能及时收到流式响应的每一块"""
+    compressobj = zlib.compressobj(level, zlib.DEFLATED, _wbits[coding])
+    for chunk in chunks:
+        if chunk:
+            data = compressobj.compress(chunk) + compressobj.flush(zlib.Z_SYNC_FLUSH)
+            if data:
+                yield data
+    yield compressobj.flush()
+
+
+class Compressor:
+    """
+    响应压缩的配置：min_size以下的body不压缩；mimetypes为允许压缩的Content-Type，以/结尾的表示前缀
+    """
+    def __init__(self, min_size: int = COMPRESS_MIN_SIZE, mimetypes: Optional[Sequence[str]] = None,
+                 level: int = 6) -> None:
+        self.min_size: int = min_size
+        self.mimetypes: Tuple[str, ...] = tuple(compressible_mimetypes if mimetypes is None else mimetypes)
+        self.level: int = level
+
+    def is_compressible(self, content_type: str) -> bool:
+        mimetype = content_type.split(';', 1)[0].strip().lower()
+        if not mimetype or mimetype in compressed_mimetypes:
+            return False
+        return any(mimetype == t or (t.endswith('/') and mimetype.startswith(t)) for t in self.mimetypes)
+
+    def apply(self, ctx: 'Context', chunks: Iterable[bytes], streaming: bool) -> Iterable[bytes]:
+        """
+        按需压缩响应body并设置Content-Encoding/Vary。
+        streaming为False时chunks会被合并成一个bytes，这样才能判断min_size
+        """
+        response = ctx.response
+        status_wrap = response.get_status()
+        status = (status_wrap.value if isinstance(status_wrap, HttpStatus) else status_wrap).code
+        if status < 200 or status in (204, 304) or response.get_header('Content-Encoding') or \
+                not self.is_compressible(response.get_header('Content-Type') or ''):
+            return chunks
+        vary = response.get_header('Vary')
+        if not vary:
+            response.set_header('Vary', 'Accept-Encoding')
+        elif 'accept-encoding' not in vary.lower() and vary.strip() != '*':
+            response.set_header('Vary', vary + ', Accept-Encoding')
+        coding = accept_encoding(ctx.request.get_header('Accept-Encoding') or '')
+        if coding is None:
+            return chunks
+        if not streaming:
+            data = b''.join(chunks)
+            if len(data) < self.min_size:
+                return [data]
+            compressobj = zlib.compressobj(self.level, zlib.DEFLATED, _wbits[coding])
+            chunks = [compressobj.compress(data) + compressobj.flush()]
+        else:
+            chunks = compress_stream(chunks, coding, self.level)
+        response.set_header('Content-Encoding', coding)
+        response.del_header('Content-Length')
+        return chunks
@@ -0,0 +1,188 @@
+"""
+Service container
+(from lessweb)
+"""
+from enum import Enum
+import inspect
+from threading import Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type
+
+from .context import Context, Request, Response
+from .model import model_or_service, register_service_type
+from .storage import Storage
+
+
+__all__ = ["Scope", "ServicePlan", "Container"]
+
+
+class Scope(Enum):
+    singleton = 1  # 每个进程一个实例
+    request = 2  # 每个请求一个实例，缓存在ctx.box
+    transient = 3  # 每个注入点一个实例
+
+
+class ServicePlan:
+    """
+    ServicePlan to预先计算service的构造方式：要注入哪些属性，以及从哪里取值。
+    factory为async def或依赖了这样的service时is_async为True，需要先在event loop上用aget创建
+    """
+    def __init__(self, service_type: Type, scope: Scope, injections: List[Tuple[str, Callable[[Context], Any]]],
+                 factory: Optional[Callable[[Context], Any]] = None,
+                 async_deps: Optional[List['ServicePlan']] = None) -> None:
+        self.service_type: Type = service_type
+        self.scope: Scope = scope
+        self.injections: List[Tuple[str, Callable[[Context], Any]]] = injections
+        self.factory: Optional[Callable[[Context], Any]] = factory  # 为None时用service_type()构造
+        self.async_factory: bool = inspect.iscoroutinefunction(factory)
+        self.async_deps: List[ServicePlan] = async_deps or []
+        self.is_async: bool = self.async_factory or bool(self.async_deps)
+        self.instance: Any = None
+        self.lock: Lock = Lock()
+        self.get: Callable[[Context], Any]
+        if scope == Scope.singleton:
+            self.get = self._get_singleton
+        elif scope == Scope.request:
+            self.get = self._get_request
+        else:
+            self.get = self.create
+
+    def create(self, ctx: Context, service_obj: Any = None) -> Any:
+        if service_obj is None:
+            if self.async_factory:
+                raise TypeError('Async service %s should be fetched by afetch_service or an async dealer' %
+                                self.service_type.__name__)
+            service_obj = self.service_type() if self.factory is None else self.factory(ctx)
+        for key, getter in self.injections:
+            setattr(service_obj, key, getter(ctx))
+        return service_obj
+
+    async def prepare(self, ctx: Context) -> None:
+        """在event loop上创建async的部分，之后get不再需要await。transient的service只准备它的依赖"""
+        if self.scope == Scope.transient:
+            for dep_plan in self.async_deps:
+                await dep_plan.prepare(ctx)
+        else:
+            await self.aget(ctx)
+
+    async def acreate(self, ctx: Context) -> Any:
+        for dep_plan in self.async_deps:
+            await dep_plan.prepare(ctx)  # 创建后缓存，注入时的同步getter直接取得
+        if self.async_factory:
+            return self.create(ctx, await self.factory(ctx))  # type: ignore
+        return self.create(ctx)
+
+    async def aget(self, ctx: Context) -> Any:
+        if self.scope == Scope.singleton:
+            if self.instance is None:
+                service_obj = await self.acreate(ctx)
+                with self.lock:
+                    if self.instance is None:
+                        self.instance = service_obj
+            return self.instance
+        elif self.scope == Scope.request:
+            key = (Scope.request, self.service_type)
+            service_obj = ctx.box.get(key)
+            if service_obj is None:
+                service_obj = await self.acreate(ctx)
+                service_obj = ctx.box.setdefault(key, service_obj)
+            return service_obj
+        return await self.acreate(ctx)
+
+    def _get_singleton(self, ctx: Context) -> Any:
+        if self.instance is None:
+            with self.lock:
+                if self.instance is None:
+                    self.instance = self.create(ctx)
+        return self.instance
+
+    def _get_request(self, ctx: Context) -> Any:
+        key = (Scope.request, self.service_type)
+        service_obj = ctx.box.get(key)
+        if service_obj is None:
+            service_obj = ctx.box[key] = self.create(ctx)
+        return service_obj
+
+
+class Container:
+    """
+    Container to管理service的作用域和构造计划。
+    未注册的service按default_scope处理；计划在第一次用到(通常是add_mapping)时生成，循环依赖在那时报错
+    """
+    def __init__(self, default_scope: Scope = Scope.request) -> None:
+        self.default_scope: Scope = default_scope
+        self.scopes: Dict[Type, Scope] = {}
+        self.factories: Dict[Type, Callable[[Context], Any]] = {}
+        self.plans: Dict[Type, ServicePlan] = {}
+
+    def register(self, service_type: Type, scope: Scope, factory: Optional[Callable[[Context], Any]] = None) -> None:
+        """factory(ctx)返回service实例，可以是async def，之后仍会按类型注解注入属性"""
+        if scope == Scope.transient and inspect.iscoroutinefunction(factory):
+            raise TypeError('Async service %s cannot be transient' % service_type.__name__)
+        register_service_type(service_type)
+        old_scope, old_factory = self.scopes.get(service_type), self.factories.get(service_type)
+        self.scopes[service_type] = scope
+        if factory is not None:
+            self.factories[service_type] = factory
+        self.plans.clear()  # scope变化会影响依赖它的service
+        try:
+            self.plan(service_type)
+        except:
+            if old_scope is None:
+                del self.scopes[service_type]
+            else:
+                self.scopes[service_type] = old_scope
+            if old_factory is None:
+                self.factories.pop(service_type, None)
+            else:
+                self.factories[service_type] = old_factory
+            self.plans.clear()
+            raise
+
+    def plan(self, service_type: Type, _path: Tuple[Type, ...] = ()) -> ServicePlan:
+        plan = self.plans.get(service_type)
+        if plan is not None:
+            return plan
+        if service_type in _path:
+            raise TypeError('Circular service dependency: %s' %
+                            ' -> '.join(t.__name__ for t in _path + (service_type,)))
+        scope = self.scopes.get(service_type, self.default_scope)
+        injections: List[Tuple[str, Callable[[Context], Any]]] = []
+        async_deps: List[ServicePlan] = []
+        for realname, realtype in Storage.type_hints(service_type).items():
+            getter: Callable[[Context], Any]
+            if realtype == Context:
+                getter = lambda ctx: ctx
+            elif realtype == Request:
+                getter = lambda ctx: ctx.request
+            elif realtype == Response:
+                getter = lambda ctx: ctx.response
+            elif model_or_service(realtype) == 2:
+                dep_plan = self.plan(realtype, _path + (service_type,))
+                if scope == Scope.singleton and dep_plan.scope != Scope.singleton:
+                    raise TypeError('Singleton service %s cannot depend on %s service %s' %
+                                    (service_type.__name__, dep_plan.scope.name, realtype.__name__))
+                getter = dep_plan.get
+                if dep_plan.is_async:
+                    async_deps.append(dep_plan)
+            else:
+                continue  # 其他类型不注入
+            if scope == Scope.singleton and realtype in (Context, Request, Response):
+                raise TypeError('Singleton service %s cannot depend on %s' % (service_type.__name__, realtype.__name__))
+            injections.append((realname, getter))
+        plan = self.plans[service_type] = ServicePlan(service_type, scope, injections,
+                                                      self.factories.get(service_type), async_deps)
+        return plan
+
+    def fetch(self, ctx: Context, service_type: Type) -> Any:
+        plan = self.plans.get(service_type)
+        if plan is None:
+            plan = self.plan(service_type)
+        return plan.get(ctx)
+
+    async def afetch(self, ctx: Context, service_type: Type) -> Any:
+        plan = self.plans.get(service_type)
+        if plan is None:
+            plan = self.plan(service_type)
+        if plan.is_async:
+            return await plan.aget(ctx)
+        return plan.get(ctx)
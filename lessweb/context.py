@@ -1,17 +1,21 @@
-from typing import Any, Optional, Dict, List, Union, TYPE_CHECKING
-import cgi
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional, Dict, Iterator, List, Union, TYPE_CHECKING
+from datetime import datetime
+import functools
+from io import BytesIO
 import json
 import os
+import time
 
-from io import BytesIO
 from requests.structures import CaseInsensitiveDict
 from urllib.parse import unquote
 
 from .storage import Storage
-from .webapi import Cookie, HttpStatus, ResponseStatus, ParamInput
+from .webapi import Cookie, HttpStatus, ResponseStatus, ParamInput, PayloadTooLargeError, NotModifiedError
+from .webapi import GatewayTimeoutError, HttpError
 from .bridge import Jsonizable, ParamStr, MultipartFile
 from .webapi import header_name_of_wsgi_key, wsgi_key_of_header_name
-from .webapi import parse_cookie, mimetypes
+from .webapi import parse_cookie, mimetypes, http_date, parse_http_date, etag_matches
+from .multipart import SPOOL_SIZE, multipart_boundary
 from .utils import eafp
 
 
@@ -19,7 +23,21 @@ __all__ = ["Request", "Response", "Context"]
 
 
 if TYPE_CHECKING:
-    from lessweb.application import Application
+    from lessweb.application import Application, Mapping
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+def read_chunks(fp, length: Optional[int], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """从fp读取length字节，每次最多chunk_size；length为None时一直读到EOF"""
+    while length is None or length > 0:
+        data = fp.read(chunk_size if length is None else min(chunk_size, length))
+        if not data:
+            break
+        if length is not None:
+            length -= len(data)
+        yield data
 
 
 class Request:
@@ -70,10 +88,14 @@ class Request:
         self.query: str = ''
         self.fullpath: str = ''
 
-        self.body_data: Optional[bytes] = None  # Raw Body Input
-        self.json_input: Optional[Jsonizable] = None  # Input from Json Body
+        self._body_loaded: bool = False  # body在第一次被访问时才读取和解析
+        self._body_data: Optional[bytes] = None  # Raw Body Input
+        self._json_input: Optional[Jsonizable] = None  # Input from Json Body
         self.param_input: ParamInput = ParamInput()  # Param Inputs
-        self.file_input: Dict[str, List[MultipartFile]] = {}  # Uploaded File Inputs
+        self._file_input: Dict[str, List[MultipartFile]] = {}  # Uploaded File Inputs
+        self.upload_spool_size: int = SPOOL_SIZE  # 上传文件超过这个大小就写到临时文件
+        self.max_body_size: Optional[int] = None  # body超过这个大小时返回413，None表示不限制
+        self.aread: Optional[Callable[[int], Awaitable[bytes]]] = None  # 原生async入口中读取body的coroutine
 
     def load(self, env):
         encoding = self.encoding
@@ -102,17 +124,162 @@ class Request:
             self._cookies = parse_cookie(self.get_header('cookie'))
         # parse query params
         self.param_input.load_query(self.query, encoding)
+        # body data is loaded on first access
+        self._body_loaded = False
+        self.param_input.on_demand = self.load_body
+
+    def body_length(self) -> Optional[int]:
+        """
+        :return: body的长度；chunked等长度未知的body返回None，没有body返回0
+        """
+        cl = eafp(lambda: int(self.env.get('CONTENT_LENGTH') or ''), None)
+        if cl is not None:
+            return cl
+        if 'chunked' in self.env.get('HTTP_TRANSFER_ENCODING', '').lower() or self.env.get('wsgi.input_terminated'):
+            return None
+        return 0
+
+    def check_body_size(self) -> None:
+        """在读取body之前，根据CONTENT_LENGTH检查是否超过max_body_size"""
+        cl = self.body_length()
+        if self.max_body_size is not None and cl is not None and cl > self.max_body_size:
+            raise PayloadTooLargeError(self.max_body_size)
+
+    def body_stream(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        """
+        逐块读取body而不缓冲，适合处理很大的body。
+        body只能读取一次，调用body_stream之后body_data/json_input/file_input/form_input都不再可用
+        """
+        self._body_loaded = True
+        self.param_input.on_demand = None
+        return self._read_body(chunk_size)
+
+    def _read_body(self, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+        fp = self.env.get('wsgi.input')
+        cl = self.body_length()
+        if fp is None or cl == 0:
+            return iter(())
+        self.check_body_size()
+        if cl is not None or self.max_body_size is None:
+            return read_chunks(fp, cl, chunk_size)
+        return self._read_limited(read_chunks(fp, None, chunk_size), self.max_body_size)
+
+    @staticmethod
+    def _read_limited(chunks: Iterator[bytes], max_size: int) -> Iterator[bytes]:
+        total = 0
+        for data in chunks:
+            total += len(data)
+            if total > max_size:
+                raise PayloadTooLargeError(max_size)
+            yield data
+
+    def load_body(self) -> None:
+        """读取并解析body，只在第一次访问body_data/json_input/file_input/form_input时执行"""
+        if self._body_loaded:
+            return
+        self._body_loaded = True
+        self.param_input.on_demand = None
+        if 'wsgi.input' not in self.env or self.body_length() == 0:
+            return
+        encoding = self.encoding
+        chunks = self._read_body()
+        # multipart body is parsed chunk by chunk, and uploaded files are spooled to disk
+        if self.is_form() and multipart_boundary(self.get_content_type()) is not None:
+            try:
+                self.param_input.load_form_stream(chunks, self.env, encoding, self._file_input, self.upload_spool_size)
+            except HttpError:  # body过大或格式错误
+                raise
+            except:
+                pass
+            return
         # load body data
-        cl = eafp(lambda: int(self.env.get('CONTENT_LENGTH')), 0)
-        self.body_data = self.env['wsgi.input'].read(cl) if cl else None
+        self._body_data = b''.join(chunks) or None
         # parse form params
-        if self.body_data:
+        body_data = self._body_data
+        if body_data:
             if self.is_json():
-                self.json_input = eafp(lambda: json.loads(self.body_data.decode(encoding)),
-                                       {'__error__': 'invalid json received'})
+                self._json_input = eafp(lambda: json.loads(body_data.decode(encoding)),
+                                        {'__error__': 'invalid json received'})
             elif self.is_form():
-                eafp(lambda: self.param_input.load_form(self.body_data, self.env, encoding, self.file_input), None)
+                eafp(lambda: self.param_input.load_form(body_data, self.env, encoding, self._file_input), None)
 
+    def body_pending(self) -> bool:
+        """body不为空且还没有读取"""
+        return not self._body_loaded and 'wsgi.input' in self.env and self.body_length() != 0
+
+    async def aload_body(self) -> None:
+        """
+        load_body的async版本，async dealer访问body_data/json_input/file_input/form_input之前await，
+        读取body时不占用线程。body会先读进内存，很大的body用abody_stream
+
+        Example:
+
+            async def create_user(ctx: Context):
+                await ctx.request.aload_body()
+                return await save_user(ctx.request.json_input)
+        """
+        if not self.body_pending():
+            return
+        if self.aread is not None:
+            chunks = [data async for data in self._aread_body()]
+            self.env['wsgi.input'] = BytesIO(b''.join(chunks))
+            self.env['CONTENT_LENGTH'] = str(sum(len(data) for data in chunks))
+        self.load_body()
+
+    def abody_stream(self, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        """body_stream的async版本：async for逐块读取body而不缓冲"""
+        self._body_loaded = True
+        self.param_input.on_demand = None
+        return self._aread_body(chunk_size)
+
+    async def _aread_body(self, chunk_size: int = CHUNK_SIZE) -> AsyncIterator[bytes]:
+        if self.aread is None:  # WSGI中没有异步的输入
+            for data in self._read_body(chunk_size):
+                yield data
+            return
+        length = self.body_length()
+        if length == 0:
+            return
+        self.check_body_size()
+        total = 0
+        while length is None or total < length:
+            data = await self.aread(chunk_size if length is None else min(chunk_size, length - total))
+            if not data:
+                break
+            total += len(data)
+            if self.max_body_size is not None and total > self.max_body_size:
+                raise PayloadTooLargeError(self.max_body_size)
+            yield data
+
+    @property
+    def body_data(self) -> Optional[bytes]:
+        self.load_body()
+        return self._body_data
+
+    @body_data.setter
+    def body_data(self, value: Optional[bytes]) -> None:
+        self._body_loaded = True
+        self._body_data = value
+
+    @property
+    def json_input(self) -> Optional[Jsonizable]:
+        self.load_body()
+        return self._json_input
+
+    @json_input.setter
+    def json_input(self, value: Optional[Jsonizable]) -> None:
+        self._body_loaded = True
+        self._json_input = value
+
+    @property
+    def file_input(self) -> Dict[str, List[MultipartFile]]:
+        self.load_body()
+        return self._file_input
+
+    @file_input.setter
+    def file_input(self, value: Dict[str, List[MultipartFile]]) -> None:
+        self._body_loaded = True
+        self._file_input = value
 
     def set_alias(self, realname, queryname):
         self._aliases[realname] = queryname
@@ -175,6 +342,22 @@ class Request:
     def get_uploaded_files(self, key: str) -> List[MultipartFile]:
         return self.file_input.get(key, [])
 
+    def is_fresh(self, etag: Optional[str] = None, last_modified: Optional[datetime] = None) -> bool:
+        """
+        按If-None-Match/If-Modified-Since判断客户端缓存是否仍然有效，有If-None-Match时忽略If-Modified-Since
+        """
+        if self.method not in ('GET', 'HEAD'):
+            return False
+        if_none_match = self.get_header('If-None-Match')
+        if if_none_match is not None:
+            return etag is not None and etag_matches(if_none_match, etag)
+        if_modified_since = self.get_header('If-Modified-Since')
+        if if_modified_since and last_modified is not None:
+            since = parse_http_date(if_modified_since)
+            # Last-Modified只精确到秒
+            return since is not None and parse_http_date(http_date(last_modified)) <= since  # type: ignore
+        return False
+
 
 class Response:
     def __init__(self, encoding: str):
@@ -244,6 +427,18 @@ class Response:
         else:
             self.set_header('Content-Type', '%s' % mimetypes[mimekey])
 
+    def send_etag(self, etag: str, weak: bool = False) -> str:
+        """etag没有引号时自动加上，返回实际的ETag header"""
+        if not etag.startswith(('"', 'W/"')):
+            etag = '"%s"' % etag
+        if weak and not etag.startswith('W/'):
+            etag = 'W/' + etag
+        self.set_header('ETag', etag)
+        return etag
+
+    def send_last_modified(self, last_modified: datetime) -> None:
+        self.set_header('Last-Modified', http_date(last_modified))
+
 
 class Context(object):
     def __init__(self, app: 'Application') -> None:
@@ -252,7 +447,56 @@ class Context(object):
         self.request: Request = Request(app.encoding)
         self.response: Response = Response(app.encoding)
         self.box: Dict = {}
+        self.mapping: Optional['Mapping'] = None  # 匹配到的route，在找到之后才设置
+        self.deadline: Optional[float] = None  # time.monotonic()的值，None表示不限时
+        self.deferred: List[Callable[[], Any]] = []  # ctx.defer提交的任务
 
     def __call__(self):
         return self.app_stack[-1](self)
 
+    def defer(self, fn: Callable, *args, **kwargs) -> None:
+        """
+        响应发送完之后在后台线程中执行fn(*args, **kwargs)，见Application.background
+
+        Example:
+
+            def create_order(ctx: Context, order: Order):
+                order_id = save(order)
+                ctx.defer(send_webhook, order_id)
+                return {'id': order_id}
+        """
+        self.deferred.append(functools.partial(fn, *args, **kwargs))
+
+    def remaining(self) -> Optional[float]:
+        """
+        :return: 距离deadline的秒数，已经超过时为0，不限时为None。可以用作数据库、HTTP客户端等的超时
+        """
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def check_deadline(self) -> None:
+        """超过deadline时raise GatewayTimeoutError(响应504)"""
+        if self.deadline is not None and self.deadline <= time.monotonic():
+            raise GatewayTimeoutError()
+
+    def check_not_modified(self, etag: Optional[str] = None, last_modified: Optional[datetime] = None,
+                           weak: bool = False) -> None:
+        """
+        设置ETag/Last-Modified，客户端缓存仍然有效时raise NotModifiedError(响应304)。
+        etag可以是资源的版本号，这样在生成响应body之前就能判断
+
+        Example:
+
+            def get_article(ctx: Context, id: int):
+                article = load_article(id)
+                ctx.check_not_modified(etag=str(article.version))
+                return render(article)
+        """
+        if etag is not None:
+            etag = self.response.send_etag(etag, weak)
+        if last_modified is not None:
+            self.response.send_last_modified(last_modified)
+        if self.request.is_fresh(etag, last_modified):
+            raise NotModifiedError()
+
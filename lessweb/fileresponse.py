@@ -0,0 +1,169 @@
+"""
+File responses
+(from lessweb)
+"""
+import mmap
+import os
+from datetime import datetime, timezone
+from typing import Any, BinaryIO, Dict, Iterable, Iterator, Optional, Tuple, Union, TYPE_CHECKING
+from urllib.parse import quote
+
+from .webapi import HttpStatus, NotFoundError, mimetypes, http_date, parse_http_date
+
+if TYPE_CHECKING:
+    from .context import Context
+
+
+__all__ = ["FILE_CHUNK_SIZE", "parse_range", "FileResponse"]
+
+
+FILE_CHUNK_SIZE = 256 * 1024
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    只支持单个区间
+    :return: (start, end)，end不包含；多个区间或格式错误时返回None；无法满足时返回(0, 0)
+
+        >>> parse_range('bytes=0-99', 1000)
+        (0, 100)
+        >>> parse_range('bytes=900-', 1000)
+        (900, 1000)
+        >>> parse_range('bytes=-100', 1000)
+        (900, 1000)
+        >>> parse_range('bytes=1000-', 1000)
+        (0, 0)
+        >>> parse_range('bytes=0-1,5-6', 1000) is None
+        True
+
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, sep, last = spec.strip().partition('-')
+    if not sep:
+        return None
+    try:
+        if not first:
+            suffix = int(last)
+            if suffix <= 0:
+                return 0, 0
+            return max(size - suffix, 0), size
+        start = int(first)
+        end = int(last) + 1 if last else size
+    except ValueError:
+        return None
+    if start >= size or end <= start:
+        return 0, 0
+    return start, min(end, size)
+
+
+class FileResponse:
+    """
+    dealer返回FileResponse时，文件内容不经过JSON编码，支持Range/206、Last-Modified和If-Modified-Since。
+    服务器提供wsgi.file_wrapper时交给它(通常是sendfile)，否则用mmap分块读取。
+    file可以是路径或以二进制模式打开的文件，响应结束时会被关闭
+
+    Example:
+
+        def download(name: str):
+            return FileResponse(os.path.join('/data', name), filename=name)
+    """
+    def __init__(self, file: Union[str, os.PathLike, BinaryIO], content_type: Optional[str] = None,
+                 filename: Optional[str] = None, chunk_size: int = FILE_CHUNK_SIZE) -> None:
+        self.file: Union[str, os.PathLike, BinaryIO] = file
+        self.content_type: Optional[str] = content_type
+        self.filename: Optional[str] = filename
+        self.chunk_size: int = chunk_size
+        self.fp: Optional[BinaryIO] = None
+        self.offset: int = 0
+        self.length: int = 0
+        self.size: int = 0
+
+    def _guess_content_type(self) -> str:
+        name = self.filename or (self.file if isinstance(self.file, (str, os.PathLike))
+                                 else getattr(self.file, 'name', ''))
+        ext = os.path.splitext(str(name))[1][1:].lower()
+        return mimetypes.get(ext, 'application/octet-stream')
+
+    def prepare(self, ctx: 'Context') -> None:
+        """打开文件、处理Range和条件请求、设置status和headers；文件不存在或是目录时抛出NotFoundError(404)"""
+        request, response = ctx.request, ctx.response
+        if isinstance(self.file, (str, os.PathLike)):
+            try:
+                self.fp = open(self.file, 'rb')
+            except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+                raise NotFoundError()
+        else:
+            self.fp = self.file
+        try:
+            stat: Optional[os.stat_result] = os.fstat(self.fp.fileno())
+        except (AttributeError, OSError, ValueError):
+            stat = None
+        if stat is not None:
+            self.size = stat.st_size
+        else:
+            self.size = self.fp.seek(0, os.SEEK_END)
+        response.set_header('Content-Type', self.content_type or self._guess_content_type())
+        response.set_header('Accept-Ranges', 'bytes')
+        if self.filename:
+            response.set_header('Content-Disposition', "attachment; filename*=UTF-8''%s" % quote(self.filename))
+        last_modified = None
+        if stat is not None:
+            last_modified = datetime.fromtimestamp(int(stat.st_mtime), timezone.utc)
+            response.send_last_modified(last_modified)
+        self.offset, self.length = 0, self.size
+        if request.is_fresh(response.get_header('ETag'), last_modified):
+            response.set_status(HttpStatus.NotModified)
+            self.length = 0
+            return
+        range_header = request.get_header('Range')
+        if_range = request.get_header('If-Range')
+        if range_header and request.method in ('GET', 'HEAD') and \
+                (not if_range or (last_modified is not None and parse_http_date(if_range) == last_modified)):
+            byte_range = parse_range(range_header, self.size)
+            if byte_range == (0, 0):
+                response.set_status(HttpStatus.RangeNotSatisfiable)
+                response.set_header('Content-Range', 'bytes */%d' % self.size)
+                self.length = 0
+            elif byte_range is not None:
+                start, end = byte_range
+                response.set_status(HttpStatus.PartialContent)
+                response.set_header('Content-Range', 'bytes %d-%d/%d' % (start, end - 1, self.size))
+                self.offset, self.length = start, end - start
+        response.set_header('Content-Length', str(self.length))
+
+    def wsgi_body(self, env: Dict) -> Iterable[bytes]:
+        """区间到文件末尾时交给wsgi.file_wrapper，否则返回自身(分块读取)"""
+        file_wrapper = env.get('wsgi.file_wrapper')
+        if file_wrapper is not None and self.fp is not None and self.length > 0 and \
+                self.offset + self.length == self.size:
+            self.fp.seek(self.offset)
+            return file_wrapper(self.fp, self.chunk_size)
+        return self
+
+    def __iter__(self) -> Iterator[bytes]:
+        if self.fp is None or self.length <= 0:
+            return
+        start, end, chunk_size = self.offset, self.offset + self.length, self.chunk_size
+        try:
+            mm: Any = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            mm = None
+        if mm is not None:
+            with mm:
+                for pos in range(start, end, chunk_size):
+                    yield mm[pos:min(pos + chunk_size, end)]
+            return
+        self.fp.seek(start)
+        remain = self.length
+        while remain > 0:
+            data = self.fp.read(min(chunk_size, remain))
+            if not data:
+                break
+            remain -= len(data)
+            yield data
+
+    def close(self) -> None:
+        if self.fp is not None:
+            self.fp.close()
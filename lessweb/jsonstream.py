@@ -0,0 +1,231 @@
+"""
+Incremental JSON decoding and encoding
+(from lessweb)
+"""
+import codecs
+import json
+import re
+from types import GeneratorType
+from typing import Any, AsyncIterator, Generator, Iterable, Iterator, List, Optional
+
+
+__all__ = ["JSON_CHUNK_SIZE", "iter_json_array", "aiter_json_array", "iter_json_chunks"]
+
+
+JSON_CHUNK_SIZE = 64 * 1024  # 流式JSON响应每次输出的大小
+
+
+_ws_re = re.compile(r'[ \t\n\r]*')
+_scan_re = re.compile(r'["\[\]{},\s]')  # 字符串之外决定元素结尾的字符
+_string_re = re.compile(r'["\\]')
+
+
+_MORE = object()  # _json_array_parser需要下一块输入
+
+
+def _json_array_parser(encoding: str) -> Generator[Any, Optional[bytes], None]:
+    """
+    iter_json_array和aiter_json_array共用的解析器：yield _MORE时调用者send下一块bytes(结束时send None)，
+    其他yield的值是解析出的元素
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder(encoding)()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def _1_read() -> Generator[Any, Optional[bytes], str]:
+        nonlocal eof
+        while True:
+            chunk = yield _MORE
+            if chunk is None:
+                eof = True
+                return text_decoder.decode(b'', final=True)
+            text = text_decoder.decode(chunk)
+            if text:
+                return text
+
+    def _1_more() -> Generator[Any, Optional[bytes], None]:
+        nonlocal buf, pos
+        buf = buf[pos:] + (yield from _1_read())  # 丢掉已经解析过的部分
+        pos = 0
+
+    def _1_peek() -> Generator[Any, Optional[bytes], str]:
+        """跳过空白，返回下一个字符，结束时返回''"""
+        nonlocal pos
+        while True:
+            pos = _ws_re.match(buf, pos).end()  # type: ignore
+            if pos < len(buf):
+                return buf[pos]
+            if eof:
+                return ''
+            yield from _1_more()
+
+    def _1_fill_item() -> Generator[Any, Optional[bytes], None]:
+        """
+        读入直到从pos开始的元素完整地在buf中。只跟踪括号深度和字符串，是否合法由raw_decode判断；
+        新读入的块单独扫描，元素结束后才拼接，所以每个字符只扫描和复制一次
+        """
+        nonlocal buf, pos
+        depth, in_string, escaped, done = 0, False, False, False
+        parts: List[str] = []
+        text, i = buf, pos
+        while not done:
+            while True:
+                if escaped:  # 跳过转义符后面的字符，转义符可能在上一块的末尾
+                    if i >= len(text):
+                        break
+                    i, escaped = i + 1, False
+                m = (_string_re if in_string else _scan_re).search(text, i)
+                if m is None:
+                    break
+                c, i = m.group(), m.end()
+                if c == '\\':
+                    escaped = True
+                elif c == '"':
+                    in_string = not in_string
+                    done = not in_string and depth == 0
+                elif c in '[{':
+                    depth += 1
+                elif c in ']}':
+                    depth -= 1
+                    done = depth <= 0
+                else:  # ','或空白
+                    done = depth == 0
+                if done:
+                    break
+            if done or eof:
+                break
+            parts.append(text[pos:] if not parts else text)
+            text, i = (yield from _1_read()), 0
+        if parts:
+            buf, pos = ''.join(parts) + text, 0
+
+    if (yield from _1_peek()) != '[':
+        raise ValueError('Expecting JSON array')
+    pos += 1
+    if (yield from _1_peek()) == ']':
+        pos += 1
+    else:
+        while True:
+            yield from _1_peek()
+            yield from _1_fill_item()  # 元素完整地在buf中之后才解析，避免每读一块都从头raw_decode
+            item, pos = decoder.raw_decode(buf, pos)
+            yield item
+            sep = yield from _1_peek()
+            pos += 1
+            if sep == ']':
+                break
+            elif sep != ',':
+                raise ValueError("Expecting ',' or ']' in JSON array")
+    if (yield from _1_peek()) != '':
+        raise ValueError('Extra data after JSON array')
+
+
+def iter_json_array(chunks: Iterable[bytes], encoding: str = 'utf-8') -> Iterator[Any]:
+    """
+    逐块读取JSON array，每解析出一个元素就yield，内存占用只与单个元素的大小有关
+
+        >>> list(iter_json_array([b'[{"a": 1}, 2', b'3, "x\\\\"', b'"]']))
+        [{'a': 1}, 23, 'x"']
+        >>> list(iter_json_array([b' [ ] ']))
+        []
+        >>> list(iter_json_array([b'{"a": 1}']))
+        Traceback (most recent call last):
+        ...
+        ValueError: Expecting JSON array
+        >>> rest = iter([b'[{"a" 1}, ', b'{"b": 2}]'])
+        >>> list(iter_json_array(rest))
+        Traceback (most recent call last):
+        ...
+        json.decoder.JSONDecodeError: Expecting ':' delimiter: line 1 column 7 (char 6)
+        >>> list(rest)  # 错误的元素一结束就报错，不再读取后面的块
+        [b'{"b": 2}]']
+
+    """
+    parser = _json_array_parser(encoding)
+    chunk_iter = iter(chunks)
+    value = next(parser)
+    while True:
+        if value is _MORE:
+            chunk = next(chunk_iter, None)
+        else:
+            yield value
+            chunk = None  # yield元素之后send的值被忽略
+        try:
+            value = parser.send(chunk)
+        except StopIteration:
+            return
+
+
+async def aiter_json_array(chunks: AsyncIterator[bytes], encoding: str = 'utf-8') -> AsyncIterator[Any]:
+    """
+    iter_json_array的async版本，chunks通常是Request.abody_stream()
+
+        >>> async def body():
+        ...     for chunk in [b'[1, {"a"', b': 2}]']:
+        ...         yield chunk
+        >>> async def items():
+        ...     return [item async for item in aiter_json_array(body())]
+        >>> import asyncio; asyncio.run(items())
+        [1, {'a': 2}]
+
+    """
+    parser = _json_array_parser(encoding)
+    value = next(parser)
+    while True:
+        chunk: Optional[bytes] = None
+        if value is _MORE:
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                pass
+        else:
+            yield value
+        try:
+            value = parser.send(chunk)
+        except StopIteration:
+            return
+
+
+def iter_json_chunks(obj: Any, encoder: json.JSONEncoder, chunk_size: int = JSON_CHUNK_SIZE) -> Iterator[str]:
+    """
+    把list/tuple/dict/generator逐个元素编码，攒够chunk_size个字符就输出一块。
+    每个元素仍由encoder.encode(C实现)一次编码，所以内存占用只与单个元素和chunk_size有关
+
+        >>> encoder = json.JSONEncoder()
+        >>> list(iter_json_chunks((i for i in range(5)), encoder, chunk_size=4))
+        ['[0, 1', ', 2, 3', ', 4]']
+        >>> ''.join(iter_json_chunks({'a': [1], 2: None}, encoder))
+        '{"a": [1], "2": null}'
+
+    """
+    sep = encoder.item_separator
+
+    def _1_pieces() -> Iterator[str]:
+        if isinstance(obj, dict):
+            yield '{'
+            for i, (key, val) in enumerate(obj.items()):
+                piece = encoder.encode({key: val})[1:-1]  # 借用encoder处理非str的key
+                yield sep + piece if i else piece
+            yield '}'
+        elif isinstance(obj, (list, tuple, GeneratorType)):
+            yield '['
+            for i, val in enumerate(obj):
+                piece = encoder.encode(val)
+                yield sep + piece if i else piece
+            yield ']'
+        else:
+            yield encoder.encode(obj)
+
+    buf = []
+    size = 0
+    for piece in _1_pieces():
+        buf.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield ''.join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield ''.join(buf)
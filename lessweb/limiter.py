@@ -0,0 +1,131 @@
+"""
+Concurrency limits and load shedding
+(from lessweb)
+"""
+import asyncio
+from collections import deque
+from threading import Event, Lock
+from typing import Any, Deque, Optional
+
+from .webapi import ServiceUnavailableError
+
+
+__all__ = ["AIMDLimit", "ConcurrencyLimiter"]
+
+
+class AIMDLimit:
+    """
+    根据请求耗时调整并发上限(加性增、乘性减)：耗时不超过target_latency时每个请求使上限增加1/limit，
+    即每轮增加约1；超过target_latency或出错时上限乘以backoff
+    """
+    def __init__(self, target_latency: float, min_limit: int = 1, max_limit: int = 1000,
+                 backoff: float = 0.9) -> None:
+        self.target_latency: float = target_latency
+        self.min_limit: int = min_limit
+        self.max_limit: int = max_limit
+        self.backoff: float = backoff
+
+    def update(self, limit: float, latency: float, ok: bool) -> float:
+        if ok and latency <= self.target_latency:
+            return min(limit + 1.0 / limit, float(self.max_limit))
+        return max(limit * self.backoff, float(self.min_limit))
+
+
+class _Waiter:
+    __slots__ = ('granted', 'event', 'loop', 'future')
+
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.granted: bool = False
+        self.loop: Optional[asyncio.AbstractEventLoop] = loop
+        self.event: Optional[Event] = Event() if loop is None else None
+        self.future: Any = loop.create_future() if loop is not None else None
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_wake, self.future)  # type: ignore
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class ConcurrencyLimiter:
+    """
+    限制同时处理的请求数。超过limit的请求最多max_queue个排队等待max_queue_time秒，
+    其余的立即以503和Retry-After拒绝。同步(线程)和async(event loop)的请求可以共用一个limiter，按先来先服务。
+    adaptive不为None时，limit随请求耗时自动调整
+
+    Example:
+
+        limiter = ConcurrencyLimiter(8, max_queue=32, max_queue_time=0.5, adaptive=AIMDLimit(0.2))
+        app.add_get_mapping('/report', get_report, limiter=limiter)
+    """
+    def __init__(self, limit: int, max_queue: int = 0, max_queue_time: float = 1.0,
+                 adaptive: Optional[AIMDLimit] = None, retry_after: int = 1) -> None:
+        self.limit: float = float(limit)
+        self.max_queue: int = max_queue
+        self.max_queue_time: float = max_queue_time
+        self.adaptive: Optional[AIMDLimit] = adaptive
+        self.retry_after: int = retry_after
+        self.inflight: int = 0
+        self.waiters: Deque[_Waiter] = deque()
+        self.lock: Lock = Lock()
+
+    def _try_acquire(self, waiter_loop: Any) -> Optional[_Waiter]:
+        """:return: None表示已经取得；否则返回需要等待的_Waiter；队列满时raise"""
+        with self.lock:
+            if self.inflight < int(self.limit) and not self.waiters:
+                self.inflight += 1
+                return None
+            if len(self.waiters) >= self.max_queue or self.max_queue_time <= 0:
+                raise ServiceUnavailableError(self.retry_after)
+            waiter = _Waiter(waiter_loop)
+            self.waiters.append(waiter)
+            return waiter
+
+    def _give_up(self, waiter: _Waiter) -> bool:
+        """等待超时或被取消：已经被分配时返回True(调用者持有名额)，否则离开队列"""
+        with self.lock:
+            if waiter.granted:
+                return True
+            self.waiters.remove(waiter)
+            return False
+
+    def acquire(self) -> None:
+        """在线程中等待，超过限制时raise ServiceUnavailableError"""
+        waiter = self._try_acquire(None)
+        if waiter is None:
+            return
+        waiter.event.wait(self.max_queue_time)  # type: ignore
+        if not self._give_up(waiter):
+            raise ServiceUnavailableError(self.retry_after)
+
+    async def aacquire(self) -> None:
+        """acquire的async版本，排队时不占用线程"""
+        waiter = self._try_acquire(asyncio.get_running_loop())
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_queue_time)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            if self._give_up(waiter):
+                self.release()
+            raise
+        if not self._give_up(waiter):
+            raise ServiceUnavailableError(self.retry_after)
+
+    def release(self, latency: Optional[float] = None, ok: bool = True) -> None:
+        """:param latency: 请求的处理时间(秒)，adaptive用它调整limit"""
+        with self.lock:
+            self.inflight -= 1
+            if self.adaptive is not None and latency is not None:
+                self.limit = self.adaptive.update(self.limit, latency, ok)
+            while self.waiters and self.inflight < int(self.limit):
+                self.inflight += 1
+                self.waiters.popleft().grant()
@@ -1,15 +1,28 @@
-from typing import Callable, Optional, Type, get_type_hints, Dict, Any, List, Tuple
+from typing import Callable, Optional, Type, get_type_hints, Dict, Any, Hashable, Iterable, List, Set, Tuple, cast
 
+from collections.abc import AsyncIterator, Iterator
+import inspect
 from functools import lru_cache
+from threading import RLock
 from .context import Context, Request, Response
-from .webapi import BadParamError
+from .webapi import BadParamError, HttpError
 from .bridge import ParamStr
 from .typehint import optional_core, generic_core, is_generic_type, get_origin
-from .utils import func_arg_spec
+from .utils import func_arg_spec, _nil
 from .storage import Storage
+from .jsonstream import aiter_json_array, iter_json_array
 
 
-__all__ = ['request_bridge']
+__all__ = ['request_bridge', 'model_loader', 'model_fetcher', 'BindingPlan', 'binding_plan']
+
+
+_service_types: Set[Type] = set()  # 通过Application.add_service显式注册的service
+
+
+def register_service_type(cls: Type) -> None:
+    _service_types.add(cls)
+    model_or_service.cache_clear()
+    binding_plan.cache_clear()
 
 
 @lru_cache(maxsize=None)
@@ -18,6 +31,8 @@ def model_or_service(cls: Type) -> int:
     :return: 1=Model 2=Service 0=None
     """
     try:
+        if cls in _service_types:
+            return 2
         for prop_type in get_type_hints(cls).values():
             if prop_type == int or prop_type == str:
                 return 1
@@ -33,128 +48,279 @@ def model_or_service(cls: Type) -> int:
 
 def fetch_service(ctx: Context, service_type: Type):
     """
-    :return:  cast(service_type, ctx)
-    """
-    params: Dict[str, Any] = {}
-    for realname, realtype in Storage.type_hints(service_type).items():
-        if realtype == Context:
-            params[realname] = ctx
-        elif realtype == Request:
-            params[realname] = ctx.request
-        elif realtype == Response:
-            params[realname] = ctx.response
-        elif model_or_service(realtype) == 2:
-            params[realname] = fetch_service(ctx, realtype)
-        else:
-            pass  # 其他类型不注入
-    service_obj = service_type()
-    for key, val in params.items():
-        setattr(service_obj, key, val)
-    return service_obj
+    :return:  cast(service_type, ctx)，实例的作用域由ctx.app.container决定
+    """
+    return ctx.app.container.fetch(ctx, service_type)
 
 
-def request_bridge(inputval: Any, target_type: Type):
+async def afetch_service(ctx: Context, service_type: Type):
     """
-    :return:  cast(target_type, inputval)
+    fetch_service的async版本，可以取得factory为async def的service
     """
+    return await ctx.app.container.afetch(ctx, service_type)
+
+
+_loaders: Dict[Any, Callable[[Any], Any]] = {}  # 只保存构建完成的loader，可以不加锁读取
+_building: Dict[Any, Callable[[Any], Any]] = {}  # 正在构建的loader的占位，只在持有_loaders_lock时访问
+_fetchers: Dict[Any, Callable[[Context], Any]] = {}
+_loaders_lock = RLock()
+
+
+def model_loader(target_type: Type) -> Callable[[Any], Any]:
+    """
+    :return: 按target_type预先编译好的转换函数，loader(inputval)等价于cast(target_type, inputval)
+    """
+    loader = _loaders.get(target_type)
+    if loader is None:
+        with _loaders_lock:
+            loader = _loaders.get(target_type) or _building.get(target_type)
+            if loader is None:
+                cell: List[Callable[[Any], Any]] = []
+                _building[target_type] = lambda inputval: cell[0](inputval)  # 给递归引用自身的model用
+                try:
+                    loader = _build_loader(target_type)
+                finally:
+                    del _building[target_type]
+                cell.append(loader)
+                _loaders[target_type] = loader
+    return loader
+
+
+def _build_loader(target_type: Type) -> Callable[[Any], Any]:
     if target_type == Any:
-        return inputval
+        return lambda inputval: inputval
     target_is_optional, target_type = optional_core(target_type)
-    if inputval is None:
-        if target_is_optional:
-            return None
-        else:
-            raise ValueError("Cannot assign None when expected %s" % target_type)
-    if isinstance(inputval, ParamStr):
-        if issubclass(target_type, int):
-            return target_type(int(inputval))
-        else:
-            return target_type(inputval)
-    if isinstance(inputval, dict):
-        if model_or_service(target_type) == 1:
+    is_class = isinstance(target_type, type)
+
+    if is_class and issubclass(target_type, int):
+        from_str: Callable[[ParamStr], Any] = lambda inputval: target_type(int(inputval))
+    elif is_class:
+        from_str = target_type
+    else:
+        from_str = lambda inputval: target_type(int(inputval)) if issubclass(target_type, int) \
+            else target_type(inputval)
+
+    if model_or_service(cast(Hashable, target_type)) == 1:  # issubclass收窄后mypy不认为是Hashable
+        props = [(prop_name, model_loader(prop_type))
+                 for prop_name, prop_type in Storage.type_hints(target_type).items()]
+
+        def _1_from_dict(inputval: dict) -> Any:
             target_obj = target_type()
-            for prop_name, prop_type in Storage.type_hints(target_type).items():
+            for prop_name, prop_loader in props:
                 if prop_name in inputval:
-                    prop_value = request_bridge(inputval[prop_name], prop_type)
-                    setattr(target_obj, prop_name, prop_value)
+                    setattr(target_obj, prop_name, prop_loader(inputval[prop_name]))
             return target_obj
-        else:
-            return target_type(**inputval)
-    elif isinstance(inputval, list):
-        if is_generic_type(target_type) and get_origin(target_type) == list:
-            item_type = generic_core(target_type)
-            return [request_bridge(item, item_type) for item in inputval]
-        else:
-            return target_type(*inputval)
-    elif isinstance(inputval, target_type):
-        return inputval
+        from_dict: Callable[[dict], Any] = _1_from_dict
     else:
-        return target_type(inputval)
+        from_dict = lambda inputval: target_type(**inputval)
 
-
-def fetch_model(ctx: Context, target_type: Type) -> Any:
     if is_generic_type(target_type) and get_origin(target_type) == list:
-        if not ctx.request.is_json():
-            raise ValueError("Need JSON request when expected %s" % target_type)
-        inputval = ctx.request.json_input
-        if not isinstance(inputval, list):
-            raise ValueError("Need JSON array request when expected %s" % target_type)
-        item_type = generic_core(target_type)
-        return [request_bridge(item, item_type) for item in inputval]
+        item_loader = model_loader(generic_core(target_type))
+        from_list: Callable[[list], Any] = lambda inputval: [item_loader(item) for item in inputval]
     else:
+        from_list = lambda inputval: target_type(*inputval)
+
+    def _1_load(inputval: Any) -> Any:
+        if inputval is None:
+            if target_is_optional:
+                return None
+            else:
+                raise ValueError("Cannot assign None when expected %s" % target_type)
+        if isinstance(inputval, ParamStr):
+            return from_str(inputval)
+        if isinstance(inputval, dict):
+            return from_dict(inputval)
+        elif isinstance(inputval, list):
+            return from_list(inputval)
+        elif isinstance(inputval, target_type):
+            return inputval
+        else:
+            return target_type(inputval)
+
+    return _1_load
+
+
+def request_bridge(inputval: Any, target_type: Type):
+    """
+    :return:  cast(target_type, inputval)
+    """
+    return model_loader(target_type)(inputval)
+
+
+def model_fetcher(target_type: Type) -> Callable[[Context], Any]:
+    """
+    :return: 按target_type预先编译好的函数，fetcher(ctx)从请求中读取整个model
+    """
+    fetcher = _fetchers.get(target_type)
+    if fetcher is None:
+        fetcher = _fetchers[target_type] = _build_fetcher(target_type)
+    return fetcher
+
+
+def _build_fetcher(target_type: Type) -> Callable[[Context], Any]:
+    if is_generic_type(target_type) and get_origin(target_type) == list:
+        item_loader = model_loader(generic_core(target_type))
+
+        def _1_fetch_list(ctx: Context) -> Any:
+            if not ctx.request.is_json():
+                raise ValueError("Need JSON request when expected %s" % target_type)
+            inputval = ctx.request.json_input
+            if not isinstance(inputval, list):
+                raise ValueError("Need JSON array request when expected %s" % target_type)
+            return [item_loader(item) for item in inputval]
+
+        return _1_fetch_list
+
+    if is_generic_type(target_type) and get_origin(target_type) == Iterator:
+        item_loader = model_loader(generic_core(target_type))
+
+        def _1_fetch_iter(ctx: Context) -> Any:
+            if not ctx.request.is_json():
+                raise ValueError("Need JSON request when expected %s" % target_type)
+            return _1_stream(ctx.request.body_stream(), ctx.request.encoding)
+
+        def _1_stream(chunks: Iterable[bytes], encoding: str) -> Any:
+            # body边读边解析，每次只转换一个元素
+            index = 0
+            try:
+                for item in iter_json_array(chunks, encoding):
+                    yield item_loader(item)
+                    index += 1
+            except HttpError:
+                raise
+            except Exception as e:
+                raise BadParamError(param='[%d]' % index, message=str(e))
+
+        return _1_fetch_iter
+
+    if is_generic_type(target_type) and get_origin(target_type) == AsyncIterator:
+        item_loader = model_loader(generic_core(target_type))
+
+        def _1_fetch_aiter(ctx: Context) -> Any:
+            if not ctx.request.is_json():
+                raise ValueError("Need JSON request when expected %s" % target_type)
+            return _1_astream(ctx.request.abody_stream(), ctx.request.encoding)
+
+        async def _1_astream(chunks: AsyncIterator, encoding: str) -> Any:
+            # async def的dealer用async for，读取body时不占用线程
+            index = 0
+            try:
+                async for item in aiter_json_array(chunks, encoding):
+                    yield item_loader(item)
+                    index += 1
+            except HttpError:
+                raise
+            except Exception as e:
+                raise BadParamError(param='[%d]' % index, message=str(e))
+
+        return _1_fetch_aiter
+
+    props = [(realname, model_loader(prop_type))
+             for realname, prop_type in Storage.type_hints(target_type).items()]
+
+    def _1_fetch(ctx: Context) -> Any:
         target_obj = target_type()
-        for realname, prop_type in Storage.type_hints(target_type).items():
+        for realname, prop_loader in props:
             queryname = ctx.request._aliases.get(realname, realname)
             inputval = ctx.request.get_input(queryname)
             if inputval is not None:
                 try:
-                    setattr(target_obj, realname, request_bridge(inputval, prop_type))
+                    setattr(target_obj, realname, prop_loader(inputval))
                 except Exception as e:
                     raise BadParamError(param=realname, message=str(e))
             else:
                 pass  # 不赋值&不报错
         return target_obj
 
+    return _1_fetch
 
-def fetch_param(ctx: Context, fn: Callable) -> Tuple[List, Dict[str, Any]]:
+
+def fetch_model(ctx: Context, target_type: Type) -> Any:
+    return model_fetcher(target_type)(ctx)
+
+
+def make_filler(realname: str, realtype: Type, has_default: bool, positional_only: bool) -> Callable[[Context], Any]:
     """
-    fn: dealer function
-    return: Dict[realname, Context|Request|Response|Model|...]
+    :return: 从ctx取得参数值的函数，返回_nil表示不赋值
     """
-    args: List = []
-    kwargs: Dict[str, Any] = {}
-    for realname, (realtype, has_default, positional_only) in func_arg_spec(fn).items():
-        value: Any
-        if realtype == Context:
-            value = ctx
-        elif realtype == Request:
-            value = ctx.request
-        elif realtype == Response:
-            value = ctx.response
-        elif model_or_service(realtype) == 2:
-            value = fetch_service(ctx, realtype)
+    if realtype == Context:
+        return lambda ctx: ctx
+    elif realtype == Request:
+        return lambda ctx: ctx.request
+    elif realtype == Response:
+        return lambda ctx: ctx.response
+    elif model_or_service(realtype) == 2:
+        return lambda ctx: ctx.app.container.fetch(ctx, realtype)
+    _, realtype = optional_core(realtype)
+    if realtype != Any and not isinstance(realtype, type) and not is_generic_type(realtype):
+        raise TypeError('Unsupported type %s of param %s' % (realtype, realname))
+    if positional_only:
+        return model_fetcher(realtype)
+    convert = model_loader(realtype)
+
+    def _1_filler(ctx: Context) -> Any:
+        queryname = ctx.request._aliases.get(realname, realname)
+        inputval = ctx.request.get_input(queryname)
+        if inputval is not None:
+            try:
+                return convert(inputval)
+            except Exception as e:
+                raise BadParamError(param=realname, message=str(e))
+        elif not has_default:
+            raise BadParamError(param=realname, message='Missing required param')
         else:
-            _, realtype = optional_core(realtype)
-            if not isinstance(realtype, type) and not is_generic_type(realtype):
-                raise BadParamError(param=realname, message='Unsupported type %s' % realtype)
+            return _nil  # 不赋值&不报错
+
+    return _1_filler
+
+
+class BindingPlan:
+    """
+    dealer的参数绑定计划：注册时分析一次签名，请求时依次调用各参数的filler
+    """
+    def __init__(self, fn: Callable) -> None:
+        self.arg_fillers: List[Callable[[Context], Any]] = []
+        self.kwarg_fillers: List[Tuple[str, Callable[[Context], Any]]] = []
+        self.service_types: List[Type] = []
+        self.reads_body: bool = False  # 是否有参数需要从请求输入(可能是body)中读取
+        is_async = inspect.iscoroutinefunction(fn)
+        for realname, (realtype, has_default, positional_only) in func_arg_spec(fn).items():
+            filler = make_filler(realname, realtype, has_default, positional_only)
+            stream_type = get_origin(realtype) if is_generic_type(realtype) else None
+            if stream_type == Iterator and is_async:
+                raise TypeError('Param %s of async def %s should be AsyncIterator[...]: '
+                                'Iterator reads the body synchronously' % (realname, fn.__name__))
+            if stream_type == AsyncIterator and not is_async:
+                raise TypeError('Param %s of %s needs an async def dealer' % (realname, fn.__name__))
+            if model_or_service(realtype) == 2:
+                self.service_types.append(realtype)
+            elif stream_type == AsyncIterator:
+                pass  # 绑定时不读取body，dealer中async for时才读取
+            elif realtype not in (Context, Request, Response):
+                self.reads_body = True
             if positional_only:
-                value = fetch_model(ctx, realtype)
+                self.arg_fillers.append(filler)
             else:
-                queryname = ctx.request._aliases.get(realname, realname)
-                inputval = ctx.request.get_input(queryname)
-                if inputval is not None:
-                    try:
-                        value = request_bridge(inputval, realtype)
-                    except Exception as e:
-                        raise BadParamError(param=realname, message=str(e))
-                elif not has_default:
-                    raise BadParamError(param=realname, message='Missing required param')
-                else:
-                    continue  # 不赋值&不报错
-        # 将value追加到args或kwargs
-        if positional_only:
-            args.append(value)
-        else:
-            kwargs[realname] = value
+                self.kwarg_fillers.append((realname, filler))
 
-    return args, kwargs
+    def bind(self, ctx: Context) -> Tuple[List, Dict[str, Any]]:
+        args = [filler(ctx) for filler in self.arg_fillers]
+        kwargs: Dict[str, Any] = {}
+        for realname, filler in self.kwarg_fillers:
+            value = filler(ctx)
+            if value is not _nil:
+                kwargs[realname] = value
+        return args, kwargs
+
+
+@lru_cache(maxsize=None)
+def binding_plan(fn: Callable) -> BindingPlan:
+    return BindingPlan(fn)
+
+
+def fetch_param(ctx: Context, fn: Callable) -> Tuple[List, Dict[str, Any]]:
+    """
+    fn: dealer function
+    return: Dict[realname, Context|Request|Response|Model|...]
+    """
+    return binding_plan(fn).bind(ctx)
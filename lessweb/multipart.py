@@ -0,0 +1,113 @@
+"""
+Streaming multipart/form-data parser
+(from lessweb)
+"""
+from email.message import Message
+from email.utils import collapse_rfc2231_value
+from io import BytesIO
+from tempfile import SpooledTemporaryFile
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .bridge import ParamStr, MultipartFile
+
+
+__all__ = ["SPOOL_SIZE", "MAX_HEADER_SIZE", "multipart_boundary", "parse_multipart"]
+
+
+SPOOL_SIZE = 1024 * 1024  # 上传文件超过这个大小就写到临时文件
+MAX_HEADER_SIZE = 16 * 1024  # 每个part的header上限
+
+
+def multipart_boundary(content_type: str) -> Optional[bytes]:
+    """
+        >>> multipart_boundary('multipart/form-data; boundary="----abc"')
+        b'----abc'
+        >>> multipart_boundary('application/x-www-form-urlencoded') is None
+        True
+
+    """
+    if not content_type.lower().startswith('multipart/'):
+        return None
+    msg = Message()
+    msg['Content-Type'] = content_type
+    boundary = msg.get_param('boundary')
+    if not boundary or not isinstance(boundary, str):
+        return None
+    return boundary.encode('latin-1')
+
+
+def _parse_part_headers(block: bytes, encoding: str) -> Tuple[Optional[str], Optional[str], str]:
+    """
+    :return: (name, filename, content_type)，filename为None表示不是文件
+    """
+    msg = Message()
+    for line in block.decode(encoding, 'replace').split('\r\n'):
+        if ':' in line:
+            key, val = line.split(':', 1)
+            msg[key.strip()] = val.strip()
+    name = msg.get_param('name', header='content-disposition')
+    return (collapse_rfc2231_value(name) if name is not None else None,  # type: ignore
+            msg.get_filename(),
+            msg.get('Content-Type', ''))
+
+
+def parse_multipart(chunks: Iterable[bytes], boundary: bytes, encoding: str,
+                    form_input: Dict[str, List[ParamStr]], file_input: Dict[str, List[MultipartFile]],
+                    spool_size: int = SPOOL_SIZE) -> None:
+    """
+    逐块解析multipart body：普通字段放进form_input，文件放进file_input。
+    文件内容写入SpooledTemporaryFile，超过spool_size时落盘，所以内存占用与上传大小无关
+    """
+    delimiter = b'\r\n--' + boundary
+    keep = len(delimiter) - 1
+    chunk_iter = iter(chunks)
+    buf = b'\r\n'  # 让第一个分隔符也以\r\n开头
+
+    def _1_more() -> bytes:
+        for chunk in chunk_iter:
+            if chunk:
+                return chunk
+        raise ValueError('multipart body is truncated')
+
+    # skip preamble
+    while True:
+        idx = buf.find(delimiter)
+        if idx >= 0:
+            buf = buf[idx + len(delimiter):]
+            break
+        buf = buf[-keep:] + _1_more()
+
+    while True:
+        while len(buf) < 2:
+            buf += _1_more()
+        if buf[:2] == b'--':  # close delimiter
+            return
+        while True:
+            idx = buf.find(b'\r\n\r\n')
+            if idx >= 0:
+                break
+            if len(buf) > MAX_HEADER_SIZE:
+                raise ValueError('multipart header is too large')
+            buf += _1_more()
+        name, filename, content_type = _parse_part_headers(buf[:idx], encoding)
+        buf = buf[idx + 4:]
+        sink = BytesIO() if filename is None else SpooledTemporaryFile(max_size=spool_size)
+        while True:
+            idx = buf.find(delimiter)
+            if idx >= 0:
+                sink.write(buf[:idx])
+                buf = buf[idx + len(delimiter):]
+                break
+            if len(buf) > keep:
+                sink.write(buf[:-keep])
+                buf = buf[-keep:]
+            buf += _1_more()
+        if name is None:
+            continue
+        if filename is None:
+            form_input.setdefault(name, [])
+            form_input[name].append(ParamStr(sink.getvalue().decode(encoding, 'replace')))  # type: ignore
+        else:
+            sink.seek(0)
+            file_input.setdefault(name, [])
+            file_input[name].append(MultipartFile(filename=filename, file=sink, content_type=content_type))
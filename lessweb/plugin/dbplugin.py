@@ -2,7 +2,7 @@ from typing import Type, TypeVar, Iterable, List, Iterator, Generic, Optional, U
 from enum import Enum
 from contextlib import contextmanager
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.orm.session import Session
 
@@ -10,6 +10,8 @@ from ..context import Context
 from ..application import Application
 from ..storage import Storage
 from ..typehint import optional_core
+from ..webapi import GatewayTimeoutError
+from ..utils import eafp
 
 
 __all__ = ["DbPlugin", "DbServ", "Mapper"]
@@ -23,6 +25,9 @@ class DbPlugin:
     patterns: Iterable[str]
     db_session_maker: Any
     db_engine: Any
+    uri: str
+    echo: bool
+    autoflush: bool
     autocommit: bool
 
     def __init__(self,
@@ -34,28 +39,57 @@ class DbPlugin:
         self.patterns = patterns
         if '://' not in uri:
             uri = 'sqlite:///' + uri
-        engine = create_engine(uri, pool_recycle=3600)
-        engine.echo = echo
+        self.uri = uri
+        self.echo = echo
+        self.autoflush = autoflush
+        self.autocommit = autocommit
+        self._connect()
+
+    def _connect(self):
+        engine = create_engine(self.uri, pool_recycle=3600)
+        engine.echo = self.echo
         self.db_session_maker = scoped_session(sessionmaker(
-                autoflush=autoflush, autocommit=autocommit, bind=engine))
+                autoflush=self.autoflush, autocommit=self.autocommit, bind=engine))
         self.db_engine = engine
-        self.autocommit = autocommit
 
     def processor(self, ctx: Context):
         db = self.db_session_maker()
+        remaining = ctx.remaining()
+        timeout_set = False
         try:
             ctx.box[DatabaseKey.session] = db
             if self.autocommit:
                 with db.begin():
+                    timeout_set = remaining is not None and self._set_statement_timeout(db, remaining)
                     return ctx()
             else:
+                timeout_set = remaining is not None and self._set_statement_timeout(db, remaining)
                 return ctx()
-        except:
+        except BaseException as e:
             db.rollback()
+            if ctx.deadline is not None and ctx.remaining() == 0:
+                raise GatewayTimeoutError() from e
             raise
         finally:
+            if timeout_set and self.db_engine.dialect.name == 'mysql':
+                eafp(lambda: db.execute(text('SET SESSION max_execution_time = 0')), None)  # 连接会回到连接池
             db.close()
 
+    def _set_statement_timeout(self, db: Session, remaining: float) -> bool:
+        """
+        把ctx.remaining()设置为数据库语句的超时：PostgreSQL用statement_timeout(当前事务内)，
+        MySQL用max_execution_time(只对SELECT有效)；其他数据库不支持，返回False
+        """
+        ms = max(int(remaining * 1000), 1)
+        dialect = self.db_engine.dialect.name
+        if dialect == 'postgresql':
+            db.execute(text('SET LOCAL statement_timeout = %d' % ms))
+        elif dialect == 'mysql':
+            db.execute(text('SET SESSION max_execution_time = %d' % ms))
+        else:
+            return False
+        return True
+
     def init_app(self, app: Application):
         for pattern in self.patterns:
             segs = pattern.split()
@@ -67,6 +101,11 @@ class DbPlugin:
     def teardown(self, exception: Exception):
         pass
 
+    def post_fork(self):
+        """子进程不能使用从父进程继承的连接池：丢弃它(不关闭父进程的连接)并重新创建engine"""
+        self.db_engine.dispose(close=False)
+        self._connect()
+
     @contextmanager
     def make_session(self) -> Iterator[Session]:
         session: Session = self.db_session_maker()
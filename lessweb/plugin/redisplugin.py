@@ -1,31 +1,67 @@
-from typing import Iterable
+from typing import Any, Dict, Iterable, Optional
 from enum import Enum
 from redis import Redis, ConnectionPool
+from redis.exceptions import TimeoutError as RedisTimeoutError
 
 from ..context import Context
 from ..application import Application
+from ..webapi import GatewayTimeoutError
 
 
-__all__ = ["RedisPlugin", "RedisServ"]
+__all__ = ["DeadlineRedis", "RedisPlugin", "RedisServ"]
 
 
 class RedisKey(Enum):
     session = 1
 
 
+class DeadlineRedis(Redis):
+    """
+    每个命令等待响应的socket timeout不超过ctx.remaining()；已经超时或者因此超时时raise GatewayTimeoutError
+    """
+    ctx: Optional[Context] = None
+
+    def parse_response(self, connection, command_name, **options):
+        remaining = self.ctx.remaining() if self.ctx is not None else None
+        if remaining is None:
+            return super().parse_response(connection, command_name, **options)
+        if remaining <= 0:
+            raise GatewayTimeoutError()
+        sock = getattr(connection, '_sock', None)
+        if sock is not None and (connection.socket_timeout is None or remaining < connection.socket_timeout):
+            sock.settimeout(remaining)
+        try:
+            return super().parse_response(connection, command_name, **options)
+        except RedisTimeoutError as e:
+            if self.ctx.remaining() == 0:  # type: ignore
+                raise GatewayTimeoutError() from e
+            raise
+        finally:
+            sock = getattr(connection, '_sock', None)  # 超时后连接会被断开
+            if sock is not None:
+                sock.settimeout(connection.socket_timeout)
+
+
 class RedisPlugin:
     redis_pool: ConnectionPool
+    redis_options: Dict[str, Any]
     patterns: Iterable[str]
 
     def __init__(self, host: str, port: int=6379, db: int=0, password: str=None, patterns: Iterable[str]=('.*',)):
         if password is None:
-            self.redis_pool = ConnectionPool(host=host, port=port, db=db)
+            self.redis_options = dict(host=host, port=port, db=db)
         else:
-            self.redis_pool = ConnectionPool(host=host, port=port, db=db, password=password)
+            self.redis_options = dict(host=host, port=port, db=db, password=password)
+        self.redis_pool = ConnectionPool(**self.redis_options)
         self.patterns = patterns
 
     def processor(self, ctx: Context):
-        ctx.box[RedisKey.session] = Redis(connection_pool=self.redis_pool)
+        if ctx.deadline is None:
+            ctx.box[RedisKey.session] = Redis(connection_pool=self.redis_pool)
+        else:
+            client = DeadlineRedis(connection_pool=self.redis_pool)
+            client.ctx = ctx
+            ctx.box[RedisKey.session] = client
         return ctx()
 
     def init_app(self, app: Application) -> None:
@@ -39,6 +75,10 @@ class RedisPlugin:
     def teardown(self, exception: Exception) -> None:
         pass
 
+    def post_fork(self) -> None:
+        """每个子进程使用自己的连接池"""
+        self.redis_pool = ConnectionPool(**self.redis_options)
+
 
 class RedisServ:
     ctx: Context
@@ -16,3 +16,7 @@ class PluginProto(Protocol):
 
     def teardown(self, exception: Exception) -> None:
         ...
+
+    def post_fork(self) -> None:
+        """可选：app.run(workers=N)在每个子进程启动时调用，用来重新创建不能跨fork共享的连接池等资源"""
+        ...
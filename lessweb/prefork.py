@@ -0,0 +1,106 @@
+"""
+Prefork multi-process runner
+(from lessweb)
+"""
+import gc
+import logging
+import os
+import signal
+import socket
+import time
+import traceback
+from typing import Callable, Dict, Optional
+
+
+__all__ = ["listen_socket", "Supervisor"]
+
+
+def listen_socket(host: str, port: int, reuse_port: bool = False, backlog: int = 1024) -> socket.socket:
+    """
+    :param reuse_port: 为True时设置SO_REUSEPORT，每个worker各自listen同一个端口，由内核分配连接
+    """
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)  # type: ignore
+        sock.bind((host, port))
+        sock.listen(backlog)
+        sock.setblocking(False)
+    except:
+        sock.close()
+        raise
+    return sock
+
+
+class Supervisor:
+    """
+    父进程fork出workers个子进程执行worker(index)，子进程退出时重新fork同一个index。
+    fork之前gc.freeze()，父进程中已经创建的对象不会被子进程的gc扫描，保持copy-on-write共享。
+    父进程收到SIGINT/SIGTERM时把SIGTERM转发给子进程，等它们退出后返回
+
+    Example:
+
+        Supervisor(lambda index: serve_forever(), workers=4).run()
+    """
+    def __init__(self, worker: Callable[[int], None], workers: int, restart_delay: float = 1.0) -> None:
+        self.worker: Callable[[int], None] = worker
+        self.workers: int = workers
+        self.restart_delay: float = restart_delay  # 启动不到这么久就退出的worker，等待后再重启，避免反复崩溃
+        self.children: Dict[int, int] = {}  # pid => index
+        self.started: Dict[int, float] = {}  # pid => 启动时间
+        self.stopping: bool = False
+
+    def spawn(self, index: int) -> int:
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                self.worker(index)
+            except SystemExit as e:
+                code = e.code if isinstance(e.code, int) else 0
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        self.children[pid] = index
+        self.started[pid] = time.monotonic()
+        return pid
+
+    def stop(self, signum: int = signal.SIGTERM, frame: Optional[object] = None) -> None:
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        gc.collect()
+        gc.freeze()
+        handlers = {signum: signal.signal(signum, self.stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            for first_index in range(self.workers):  # 不与下面Optional的index共用类型
+                self.spawn(first_index)
+            while self.children:
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+                index = self.children.pop(pid, None)
+                started = self.started.pop(pid, 0.0)
+                if index is None or self.stopping:
+                    continue
+                logging.warning('worker %d (pid %d) exited with status %d, restarting',
+                                index, pid, os.waitstatus_to_exitcode(status))
+                if time.monotonic() - started < self.restart_delay:
+                    time.sleep(self.restart_delay)
+                if not self.stopping:
+                    self.spawn(index)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+            gc.unfreeze()
@@ -0,0 +1,139 @@
+"""
+Route lookup
+(from lessweb)
+"""
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .webapi import NotFoundError
+
+
+__all__ = ["split_pattern", "Router"]
+
+
+_param_re = re.compile(r'\{([^0-9{}][^{}]*)\}')  # 整段只有一个{name}；'{a}{b}'这类段交给正则route
+_regex_chars = frozenset('.^$*+?{}[]\\|()')
+
+
+def split_pattern(pattern: str) -> Optional[List[Tuple[bool, str]]]:
+    """
+    把只由静态段和{name}段组成的pattern拆成[(is_param, text)]，其他真正的正则返回None
+
+        >>> split_pattern('/add/{x}/{y}')
+        [(False, ''), (False, 'add'), (True, 'x'), (True, 'y')]
+        >>> split_pattern('^/hello/$')
+        [(False, ''), (False, 'hello'), (False, '')]
+        >>> split_pattern('/file-{id}') is None
+        True
+        >>> split_pattern('/x/{a}{b}') is None
+        True
+        >>> split_pattern('/api/(?P<m>.*)/index.php') is None
+        True
+
+    """
+    if pattern.startswith('^'):
+        pattern = pattern[1:]
+    if pattern.endswith('$'):
+        pattern = pattern[:-1]
+    segments: List[Tuple[bool, str]] = []
+    for seg in pattern.split('/'):
+        param = _param_re.fullmatch(seg)
+        if param:
+            segments.append((True, param.group(1)))
+        elif _regex_chars.isdisjoint(seg):
+            segments.append((False, seg))
+        else:
+            return None
+    return segments
+
+
+class _Node:
+    __slots__ = ('static', 'param', 'routes')
+
+    def __init__(self) -> None:
+        self.static: Dict[str, '_Node'] = {}
+        self.param: Optional['_Node'] = None
+        self.routes: List[Tuple[int, Tuple[str, ...]]] = []  # [(order, param_names)]
+
+
+class Router:
+    """
+    按注册顺序做first-match的路由表。
+    静态段和{name}段的route放在按path段分层的trie里，只有真正的正则route才逐个search。
+    route需要有pattern、patternobj、method三个属性(即Mapping)
+    """
+    def __init__(self) -> None:
+        self.routes: List[Any] = []
+        self._root: _Node = _Node()
+        self._regex_orders: List[int] = []
+
+    def add(self, route: Any) -> None:
+        order = len(self.routes)
+        self.routes.append(route)
+        segments = split_pattern(route.pattern)
+        if segments is None:
+            self._regex_orders.append(order)
+            return
+        node = self._root
+        names = []
+        for is_param, text in segments:
+            if is_param:
+                if node.param is None:
+                    node.param = _Node()
+                node = node.param
+                names.append(text)
+            else:
+                node = node.static.setdefault(text, _Node())
+        node.routes.append((order, tuple(names)))
+
+    def _trie_match(self, path: str) -> List[Tuple[int, Dict[str, str]]]:
+        found: List[Tuple[int, Dict[str, str]]] = []
+        parts = path.split('/')
+        depth = len(parts)
+
+        def _1_walk(node: _Node, i: int, values: List[str]) -> None:
+            if i == depth:
+                for order, names in node.routes:
+                    found.append((order, dict(zip(names, values))))
+                return
+            part = parts[i]
+            child = node.static.get(part)
+            if child is not None:
+                _1_walk(child, i + 1, values)
+            if node.param is not None and part:
+                values.append(part)
+                _1_walk(node.param, i + 1, values)
+                values.pop()
+
+        _1_walk(self._root, 0, [])
+        found.sort(key=lambda x: x[0])
+        return found
+
+    def _candidates(self, path: str) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """按注册顺序产出匹配path的(order, groupdict)，正则route只在轮到它时才search"""
+        trie_found = self._trie_match(path)
+        regex_orders = self._regex_orders
+        i = j = 0
+        while i < len(trie_found) or j < len(regex_orders):
+            if j == len(regex_orders) or (i < len(trie_found) and trie_found[i][0] < regex_orders[j]):
+                yield trie_found[i]
+                i += 1
+            else:
+                order = regex_orders[j]
+                j += 1
+                matched = self.routes[order].patternobj.search(path)
+                if matched:
+                    yield order, matched.groupdict()
+
+    def lookup(self, path: str, method: str) -> Tuple[Any, Dict[str, Any]]:
+        """
+        :return: (route, groupdict)，找不到时raise NotFoundError(带上path匹配但method不匹配的methods)
+        """
+        supported_methods = []
+        for order, groupdict in self._candidates(path):
+            route = self.routes[order]
+            if route.method == method or route.method == '*':
+                return route, groupdict
+            elif route.method != 'OPTIONS':
+                supported_methods.append(route.method)
+        raise NotFoundError(methods=supported_methods)
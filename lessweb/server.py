@@ -0,0 +1,473 @@
+"""
+Native asyncio HTTP/1.1 server
+(from lessweb)
+"""
+import asyncio
+from email.utils import formatdate
+import logging
+import signal
+import socket
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote
+
+from .aio import _header_environ, aclose_body, aiter_body
+from .background import DRAIN_TIMEOUT
+from .context import Context
+from .webapi import HttpError, HttpStatus
+
+
+__all__ = ["MAX_HEAD_SIZE", "KEEPALIVE_TIMEOUT", "READ_TIMEOUT", "DISCARD_LIMIT", "BadRequest",
+           "MalformedBodyError", "parse_head", "BodyReader", "HttpProtocol", "serve", "run_server"]
+
+
+MAX_HEAD_SIZE = 64 * 1024  # 请求行加header的最大字节数，超过时响应431
+KEEPALIVE_TIMEOUT = 15.0  # keep-alive连接空闲的最长秒数
+READ_TIMEOUT = 30.0  # 读取请求header和body时，每次等待数据的最长秒数，超过时关闭连接
+DISCARD_LIMIT = 64 * 1024  # dealer没有读完的body不超过这个大小时读掉并保持连接，否则关闭连接
+_HIGH_WATER = 256 * 1024  # 缓冲区超过这个大小时暂停读socket
+_NO_BODY_STATUS = (b'1', b'204', b'304')
+
+
+class BadRequest(Exception):
+    def __init__(self, status: str = '400 Bad Request') -> None:
+        super().__init__(status)
+        self.status: str = status
+
+
+class MalformedBodyError(HttpError):
+    """body的分块格式错误或在结束之前断开，dealer读取body时抛出，响应400并关闭连接"""
+    def __init__(self) -> None:
+        super().__init__(HttpStatus.BadRequest, 'Malformed request body')
+
+
+_date = [0, b'']
+
+
+def _date_header() -> bytes:
+    """每秒只格式化一次Date"""
+    now = int(time.time())
+    if _date[0] != now:
+        _date[0], _date[1] = now, ('Date: %s\r\n' % formatdate(now, usegmt=True)).encode('latin-1')
+    return _date[1]  # type: ignore
+
+
+def parse_head(head: bytes) -> Tuple[str, str, str, List[Tuple[str, str]]]:
+    """
+    :return: (method, target, version, headers)
+
+        >>> parse_head(b'GET /a?b=1 HTTP/1.1\\r\\nHost: x\\r\\nAccept:  */* ')
+        ('GET', '/a?b=1', 'HTTP/1.1', [('Host', 'x'), ('Accept', '*/*')])
+
+    """
+    lines = head.decode('latin-1').split('\r\n')
+    parts = lines[0].split(' ')
+    if len(parts) != 3 or not parts[0].isalpha() or not parts[1] or parts[2] not in ('HTTP/1.1', 'HTTP/1.0'):
+        raise BadRequest()
+    headers = []
+    for line in lines[1:]:
+        name, sep, value = line.partition(':')
+        if not sep or not name or name != name.strip() or line[0] in ' \t':
+            raise BadRequest()  # 不接受obs-fold和header名前后的空白(request smuggling)
+        headers.append((name, value.strip(' \t')))
+    return parts[0], parts[1], parts[2], headers
+
+
+class BodyReader:
+    """
+    从连接的缓冲区读取一个请求的body(Content-Length或chunked)，read(size)读到末尾时返回b''。
+    请求有Expect: 100-continue时，第一次read之前发送100 Continue
+    """
+    def __init__(self, protocol: 'HttpProtocol', length: Optional[int], chunked: bool, expect: bool) -> None:
+        self.protocol: 'HttpProtocol' = protocol
+        self.length: Optional[int] = length  # chunked时为当前chunk剩余的字节数
+        self.chunked: bool = chunked
+        self.expect: bool = expect
+        self.done: bool = not chunked and not length
+        self.broken: bool = False  # 分块格式错误，连接上剩余的数据无法解析，只能关闭连接
+
+    async def _chunk_size(self) -> int:
+        line = await self.protocol.read_line(4096)
+        if line is None:
+            raise BadRequest()
+        try:
+            return int(line.split(b';', 1)[0].strip(), 16)
+        except ValueError:
+            raise BadRequest()
+
+    async def read(self, size: int = -1) -> bytes:
+        if self.broken:
+            raise MalformedBodyError()
+        if self.done:
+            return b''
+        if self.expect:
+            self.expect = False
+            self.protocol.transport.write(b'HTTP/1.1 100 Continue\r\n\r\n')  # type: ignore
+        try:
+            return await self._read(size)
+        except BadRequest:
+            self.broken = True
+            raise MalformedBodyError() from None
+
+    async def _read(self, size: int) -> bytes:
+        chunks = []
+        while not self.done and (size < 0 or size > 0):
+            if self.chunked and not self.length:
+                if self.length == 0 and await self.protocol.read_line(2) != b'':  # chunk之后的CRLF
+                    raise BadRequest()
+                self.length = await self._chunk_size()
+                if self.length == 0:
+                    while await self.protocol.read_line(MAX_HEAD_SIZE):  # 忽略trailer
+                        pass
+                    self.done = True
+                    break
+            data = await self.protocol.read_some(self.length if size < 0 else min(size, self.length))  # type: ignore
+            if not data:
+                raise BadRequest()  # 连接在body结束之前关闭
+            self.length -= len(data)  # type: ignore
+            if size > 0:
+                size -= len(data)
+            chunks.append(data)
+            if not self.chunked and self.length == 0:
+                self.done = True
+            if size > 0 and chunks and not self.protocol.buffer:
+                break  # 已经有数据，不再等待
+        return b''.join(chunks)
+
+    async def discard(self) -> bool:
+        """:return: 读掉剩余的body后返回True；超过DISCARD_LIMIT或出错时返回False，调用者应该关闭连接"""
+        total = 0
+        try:
+            while not self.done:
+                data = await self.read(DISCARD_LIMIT)
+                total += len(data)
+                if total > DISCARD_LIMIT:
+                    return False
+        except MalformedBodyError:
+            return False
+        return True
+
+
+class HttpProtocol(asyncio.Protocol):
+    """
+    一个连接上的请求按顺序处理(pipelining的响应也按顺序发送)，请求直接解析成Request.load需要的environ，
+    由app.handle_async处理，响应用transport.writelines发送
+    """
+    def __init__(self, app: Any, homepath: str = '', keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+                 read_timeout: float = READ_TIMEOUT) -> None:
+        self.app: Any = app
+        self.homepath: str = homepath
+        self.keepalive_timeout: float = keepalive_timeout
+        self.read_timeout: float = read_timeout
+        self.idle: bool = True  # 在等待下一个请求，还没有收到它的数据
+        self.transport: Optional[asyncio.Transport] = None
+        self.buffer: bytearray = bytearray()
+        self.eof: bool = False
+        self.reading_paused: bool = False
+        self.waiter: Optional[asyncio.Future] = None  # 等待更多数据
+        self.drainer: Optional[asyncio.Future] = None  # 等待transport可写
+        self.writing_paused: bool = False
+        self.env_base: Dict = {}
+        self.task: Optional[asyncio.Task] = None
+
+    # asyncio.Protocol回调
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport  # type: ignore
+        sock = transport.get_extra_info('socket')
+        if sock is not None and sock.family in (socket.AF_INET, socket.AF_INET6):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        peername = transport.get_extra_info('peername')
+        self.env_base = {
+            'SCRIPT_NAME': self.homepath,
+            'REMOTE_ADDR': peername[0] if isinstance(peername, tuple) else '0.0.0.0',
+            'wsgi.url_scheme': 'https' if transport.get_extra_info('sslcontext') else 'http',
+        }
+        self.task = asyncio.get_running_loop().create_task(self.serve())
+
+    def data_received(self, data: bytes) -> None:
+        self.idle = False
+        self.buffer += data
+        if len(self.buffer) > _HIGH_WATER and not self.reading_paused:
+            self.reading_paused = True
+            self.transport.pause_reading()  # type: ignore
+        self._wake()
+
+    def eof_received(self) -> bool:
+        self.eof = True
+        self._wake()
+        return True  # 保持连接，发送完pipelining中剩余的响应
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self.eof = True
+        self._wake()
+        if self.drainer is not None and not self.drainer.done():
+            self.drainer.set_result(None)
+
+    def pause_writing(self) -> None:
+        self.writing_paused = True
+
+    def resume_writing(self) -> None:
+        self.writing_paused = False
+        if self.drainer is not None and not self.drainer.done():
+            self.drainer.set_result(None)
+
+    def _wake(self) -> None:
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    # 读写
+
+    async def _fill(self) -> bool:
+        """
+        等待更多数据，连接已关闭时返回False。
+        空闲时最多等待keepalive_timeout秒，读取请求的过程中每次最多等待read_timeout秒，超时时关闭连接(防止slowloris)
+        """
+        if self.eof:
+            return False
+        if self.reading_paused:
+            self.reading_paused = False
+            self.transport.resume_reading()  # type: ignore
+        loop = asyncio.get_running_loop()
+        self.waiter = loop.create_future()
+        # call_later比wait_for便宜
+        timer = loop.call_later(self.keepalive_timeout if self.idle else self.read_timeout,
+                                self.transport.close)  # type: ignore
+        try:
+            await self.waiter
+        finally:
+            timer.cancel()
+            self.waiter = None
+        return True
+
+    def _consume(self, size: int) -> bytes:
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        if self.reading_paused and len(self.buffer) < _HIGH_WATER:
+            self.reading_paused = False
+            self.transport.resume_reading()  # type: ignore
+        return data
+
+    async def read_some(self, size: int) -> bytes:
+        """最多读取size字节，连接关闭时返回b''"""
+        while not self.buffer:
+            if not await self._fill():
+                return b''
+        return self._consume(size)
+
+    async def read_line(self, limit: int) -> Optional[bytes]:
+        """读取一行(不含CRLF)，连接关闭时返回None"""
+        while True:
+            index = self.buffer.find(b'\r\n')
+            if index >= 0:
+                line = self._consume(index + 2)[:-2]
+                return line
+            if len(self.buffer) > limit:
+                raise BadRequest()
+            if not await self._fill():
+                return None
+
+    async def _read_head(self) -> Optional[bytes]:
+        while True:
+            while self.buffer[:2] == b'\r\n':  # 忽略请求之间多余的空行
+                del self.buffer[:2]
+            index = self.buffer.find(b'\r\n\r\n')
+            if index >= 0:
+                return self._consume(index + 4)[:-4]
+            if len(self.buffer) > MAX_HEAD_SIZE:
+                raise BadRequest('431 Request Header Fields Too Large')
+            if not await self._fill():
+                if self.buffer:
+                    raise BadRequest()
+                return None
+
+    async def drain(self) -> None:
+        if self.writing_paused and not self.transport.is_closing():  # type: ignore
+            self.drainer = asyncio.get_running_loop().create_future()
+            try:
+                await self.drainer
+            finally:
+                self.drainer = None
+
+    # 请求处理
+
+    def _environ(self, method: str, target: str, version: str, headers: List[Tuple[str, str]]) -> Dict:
+        path, _, query = target.partition('?')
+        if self.homepath:
+            if path != self.homepath and not path.startswith(self.homepath + '/'):
+                raise BadRequest('404 Not Found')
+            path = path[len(self.homepath):]
+        env = dict(self.env_base)
+        env.update({
+            'REQUEST_METHOD': method,
+            'PATH_INFO': unquote(path, encoding='latin-1'),
+            'QUERY_STRING': query,
+            'REQUEST_URI': target,
+            'SERVER_PROTOCOL': version,
+        })
+        _header_environ(env, headers)
+        return env
+
+    def _body_reader(self, env: Dict, version: str) -> BodyReader:
+        te = env.pop('HTTP_TRANSFER_ENCODING', None)
+        cl = env.get('CONTENT_LENGTH')
+        chunked = False
+        if te is not None:
+            if cl is not None or te.lower().split(',')[-1].strip() != 'chunked':
+                raise BadRequest()  # 同时有Content-Length和Transfer-Encoding可能是request smuggling
+            env['HTTP_TRANSFER_ENCODING'] = te
+            chunked = True
+        length = None
+        if cl is not None:
+            if not cl.isdigit():
+                raise BadRequest()
+            length = int(cl)
+        expect = version == 'HTTP/1.1' and env.get('HTTP_EXPECT', '').lower() == '100-continue'
+        return BodyReader(self, length, chunked, expect and (chunked or bool(length)))
+
+    @staticmethod
+    def _keep_alive(env: Dict, version: str) -> bool:
+        connection = env.get('HTTP_CONNECTION', '').lower()
+        if version == 'HTTP/1.1':
+            return 'close' not in connection
+        return 'keep-alive' in connection
+
+    async def serve(self) -> None:
+        try:
+            keep_alive = True
+            while keep_alive and not self.transport.is_closing():  # type: ignore
+                try:
+                    self.idle = not self.buffer
+                    head = await self._read_head()
+                    if head is None:
+                        break
+                    method, target, version, headers = parse_head(head)
+                    env = self._environ(method, target, version, headers)
+                    reader = self._body_reader(env, version)
+                except BadRequest as e:
+                    self._write_error(e.status)
+                    break
+                keep_alive = await self.respond(env, method, version, reader)
+                if keep_alive:
+                    keep_alive = await reader.discard()
+        except Exception:
+            logging.exception('Unhandled error on connection')
+        finally:
+            if not self.transport.is_closing():  # type: ignore
+                self.transport.close()  # type: ignore
+
+    def _write_error(self, status: str) -> None:
+        if not self.transport.is_closing():  # type: ignore
+            self.transport.write(('HTTP/1.1 %s\r\nContent-Length: 0\r\nConnection: close\r\n' % status)  # type: ignore
+                                 .encode('latin-1') + _date_header() + b'\r\n')
+
+    async def respond(self, env: Dict, method: str, version: str, reader: BodyReader) -> bool:
+        """:return: 是否保持连接"""
+        app = self.app
+        ctx = Context(app)
+        ctx.request.load(env)
+        keep_alive = self._keep_alive(env, version)
+        status_text, headers, body = await app.handle_async(ctx, reader.read)
+        if reader.broken:
+            keep_alive = False
+        head = ['HTTP/1.1 ', status_text, '\r\n']
+        has_length = False
+        for name, value in headers:
+            if name.lower() == 'content-length':
+                has_length = True
+            head += [name, ': ', value, '\r\n']
+        no_body = method == 'HEAD' or status_text.encode('latin-1').startswith(_NO_BODY_STATUS)
+        chunked = False
+        if not isinstance(body, list) and not has_length and not no_body:
+            if version == 'HTTP/1.1':
+                chunked = True
+                head.append('Transfer-Encoding: chunked\r\n')
+            else:
+                keep_alive = False  # HTTP/1.0只能以关闭连接表示body结束
+        if not keep_alive:
+            head.append('Connection: close\r\n')
+        elif version == 'HTTP/1.0':
+            head.append('Connection: keep-alive\r\n')
+        head_bytes = ''.join(head).encode('latin-1') + _date_header() + b'\r\n'
+        transport = self.transport
+        if isinstance(body, list):
+            transport.writelines([head_bytes] if no_body else [head_bytes, body[0]])  # type: ignore
+        else:
+            transport.write(head_bytes)  # type: ignore
+            if no_body:
+                await aclose_body(body, app.executor)
+            else:
+                await self._write_stream(body, chunked)
+        await self.drain()
+        if ctx.deferred:
+            await app._arun_deferred(ctx)
+        return keep_alive
+
+    async def _write_stream(self, body: Iterable[bytes], chunked: bool) -> None:
+        """客户端断开后不再迭代body，无限的stream也会结束；body总是被close"""
+        transport = self.transport
+        chunks = aiter_body(body, self.app.executor)
+        try:
+            async for chunk in chunks:
+                if transport.is_closing():  # type: ignore
+                    return
+                if not chunk:
+                    continue
+                if chunked:
+                    transport.writelines([b'%x\r\n' % len(chunk), chunk, b'\r\n'])  # type: ignore
+                else:
+                    transport.write(chunk)  # type: ignore
+                await self.drain()
+            if chunked:
+                transport.write(b'0\r\n\r\n')  # type: ignore
+        finally:
+            await chunks.aclose()  # type: ignore
+
+
+async def serve(app: Any, host: str = '0.0.0.0', port: int = 8080, homepath: str = '',
+                sock: Optional[socket.socket] = None, keepalive_timeout: float = KEEPALIVE_TIMEOUT,
+                read_timeout: float = READ_TIMEOUT) \
+        -> asyncio.Server:
+    """
+    开始监听并返回asyncio的Server，指定sock时不使用host和port
+
+    Example:
+
+        server = await serve(app, port=8080)
+        async with server:
+            await server.serve_forever()
+    """
+    loop = asyncio.get_running_loop()
+
+    def factory() -> HttpProtocol:
+        return HttpProtocol(app, homepath, keepalive_timeout, read_timeout)
+
+    if sock is not None:
+        return await loop.create_server(factory, sock=sock, backlog=1024)
+    return await loop.create_server(factory, host, port, reuse_address=True, backlog=1024)
+
+
+def run_server(app: Any, host: str = '0.0.0.0', port: int = 8080, homepath: str = '',
+               sock: Optional[socket.socket] = None) -> None:
+    """运行服务器直到收到SIGINT/SIGTERM，退出前等待后台任务执行完"""
+    async def main() -> None:
+        server = await serve(app, host, port, homepath, sock)
+        loop = asyncio.get_running_loop()
+        stop = loop.create_future()
+
+        def on_signal() -> None:
+            if not stop.done():
+                stop.set_result(None)
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, on_signal)
+        for s in server.sockets:
+            logging.info('======== Running on %s ========', s.getsockname())
+        try:
+            await stop
+        finally:
+            server.close()
+            await server.wait_closed()
+            await loop.run_in_executor(None, app.background.drain, DRAIN_TIMEOUT)
+
+    asyncio.run(main())
@@ -43,7 +43,7 @@ class Service:
             return f
         return g
 
-    def response(self, request: aiohttp.web.Request, context=None):
+    async def response(self, request: aiohttp.web.Request, context=None):
         method = request.method
         path_pattern = request.match_info.get_info()['formatter']
         op_id = self.api_rev_index.get((method, path_pattern))
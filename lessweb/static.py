@@ -0,0 +1,106 @@
+"""
+Static assets with fingerprinted URLs and precompressed variants
+(from lessweb)
+"""
+import gzip
+import hashlib
+import os
+from typing import Dict, Optional
+
+from .compress import COMPRESS_MIN_SIZE, Compressor, accept_encoding
+from .context import Context
+from .fileresponse import FileResponse
+from .webapi import NotFoundError, mimetypes
+
+
+__all__ = ["IMMUTABLE_CACHE_CONTROL", "fingerprint", "StaticAsset", "StaticAssets"]
+
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+def fingerprint(name: str, digest: str) -> str:
+    """
+        >>> fingerprint('js/app.min.js', '3f2a1b9c0d4e')
+        'js/app.min.3f2a1b9c0d4e.js'
+        >>> fingerprint('LICENSE', '3f2a1b9c0d4e')
+        'LICENSE.3f2a1b9c0d4e'
+
+    """
+    head, tail = os.path.split(name)
+    base, ext = os.path.splitext(tail)
+    return os.path.join(head, '%s.%s%s' % (base, digest, ext)).replace(os.sep, '/')
+
+
+class StaticAsset:
+    def __init__(self, name: str, path: str, hashed_name: str, content_type: str,
+                 gz_path: Optional[str] = None) -> None:
+        self.name: str = name  # 相对root的逻辑名，如js/app.js
+        self.path: str = path
+        self.hashed_name: str = hashed_name  # 带内容hash的名字，如js/app.3f2a1b9c0d4e.js
+        self.content_type: str = content_type
+        self.gz_path: Optional[str] = gz_path  # 预先压缩的.gz文件，比原文件小时才有
+
+
+class StaticAssets:
+    """
+    启动时扫描root下的文件：按内容hash生成带指纹的名字，为可压缩的文件生成.gz，并把结果保存在manifest中。
+    带指纹的URL内容不会变，所以以Cache-Control: immutable响应；逻辑名的URL以no-cache响应
+    """
+    def __init__(self, root: str, prefix: str = '/static/', compressor: Optional[Compressor] = None,
+                 digest_size: int = 12) -> None:
+        self.root: str = root
+        self.prefix: str = prefix if prefix.endswith('/') else prefix + '/'
+        self.compressor: Compressor = compressor or Compressor(COMPRESS_MIN_SIZE)
+        self.digest_size: int = digest_size
+        self.manifest: Dict[str, StaticAsset] = {}  # 逻辑名 => asset
+        self.hashed: Dict[str, StaticAsset] = {}  # 带指纹的名字 => asset
+
+    def build(self) -> None:
+        manifest: Dict[str, StaticAsset] = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                if filename.endswith('.gz') and os.path.isfile(path[:-3]):
+                    continue  # 由build生成的.gz
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                manifest[name] = self._build_asset(name, path)
+        self.manifest = manifest
+        self.hashed = {asset.hashed_name: asset for asset in manifest.values()}
+
+    def _build_asset(self, name: str, path: str) -> StaticAsset:
+        with open(path, 'rb') as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()[:self.digest_size]
+        content_type = mimetypes.get(os.path.splitext(name)[1][1:].lower(), 'application/octet-stream')
+        gz_path = None
+        if len(data) >= self.compressor.min_size and self.compressor.is_compressible(content_type):
+            gz_path = path + '.gz'
+            if not os.path.isfile(gz_path) or os.path.getmtime(gz_path) < os.path.getmtime(path):
+                compressed = gzip.compress(data, self.compressor.level, mtime=0)
+                if len(compressed) < len(data):
+                    with open(gz_path, 'wb') as f:
+                        f.write(compressed)
+                else:
+                    gz_path = None
+        return StaticAsset(name, path, fingerprint(name, digest), content_type, gz_path)
+
+    def url(self, name: str) -> str:
+        """逻辑名转为带指纹的URL，不在manifest中的原样返回"""
+        asset = self.manifest.get(name)
+        return self.prefix + (asset.hashed_name if asset is not None else name)
+
+    def serve(self, ctx: Context, asset: str):
+        immutable = asset in self.hashed
+        found = self.hashed.get(asset) if immutable else self.manifest.get(asset)
+        if found is None:
+            raise NotFoundError()
+        response = ctx.response
+        response.set_header('Cache-Control', IMMUTABLE_CACHE_CONTROL if immutable else 'no-cache')
+        if found.gz_path is None:
+            return FileResponse(found.path, found.content_type)
+        response.set_header('Vary', 'Accept-Encoding')
+        if accept_encoding(ctx.request.get_header('Accept-Encoding') or '') == 'gzip':
+            response.set_header('Content-Encoding', 'gzip')
+            return FileResponse(found.gz_path, found.content_type)
+        return FileResponse(found.path, found.content_type)
@@ -1,15 +1,18 @@
-from typing import Optional, Dict, List
-import cgi
-from io import BytesIO
+from typing import Callable, Optional, Dict, Iterable, List
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
 from http.cookies import Morsel, SimpleCookie, CookieError
-from urllib.parse import parse_qs, unquote
+from urllib.parse import parse_qs, parse_qsl, unquote
 from enum import Enum
 from typing import NamedTuple
 from .bridge import ParamStr, MultipartFile
+from .multipart import SPOOL_SIZE, multipart_boundary, parse_multipart
 
 
 __all__ = ["mimetypes", "hop_by_hop_headers", "http_methods", "ParamInput", "ResponseStatus", "HttpStatus",
-           "Cookie", "parse_cookie", "BadParamError", "NotFoundError"]
+           "Cookie", "parse_cookie", "http_date", "parse_http_date", "etag_matches", "BadParamError", "NotFoundError",
+           "HttpError", "PayloadTooLargeError", "NotModifiedError", "ServiceUnavailableError",
+           "GatewayTimeoutError"]
 
 
 mimetypes = {
@@ -36,7 +39,20 @@ class ParamInput:
     def __init__(self):
         self.url_input: Dict[str, ParamStr] = {}  # Input from URL
         self.query_input: Dict[str, List[ParamStr]] = {}  # Input from Query
-        self.form_input: Dict[str, List[ParamStr]] = {}  # Input from Form. form_input contains query_input
+        self._form_input: Dict[str, List[ParamStr]] = {}  # Input from Form. form_input contains query_input
+        self.on_demand: Optional[Callable[[], None]] = None  # 第一次访问form_input时调用，用于延迟解析body
+
+    @property
+    def form_input(self) -> Dict[str, List[ParamStr]]:
+        if self.on_demand is not None:
+            on_demand, self.on_demand = self.on_demand, None
+            on_demand()
+        return self._form_input
+
+    @form_input.setter
+    def form_input(self, value: Dict[str, List[ParamStr]]) -> None:
+        self.on_demand = None
+        self._form_input = value
 
     def load_query(self, query: str, encoding: str) -> None:
         if query and query[0] == '?':
@@ -47,18 +63,30 @@ class ParamInput:
             self.query_input[key].extend(ParamStr(val) for val in vals)
 
     def load_form(self, body: bytes, env: Dict, encoding: str, file_input: Dict[str, List[MultipartFile]]) -> None:
-        parse_ret = cgi.FieldStorage(fp=BytesIO(body), environ=env.copy(), keep_blank_values=1, encoding=encoding)
-        if parse_ret.list is None: # hack to make input work with enctype='text/plain.
-            parse_ret.list = []
-        for key in parse_ret.keys():
-            val = parse_ret[key]
-            for item in (val if isinstance(val, list) else [val]):
-                if item.filename is None:  # 非文件
-                    self.form_input.setdefault(key, [])
-                    self.form_input[key].append(ParamStr(item.value))
-                else:  # 文件
-                    file_input.setdefault(key, [])
-                    file_input[key].append(MultipartFile(item))
+        self.load_form_stream([body], env, encoding, file_input)
+
+    def load_form_stream(self, chunks: Iterable[bytes], env: Dict, encoding: str,
+                         file_input: Dict[str, List[MultipartFile]], spool_size: int = SPOOL_SIZE) -> None:
+        """
+        POST时form_input也包含query参数：multipart在字段前面，urlencoded在字段后面(与cgi.FieldStorage一致)
+        """
+        content_type = env.get('CONTENT_TYPE', '')
+        qs_on_post = env.get('QUERY_STRING', '') if env.get('REQUEST_METHOD') == 'POST' else ''
+        boundary = multipart_boundary(content_type)
+        if boundary is not None:
+            self._load_qs(qs_on_post, encoding)
+            parse_multipart(chunks, boundary, encoding, self._form_input, file_input, spool_size)
+        elif 'urlencoded' in content_type.lower():
+            qs = b''.join(chunks).decode(encoding, 'replace')
+            if qs_on_post:
+                qs += '&' + qs_on_post
+            self._load_qs(qs, encoding)
+        # 其他类型(例如text/plain)不解析
+
+    def _load_qs(self, qs: str, encoding: str) -> None:
+        for key, val in parse_qsl(qs, keep_blank_values=True, encoding=encoding, errors='replace'):
+            self._form_input.setdefault(key, [])
+            self._form_input[key].append(ParamStr(val))
 
     def load_url(self, groupdict: Dict) -> None:
         for key, val in groupdict.items():
@@ -82,6 +110,7 @@ class HttpStatus(Enum):
     Created = ResponseStatus(code=201, reason='Created')
     Accepted = ResponseStatus(code=202, reason='Accepted')
     NoContent = ResponseStatus(code=204, reason='No Content')
+    PartialContent = ResponseStatus(code=206, reason='Partial Content')
     MovedPermanently = ResponseStatus(code=301, reason='Moved Permanently')
     Found = ResponseStatus(code=302, reason='Found')
     SeeOther = ResponseStatus(code=303, reason='See Other')
@@ -96,10 +125,14 @@ class HttpStatus(Enum):
     Conflict = ResponseStatus(code=409, reason='Conflict')
     Gone = ResponseStatus(code=410, reason='Gone')
     PreconditionFailed = ResponseStatus(code=412, reason='Precondition Failed')
+    PayloadTooLarge = ResponseStatus(code=413, reason='Payload Too Large')
     UnsupportedMediaType = ResponseStatus(code=415, reason='Unsupported Media Type')
+    RangeNotSatisfiable = ResponseStatus(code=416, reason='Range Not Satisfiable')
     UnprocessableEntity = ResponseStatus(code=422, reason='Unprocessable Entity')
     UnavailableForLegalReasons = ResponseStatus(code=451, reason='Unavailable For Legal Reasons')
     InternalServerError = ResponseStatus(code=500, reason='Internal Server Error')
+    ServiceUnavailable = ResponseStatus(code=503, reason='Service Unavailable')
+    GatewayTimeout = ResponseStatus(code=504, reason='Gateway Timeout')
 
 
 class Cookie:
@@ -149,6 +182,62 @@ def parse_cookie(http_cookie: str)->Dict[str, str]:
     return cookies
 
 
+def http_date(dt: datetime) -> str:
+    """
+    naive datetime视为UTC
+
+        >>> http_date(datetime(2020, 1, 2, 3, 4, 5))
+        'Thu, 02 Jan 2020 03:04:05 GMT'
+
+    """
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return format_datetime(dt.astimezone(timezone.utc), usegmt=True)
+
+
+def parse_http_date(text: str) -> Optional[datetime]:
+    """
+    :return: 带UTC时区的datetime，格式错误时返回None
+
+        >>> parse_http_date('Thu, 02 Jan 2020 03:04:05 GMT')
+        datetime.datetime(2020, 1, 2, 3, 4, 5, tzinfo=datetime.timezone.utc)
+        >>> parse_http_date('yesterday') is None
+        True
+
+    """
+    try:
+        dt = parsedate_to_datetime(text)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.astimezone(timezone.utc)
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    If-None-Match使用弱比较，忽略W/前缀
+
+        >>> etag_matches('W/"a", "b"', '"a"')
+        True
+        >>> etag_matches('*', 'W/"x"')
+        True
+        >>> etag_matches('"a"', '"b"')
+        False
+
+    """
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for tag in if_none_match.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        if tag == opaque:
+            return True
+    return False
+
+
 class BadParamError(Exception):
     def __init__(self, message: str, param: str=''):
         self.param: str = param
@@ -172,6 +261,48 @@ class NotFoundError(Exception):
         return 'Method Not Allowed' if self.methods else 'Not Found'
 
 
+class HttpError(Exception):
+    """
+    直接以status响应的错误，Application会设置status和headers，并以message作为body
+    """
+    def __init__(self, status: HttpStatus, message: str = '', headers: Optional[Dict[str, str]] = None):
+        self.status: HttpStatus = status
+        self.message: str = message or status.value.reason
+        self.headers: Dict[str, str] = headers or {}
+
+    def __repr__(self):
+        return 'lessweb.HttpError status:%s message:%s' % (self.status.value.code, self.message)
+
+    def __str__(self):
+        return self.message
+
+
+class PayloadTooLargeError(HttpError):
+    def __init__(self, max_size: int):
+        super().__init__(HttpStatus.PayloadTooLarge, 'Request body exceeds %d bytes' % max_size)
+        self.max_size: int = max_size
+
+
+class NotModifiedError(HttpError):
+    """资源未变化时由Context.check_not_modified抛出，响应304且没有body"""
+    def __init__(self):
+        super().__init__(HttpStatus.NotModified)
+        self.message = ''
+
+
+class ServiceUnavailableError(HttpError):
+    """超过并发限制时立即响应503，retry_after为建议客户端重试的秒数"""
+    def __init__(self, retry_after: int = 1):
+        super().__init__(HttpStatus.ServiceUnavailable, headers={'Retry-After': str(retry_after)})
+        self.retry_after: int = retry_after
+
+
+class GatewayTimeoutError(HttpError):
+    """请求超过了ctx.deadline，响应504"""
+    def __init__(self):
+        super().__init__(HttpStatus.GatewayTimeout, 'Request deadline exceeded')
+
+
 def header_name_of_wsgi_key(wsgi_key: str) -> str:
     """
     >>> header_name_of_wsgi_key('HTTP_ACCEPT_LANGUAGE')
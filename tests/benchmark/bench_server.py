@@ -0,0 +1,110 @@
+"""
+同一个app分别用aiohttp_wsgi、aiohttp_handler和lessweb.server运行，比较每秒请求数
+
+    python tests/benchmark/bench_server.py --connections 64 --duration 5
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from lessweb import Application, Context  # noqa: E402
+from lessweb.prefork import listen_socket  # noqa: E402
+from lessweb.server import run_server  # noqa: E402
+
+
+def make_app() -> Application:
+    app = Application()
+
+    def hello(ctx: Context, name: str):
+        return {'hello': name}
+
+    async def ahello(ctx: Context, name: str):
+        return {'hello': name}
+
+    app.add_get_mapping('/hello', hello)
+    app.add_get_mapping('/ahello', ahello)
+    return app
+
+
+def run_engine(engine: str, sock: socket.socket) -> None:
+    app = make_app()
+    if engine == 'lessweb':
+        run_server(app, sock=sock)
+        return
+    from aiohttp import web
+    aioapp = web.Application()
+    if engine == 'aiohttp_wsgi':
+        from aiohttp_wsgi import WSGIHandler  # type: ignore
+        handler = WSGIHandler(app.wsgifunc())
+    else:
+        handler = app.aiohttp_handler()
+    aioapp.router.add_route('*', '/{path_info:.*}', handler)
+    web.run_app(aioapp, sock=sock, print=None, access_log=None)
+
+
+async def client(port: int, path: str, deadline: float, counter: list) -> None:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    request = ('GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n' % path).encode()
+    try:
+        while time.monotonic() < deadline:
+            writer.write(request)
+            head = await reader.readuntil(b'\r\n\r\n')
+            length = 0
+            for line in head.split(b'\r\n'):
+                if line.lower().startswith(b'content-length:'):
+                    length = int(line.split(b':', 1)[1])
+            await reader.readexactly(length)
+            counter[0] += 1
+    finally:
+        writer.close()
+
+
+async def load(port: int, path: str, connections: int, duration: float) -> float:
+    counter = [0]
+    await asyncio.gather(*[client(port, path, time.monotonic() + 0.5, [0]) for _ in range(connections)])  # 预热
+    begin = time.monotonic()
+    await asyncio.gather(*[client(port, path, begin + duration, counter) for _ in range(connections)])
+    return counter[0] / (time.monotonic() - begin)
+
+
+def bench(engine: str, path: str, connections: int, duration: float) -> float:
+    sock = listen_socket('127.0.0.1', 0)
+    port = sock.getsockname()[1]
+    process = multiprocessing.Process(target=run_engine, args=(engine, sock), daemon=True)
+    process.start()
+    try:
+        for _ in range(50):
+            try:
+                socket.create_connection(('127.0.0.1', port), 0.1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        return asyncio.run(load(port, path, connections, duration))
+    finally:
+        process.terminate()
+        process.join()
+        sock.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--engines', default='aiohttp_wsgi,aiohttp_handler,lessweb')
+    args = parser.parse_args()
+    print('%-16s %-12s %10s' % ('engine', 'path', 'req/s'))
+    for path in ('/hello?name=x', '/ahello?name=x'):
+        for engine in args.engines.split(','):
+            rps = bench(engine, path, args.connections, args.duration)
+            print('%-16s %-12s %10.0f' % (engine, path.split('?')[0], rps))
+
+
+if __name__ == '__main__':
+    multiprocessing.set_start_method('fork')
+    main()
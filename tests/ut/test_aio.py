@@ -0,0 +1,274 @@
+import asyncio
+from io import BytesIO
+import threading
+import time
+from typing import AsyncIterator, Iterator
+from unittest import TestCase
+
+from lessweb.context import Context
+from lessweb.application import Application
+from lessweb.container import Scope
+
+
+def make_app():
+    app = Application()
+
+    def sync_echo(ctx: Context):
+        return {'json': ctx.request.json_input, 'thread': threading.current_thread().name}
+
+    async def async_echo(ctx: Context, name: str):
+        await ctx.request.aload_body()
+        return {'name': name, 'json': ctx.request.json_input, 'thread': threading.current_thread().name}
+
+    async def async_fail(ctx: Context):
+        raise ValueError('boom')
+
+    def rows(ctx: Context):
+        yield 'a'
+        yield 'b'
+
+    app.add_post_mapping('/sync', sync_echo)
+    app.add_post_mapping('/async/{name}', async_echo)
+    app.add_get_mapping('/fail', async_fail)
+    app.add_get_mapping('/rows', rows)
+    return app
+
+
+def call_asgi(asgi_app, method, path, body=b'', headers=()):
+    messages = [{'type': 'http.request', 'body': body[:3], 'more_body': True},
+                {'type': 'http.request', 'body': body[3:], 'more_body': False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'root_path': '',
+             'headers': [(b'content-length', str(len(body)).encode())] + list(headers)}
+    asyncio.run(asgi_app(scope, receive, send))
+    return sent[0]['status'], dict(sent[0]['headers']), b''.join(m.get('body', b'') for m in sent[1:])
+
+
+class Test(TestCase):
+    def test_asgi(self):
+        asgi_app = make_app().asgi()
+        json_header = (b'content-type', b'application/json')
+        status, headers, body = call_asgi(asgi_app, 'POST', '/sync', b'{"a": 1}', [json_header])
+        self.assertEqual(status, 200)
+        self.assertIn('"json": {"a": 1}', body.decode())
+        self.assertNotIn('MainThread', body.decode())  # 同步dealer在executor中执行
+        self.assertEqual(headers[b'content-length'], str(len(body)).encode())
+        status, headers, body = call_asgi(asgi_app, 'POST', '/async/x', b'{"a": 1}', [json_header])
+        self.assertEqual(status, 200)
+        self.assertIn('"name": "x", "json": {"a": 1}, "thread": "MainThread"', body.decode())
+        status, headers, body = call_asgi(asgi_app, 'GET', '/fail')
+        self.assertEqual(status, 500)
+        self.assertIn(b'boom', body)
+        self.assertEqual(call_asgi(asgi_app, 'GET', '/rows')[2], b'ab')
+        self.assertEqual(call_asgi(asgi_app, 'GET', '/none')[0], 404)
+
+    def test_aiohttp_handler(self):
+        from aiohttp import web
+        from aiohttp.test_utils import TestClient, TestServer
+
+        async def run():
+            aioapp = web.Application()
+            aioapp.router.add_route('*', '/api/{path_info:.*}', make_app().aiohttp_handler('/api'))
+            async with TestClient(TestServer(aioapp)) as client:
+                resp = await client.post('/api/async/y', json={'b': 2})
+                self.assertEqual(resp.status, 200)
+                self.assertEqual((await resp.json())['json'], {'b': 2})
+                resp = await client.post('/api/sync', json={'b': 3})
+                self.assertEqual((await resp.json())['json'], {'b': 3})
+                resp = await client.get('/api/rows')
+                self.assertEqual(await resp.text(), 'ab')
+                resp = await client.get('/api/sync')
+                self.assertEqual(resp.status, 405)
+
+        asyncio.run(run())
+
+    def test_wsgi_async_dealer(self):
+        app = make_app()
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/fail', 'wsgi.input': None}
+        result = app.wsgifunc()(env, lambda status, headers: self.assertTrue(status.startswith('500')))
+        self.assertIn(b'boom', b''.join(result))
+
+    def test_wsgi_async_singleton(self):
+        app = Application()
+
+        async def create_loop_serv(ctx: Context):
+            serv = LoopServ()
+            serv.loop = asyncio.get_running_loop()
+            return serv
+
+        async def same_loop(ctx: Context, serv: LoopServ):
+            return {'same': serv.loop is asyncio.get_running_loop() and not serv.loop.is_closed()}
+
+        app.add_service(LoopServ, Scope.singleton, factory=create_loop_serv)
+        app.add_get_mapping('/loop', same_loop)
+        wsgi = app.wsgifunc()
+        for _ in range(2):  # 第二个请求复用第一个请求在loop上创建的单例
+            env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/loop', 'wsgi.input': None}
+            self.assertEqual(b''.join(wsgi(env, lambda status, headers: None)), b'{"same": true}')
+
+
+class AsyncServ:
+    name: str
+
+
+class LoopServ:
+    loop: asyncio.AbstractEventLoop
+
+
+class ReportServ:
+    async_serv: AsyncServ
+
+
+class AsyncTest(TestCase):
+    def test_async_chain(self):
+        app = Application(max_workers=1)
+
+        async def create_async_serv(ctx: Context):
+            await asyncio.sleep(0)
+            serv = AsyncServ()
+            serv.name = 'async'
+            return serv
+
+        def outer(ctx: Context):  # 同步interceptor，ctx()在executor线程中等待
+            return 'outer(' + ctx() + ')'
+
+        async def inner(ctx: Context):
+            return 'inner(' + await ctx() + ')'
+
+        def report(serv: ReportServ):  # 同步dealer，线程池只有一个线程
+            return serv.async_serv.name
+
+        app.add_mapping('/report', 'GET', report)
+        app.add_service(AsyncServ, factory=create_async_serv)
+        self.assertTrue(app.mapping[0].pipeline.is_async)
+        app.add_interceptor('.*', '*', outer)
+        app.add_interceptor('.*', '*', inner)
+        status, _, body = call_asgi(app.asgi(), 'GET', '/report')
+        self.assertEqual((status, body), (200, b'outer(inner(async))'))
+
+    def test_concurrency(self):
+        app = Application(max_workers=2)
+
+        async def slow(ctx: Context):
+            await asyncio.sleep(0.2)
+            return 'done'
+
+        app.add_get_mapping('/slow', slow)
+        asgi_app = app.asgi()
+
+        async def run():
+            async def one():
+                sent = []
+
+                async def receive():
+                    return {'type': 'http.request', 'body': b''}
+
+                async def send(message):
+                    sent.append(message)
+
+                await asgi_app({'type': 'http', 'method': 'GET', 'path': '/slow', 'headers': []}, receive, send)
+                return sent[-1]['body']
+
+            return await asyncio.gather(*[one() for _ in range(200)])
+
+        begin = time.monotonic()
+        self.assertEqual(set(asyncio.run(run())), {b'done'})
+        self.assertLess(time.monotonic() - begin, 2)
+
+    def test_async_body(self):
+        app = Application()
+        chunks = []
+
+        async def upload(ctx: Context):
+            async for data in ctx.request.abody_stream(4):
+                chunks.append(data)
+            return len(chunks)
+
+        async def create(ctx: Context, name: str):  # name在body中，在executor中绑定，dealer仍在loop上执行
+            return name + '@' + threading.current_thread().name
+
+        async def deny(ctx: Context):
+            return 'denied'
+
+        app.add_post_mapping('/upload', upload)
+        app.add_post_mapping('/create', create)
+        app.add_post_mapping('/admin', lambda ctx: ctx.request.body_data)
+        app.add_interceptor('/admin', '*', deny)
+        asgi_app = app.asgi()
+        self.assertEqual(call_asgi(asgi_app, 'POST', '/upload', b'0123456789')[2], b'3')
+        self.assertEqual(chunks, [b'0123', b'4567', b'89'])  # 逐块读取，没有预先读进内存
+        body = call_asgi(asgi_app, 'POST', '/create', b'{"name": "x"}', [(b'content-type', b'application/json')])[2]
+        self.assertEqual(body, b'x@MainThread')
+        received = []
+
+        async def receive():
+            received.append(1)
+            return {'type': 'http.request', 'body': b'{}'}
+
+        async def send(message):
+            pass
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/admin', 'headers': [(b'content-length', b'2')]}
+        asyncio.run(asgi_app(scope, receive, send))
+        self.assertEqual(received, [])  # interceptor拒绝时不读取body
+
+    def test_async_stream_binding(self):
+        class Item:
+            id: int
+
+        async def ingest(items: AsyncIterator[Item], /):
+            return [item.id async for item in items]
+
+        def sync_ingest(items: AsyncIterator[Item], /):
+            return []
+
+        async def blocking_ingest(items: Iterator[Item], /):
+            return []
+
+        app = Application()
+        app.add_post_mapping('/ingest', ingest)
+        for dealer in (sync_ingest, blocking_ingest):  # 注册时就拒绝
+            with self.assertRaises(TypeError):
+                app.add_post_mapping('/bad', dealer)
+        json_header = (b'content-type', b'application/json')
+        status, _, body = call_asgi(app.asgi(), 'POST', '/ingest', b'[{"id": 1}, {"id": 2}]', [json_header])
+        self.assertEqual((status, body), (200, b'[1, 2]'))
+        status, _, body = call_asgi(app.asgi(), 'POST', '/ingest', b'[{"id": 1}, {"id": "x"}]', [json_header])
+        self.assertEqual(status, 400)
+        self.assertIn(b'"param": "[1]"', body)
+
+        async def run():
+            from aiohttp import web
+            from aiohttp.test_utils import TestClient, TestServer
+            aioapp = web.Application()
+            aioapp.router.add_route('*', '/{path_info:.*}', app.aiohttp_handler())
+            async with TestClient(TestServer(aioapp)) as client:
+                resp = await client.post('/ingest', json=[{'id': 3}, {'id': 4}])
+                self.assertEqual((resp.status, await resp.json()), (200, [3, 4]))
+
+        asyncio.run(run())
+        env = {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/ingest', 'CONTENT_TYPE': 'application/json',
+               'CONTENT_LENGTH': '11', 'wsgi.input': BytesIO(b'[{"id": 5}]')}
+        self.assertEqual(b''.join(app.wsgifunc()(env, lambda status, headers: None)), b'[5]')
+
+    def test_deadline(self):
+        app = Application()
+        cancelled = []
+
+        async def stuck(ctx: Context):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        app.add_get_mapping('/stuck', stuck, timeout=0.05)
+        status, _, body = call_asgi(app.asgi(), 'GET', '/stuck')
+        self.assertEqual((status, body, cancelled), (504, b'Request deadline exceeded', [True]))
@@ -1,3 +1,4 @@
+from datetime import datetime
 from unittest import TestCase
 from lessweb.context import Context
 from lessweb.application import Application, build_controller, interceptor
@@ -25,3 +26,101 @@ class Test(TestCase):
         ctx.request.param_input.load_query("id=5&lpn=HK888&pageNo=3", encoding='utf8')
         ret = build_controller(controller)(ctx)
         self.assertListEqual(ret, ['ctx', 'id', 'lpn'])
+
+    def test_pipeline(self):
+        def trace(name):
+            def dealer(ctx: Context):
+                return name + '(' + ctx() + ')'
+            return dealer
+
+        app = Application()
+        app.add_interceptor('.*', '*', trace('all'))
+        app.add_interceptor('/user/1', 'GET', trace('one'))
+        app.add_interceptor('/user/.*', 'POST', trace('post'))
+        app.add_mapping('/user/me', 'GET', lambda: 'me')
+        app.add_mapping('/user/{id}', '*', lambda id: 'user' + id)
+        pipeline = app.mapping[0].pipeline
+        self.assertEqual(len(pipeline.interceptors), 1)
+        self.assertListEqual(pipeline.checks, [])
+        pipeline = app.mapping[1].pipeline
+        self.assertEqual(len(pipeline.interceptors), 3)
+        self.assertListEqual(pipeline.checks, [0, 1])
+
+        def request(method, path):
+            ctx = Context(app)
+            ctx.request.method, ctx.request.path = method, path
+            return app._handle_with_dealers(ctx)
+
+        self.assertEqual(request('GET', '/user/1'), 'all(one(user1))')
+        self.assertEqual(request('GET', '/user/2'), 'all(user2)')
+        self.assertEqual(request('POST', '/user/1'), 'all(post(user1))')
+        self.assertEqual(request('GET', '/user/me'), 'all(me)')
+        app.add_interceptor('/user/me', '*', trace('me'))
+        self.assertEqual(request('GET', '/user/me'), 'all(me(me))')
+
+    def test_stream_json(self):
+        def export_rows():
+            return ({'id': i} for i in range(3))
+
+        app = Application()
+        app.add_get_mapping('/rows', export_rows, stream_json=True, json_chunk_size=10)
+        app.add_get_mapping('/list', lambda: [1, 2], stream_json=True)
+        headers = {}
+        wsgi = app.wsgifunc()
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/rows'}
+        chunks = [c for c in wsgi(env, lambda status, h: headers.update(h)) if c]
+        self.assertListEqual(chunks, [b'[{"id": 0}', b', {"id": 1}', b', {"id": 2}', b']'])
+        self.assertIn('json', headers['Content-Type'])
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/list'}
+        self.assertEqual(b''.join(wsgi(env, lambda status, h: None)), b'[1, 2]')
+
+    def test_conditional_get(self):
+        built = []
+
+        def get_article(ctx: Context):
+            ctx.check_not_modified(etag='v2', last_modified=datetime(2020, 1, 2))
+            built.append(1)
+            return {'title': 'hello'}
+
+        app = Application()
+        app.add_get_mapping('/status', lambda: {'ok': True}, etag=True)
+        app.add_get_mapping('/article', get_article)
+        wsgi = app.wsgifunc()
+
+        def call(path, **headers):
+            env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+            env.update(('HTTP_' + k.upper(), v) for k, v in headers.items())
+            resp = {}
+            body = b''.join(wsgi(env, lambda status, h: resp.update(h, status=status)))
+            return resp, body
+
+        resp, body = call('/status')
+        self.assertEqual(body, b'{"ok": true}')
+        self.assertTrue(resp['ETag'].startswith('W/"'))
+        resp, body = call('/status', if_none_match=resp['ETag'])
+        self.assertEqual((resp['status'], body), ('304 Not Modified', b''))
+
+        resp, body = call('/article', if_none_match='"v2"')
+        self.assertEqual((resp['status'], body), ('304 Not Modified', b''))
+        self.assertListEqual(built, [])
+        resp, body = call('/article', if_modified_since='Thu, 02 Jan 2020 00:00:00 GMT')
+        self.assertEqual(resp['status'], '304 Not Modified')
+        resp, body = call('/article', if_none_match='"v1"', if_modified_since='Thu, 02 Jan 2020 00:00:00 GMT')
+        self.assertEqual(resp['status'], '200 OK')
+        self.assertEqual(resp['ETag'], '"v2"')
+        self.assertEqual(resp['Last-Modified'], 'Thu, 02 Jan 2020 00:00:00 GMT')
+        self.assertListEqual(built, [1])
+
+    def test_content_length(self):
+        app = Application()
+        app.add_get_mapping('/json', lambda: {'name': '张三'})
+        app.add_get_mapping('/stream', lambda: (s for s in ['a', 'b']))
+        wsgi = app.wsgifunc()
+        headers = {}
+        body = wsgi({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/json'}, lambda status, h: headers.update(h))
+        self.assertListEqual(body, ['{"name": "张三"}'.encode()])
+        self.assertEqual(headers['Content-Length'], str(len(body[0])))
+        headers.clear()
+        body = wsgi({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/stream'}, lambda status, h: headers.update(h))
+        self.assertNotIn('Content-Length', headers)
+        self.assertEqual(b''.join(body), b'ab')
@@ -0,0 +1,45 @@
+import threading
+from unittest import TestCase
+
+from lessweb.application import Application
+from lessweb.background import BackgroundTasks
+from lessweb.context import Context
+
+
+class Test(TestCase):
+    def test_tasks(self):
+        tasks = BackgroundTasks(workers=1, max_queue=1)
+        gate = threading.Event()
+        done = []
+        self.assertTrue(tasks.submit(gate.wait))
+        while tasks.queue.qsize():  # 等worker取走第一个任务
+            pass
+        self.assertTrue(tasks.submit(lambda: done.append(1)))
+        self.assertFalse(tasks.submit(lambda: done.append(2)))  # 队列已满
+        tasks.run(lambda: 1 / 0)  # 异常只记录日志
+        gate.set()
+        self.assertTrue(tasks.drain(timeout=5))
+        self.assertEqual(done, [1])
+        self.assertEqual(tasks.stats(), {'pending': 0, 'submitted': 2, 'completed': 3, 'failed': 1, 'rejected': 1})
+        self.assertFalse(tasks.submit(lambda: None))  # drain之后不再接收
+
+    def test_defer(self):
+        app = Application()
+        events = []
+
+        def audit(name):
+            events.append('audit ' + name)
+
+        def hello(ctx: Context, name: str):
+            ctx.defer(audit, name)
+            events.append('hello')
+            return 'Hello ' + name
+
+        app.add_get_mapping('/hello', hello)
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/hello', 'QUERY_STRING': 'name=x'}
+        body = app.wsgifunc()(env, lambda status, headers: events.append(status))
+        self.assertEqual(b''.join(body), b'Hello x')
+        self.assertEqual(events, ['hello', '200 OK'])
+        body.close()  # WSGI服务器发送完body之后调用
+        app.background.drain(timeout=5)
+        self.assertEqual(events, ['hello', '200 OK', 'audit x'])
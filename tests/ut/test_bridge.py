@@ -0,0 +1,34 @@
+import json
+from datetime import datetime
+from unittest import TestCase
+from lessweb.bridge import make_response_encoder
+
+
+class Point:
+    x: int
+    _y: int
+
+    @property
+    def y(self):
+        return self._y
+
+
+class Test(TestCase):
+    def test_response_encoder(self):
+        calls = []
+
+        def point_bridge(obj):
+            calls.append(type(obj))
+            return None
+
+        encoder = make_response_encoder([point_bridge])
+        p = Point()
+        p.x, p._y = 1, 2
+        q = Point()
+        q.x = 3
+        data = [p, q, datetime(2020, 1, 2), object()]
+        self.assertEqual(json.dumps(data, cls=encoder),
+                         '[{"x": 1, "y": 2}, {"x": 3}, "2020-01-02T00:00:00", null]')
+        self.assertListEqual(calls, [Point, datetime, object])  # 同类型只分派一次
+        self.assertEqual(json.dumps(data, cls=encoder), json.dumps(data, cls=encoder))
+        self.assertEqual(len(calls), 3)
@@ -0,0 +1,55 @@
+import threading
+import time
+from unittest import TestCase
+from lessweb.application import Application
+from lessweb.cache import CacheEntry, ResponseCache
+from lessweb.webapi import HttpStatus
+
+
+def call(wsgi, path, query=''):
+    resp = {}
+    env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query}
+    body = b''.join(wsgi(env, lambda status, h: resp.update(h, status=status)))
+    return resp, body
+
+
+class Test(TestCase):
+    def test_add_cache(self):
+        calls = []
+
+        def get_rank(n: int):
+            calls.append(n)
+            time.sleep(0.05)
+            return {'rank': n}
+
+        app = Application()
+        app.add_get_mapping('/rank', get_rank)
+        app.add_cache('/rank', ttl=60)
+        wsgi = app.wsgifunc()
+        threads = [threading.Thread(target=call, args=(wsgi, '/rank', 'n=1')) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertListEqual(calls, [1])
+        resp, body = call(wsgi, '/rank', 'n=1')
+        self.assertEqual(body, b'{"rank": 1}')
+        self.assertIn('json', resp['Content-Type'])
+        call(wsgi, '/rank', 'n=2')
+        self.assertListEqual(calls, [1, 2])
+        resp, body = call(wsgi, '/rank', 'n=x')
+        self.assertEqual(resp['status'], '400 Bad Request')
+        call(wsgi, '/rank', 'n=x')
+        self.assertEqual(len(app.response_cache.entries), 2)
+
+    def test_lru(self):
+        cache = ResponseCache(max_bytes=1400)  # 放得下3个entry
+        for i in range(3):
+            cache.put(i, CacheEntry(b'x' * 200, HttpStatus.OK, [], time.monotonic() + 60))
+        cache.get(0)
+        cache.put(3, CacheEntry(b'x' * 200, HttpStatus.OK, [], time.monotonic() + 60))
+        self.assertListEqual(list(cache.entries), [2, 0, 3])
+        self.assertEqual(cache.size, sum(e.size for e in cache.entries.values()))
+        cache.put(4, CacheEntry(b'x', HttpStatus.OK, [], time.monotonic() - 1))
+        self.assertIsNone(cache.get(4))
+        self.assertNotIn(4, cache.entries)
@@ -0,0 +1,90 @@
+import threading
+import time
+from unittest import TestCase
+from lessweb.application import Application
+from lessweb.coalesce import error_factory
+from lessweb.context import Context
+from lessweb.webapi import HttpError, HttpStatus, NotModifiedError
+
+
+def call(wsgi, path, query='', lang='en'):
+    resp = {}
+    env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'HTTP_ACCEPT_LANGUAGE': lang}
+    body = b''.join(wsgi(env, lambda status, h: resp.update(h, status=status)))
+    return resp, body
+
+
+def concurrently(n, fn, *args):
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(fn(*args))) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class Test(TestCase):
+    def test_add_coalescing(self):
+        calls = []
+
+        def get_report(day: int):
+            calls.append(day)
+            time.sleep(0.1)
+            return {'day': day}
+
+        app = Application()
+        app.add_get_mapping('/report', get_report)
+        app.add_coalescing('/report', params=['day'], headers=['Accept-Language'])
+        wsgi = app.wsgifunc()
+        results = concurrently(5, call, wsgi, '/report', 'day=1&t=1')
+        self.assertListEqual(calls, [1])
+        for resp, body in results:
+            self.assertEqual(body, b'{"day": 1}')
+            self.assertIn('json', resp['Content-Type'])
+        self.assertEqual(app.single_flight.stats(), {'inflight': 0, 'leaders': 1, 'coalesced': 4})
+        call(wsgi, '/report', 'day=1')  # 不保留结果
+        self.assertListEqual(calls, [1, 1])
+        call(wsgi, '/report', 'day=1', lang='zh')
+        self.assertListEqual(calls, [1, 1, 1])
+        results = concurrently(3, call, wsgi, '/report', 'day=x')  # leader的异常也共享
+        self.assertListEqual([resp['status'] for resp, _ in results], ['400 Bad Request'] * 3)
+        self.assertEqual(app.single_flight.flights, {})
+
+    def test_cookie_not_shared(self):
+        calls = []
+
+        def login(ctx: Context):
+            calls.append(1)
+            time.sleep(0.1)
+            ctx.response.set_cookie('sid', str(len(calls)))
+            return 'ok'
+
+        app = Application()
+        app.add_get_mapping('/login', login)
+        app.add_coalescing('/login')
+        concurrently(3, call, app.wsgifunc(), '/login')
+        self.assertEqual(len(calls), 3)
+
+    def test_error_shared_by_value(self):
+        calls = []
+
+        def locked(ctx: Context):
+            calls.append(1)
+            time.sleep(0.1)
+            raise HttpError(HttpStatus.Forbidden, 'locked', {'X-Reason': 'audit'})
+
+        app = Application()
+        app.add_get_mapping('/locked', locked)
+        app.add_coalescing('/locked')
+        results = concurrently(3, call, app.wsgifunc(), '/locked')
+        self.assertEqual(len(calls), 1)
+        for resp, body in results:
+            self.assertEqual(resp['status'], '403 Forbidden')
+            self.assertEqual(resp['X-Reason'], 'audit')
+            self.assertEqual(body, b'locked')
+        make_error = error_factory(NotModifiedError())
+        first, second = make_error(), make_error()
+        self.assertIsNot(first, second)
+        self.assertEqual((first.status, first.message), (HttpStatus.NotModified, ''))
+        self.assertIsNone(error_factory(ValueError('boom')))
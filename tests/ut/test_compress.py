@@ -0,0 +1,49 @@
+import gzip
+import zlib
+from unittest import TestCase
+from lessweb.application import Application
+
+
+def call(wsgi, path, accept='gzip, deflate'):
+    headers = {}
+    env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'HTTP_ACCEPT_ENCODING': accept}
+    body = b''.join(wsgi(env, lambda status, h: headers.update(h)))
+    return headers, body
+
+
+class Test(TestCase):
+    def test_compression(self):
+        text = 'hello ' * 500
+
+        def lines():
+            for i in range(3):
+                yield text
+
+        app = Application()
+        app.enable_compression()
+        app.add_get_mapping('/big', lambda: text)
+        app.add_get_mapping('/small', lambda: 'hi')
+        app.add_get_mapping('/stream', lines)
+        app.add_get_mapping('/raw', lambda: text, compress=False)
+        wsgi = app.wsgifunc()
+
+        headers, body = call(wsgi, '/big')
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(gzip.decompress(body), text.encode())
+
+        headers, body = call(wsgi, '/big', accept='deflate')
+        self.assertEqual(zlib.decompress(body), text.encode())
+
+        headers, body = call(wsgi, '/stream')
+        self.assertEqual(gzip.decompress(body), text.encode() * 3)
+
+        headers, body = call(wsgi, '/small')
+        self.assertNotIn('Content-Encoding', headers)
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(body, b'hi')
+
+        for path, accept in [('/raw', 'gzip'), ('/big', 'identity')]:
+            headers, body = call(wsgi, path, accept)
+            self.assertNotIn('Content-Encoding', headers)
+            self.assertEqual(body, text.encode())
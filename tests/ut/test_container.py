@@ -0,0 +1,75 @@
+import asyncio
+from unittest import TestCase
+from lessweb.application import Application
+from lessweb.container import Scope
+from lessweb.context import Context
+from lessweb.model import fetch_service, afetch_service
+
+
+class ConfigServ:
+    debug: bool = True
+
+
+class CounterServ:
+    ctx: Context
+    config: ConfigServ
+
+
+class AuditServ:
+    ctx: Context
+    counter: CounterServ
+
+
+class PingServ:
+    ctx: Context
+    pong: 'PongServ'
+
+
+class PongServ:
+    ctx: Context
+    ping: PingServ
+
+
+class Test(TestCase):
+    def test_scopes(self):
+        app = Application()
+        app.add_service(ConfigServ, Scope.singleton)
+        app.add_service(AuditServ, Scope.transient)
+        ctx = Context(app)
+        audit1, audit2 = fetch_service(ctx, AuditServ), fetch_service(ctx, AuditServ)
+        self.assertIsNot(audit1, audit2)
+        self.assertIs(audit1.counter, audit2.counter)
+        self.assertIs(audit1.counter.ctx, ctx)
+        counter = fetch_service(Context(app), CounterServ)
+        self.assertIsNot(counter, audit1.counter)
+        self.assertIs(counter.config, audit1.counter.config)
+
+    def test_registration_errors(self):
+        app = Application()
+        with self.assertRaises(TypeError):
+            app.add_service(CounterServ, Scope.singleton)
+
+        def dealer(ping: PingServ):
+            pass
+        with self.assertRaises(TypeError) as cm:
+            app.add_get_mapping('/ping', dealer)
+        self.assertEqual(str(cm.exception), 'Circular service dependency: PingServ -> PongServ -> PingServ')
+
+    def test_async_factory(self):
+        app = Application()
+
+        async def create_config(ctx: Context):
+            await asyncio.sleep(0)
+            return ConfigServ()
+
+        app.add_service(ConfigServ, Scope.singleton, factory=create_config)
+        app.add_service(AuditServ, Scope.transient)
+        self.assertTrue(app.container.plan(AuditServ).is_async)
+        with self.assertRaises(TypeError):
+            fetch_service(Context(app), AuditServ)
+        ctx = Context(app)
+        audit = asyncio.run(afetch_service(ctx, AuditServ))
+        self.assertIs(fetch_service(ctx, AuditServ).counter, audit.counter)
+        self.assertIs(audit.counter.config, fetch_service(Context(app), ConfigServ))
+        with self.assertRaises(TypeError):
+            app.add_service(CounterServ, Scope.transient, factory=create_config)
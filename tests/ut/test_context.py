@@ -0,0 +1,134 @@
+import time
+from io import BytesIO
+from unittest import TestCase
+from lessweb.application import Application
+from lessweb.context import Context
+from lessweb.webapi import HttpStatus
+
+
+class CountingInput(BytesIO):
+    reads = 0
+
+    def read(self, *args):
+        self.reads += 1
+        return super().read(*args)
+
+
+def make_env(method, path, body=b'', content_type='application/json'):
+    return {'REQUEST_METHOD': method, 'PATH_INFO': path, 'CONTENT_TYPE': content_type,
+            'CONTENT_LENGTH': str(len(body)), 'wsgi.input': CountingInput(body)}
+
+
+class Test(TestCase):
+    def test_lazy_body(self):
+        def deny(ctx: Context):
+            return 'denied'
+
+        app = Application()
+        app.add_interceptor('/admin/.*', '*', deny)
+        app.add_post_mapping('/admin/{name}', lambda name: name)
+        app.add_post_mapping('/user', lambda name: name)
+
+        ctx = Context(app)
+        env = make_env('POST', '/admin/x', b'{"name": "Bob"}')
+        ctx.request.load(env)
+        self.assertEqual(app._handle_with_dealers(ctx), 'denied')
+        self.assertEqual(env['wsgi.input'].reads, 0)
+
+        ctx = Context(app)
+        env = make_env('POST', '/user', b'{"name": "Bob"}')
+        ctx.request.load(env)
+        self.assertEqual(env['wsgi.input'].reads, 0)
+        self.assertEqual(app._handle_with_dealers(ctx), 'Bob')
+        self.assertEqual(ctx.request.body_data, b'{"name": "Bob"}')
+        self.assertEqual(env['wsgi.input'].reads, 1)
+
+    def test_lazy_form(self):
+        ctx = Context(Application())
+        ctx.request.load(make_env('POST', '/', b'a=1&b=2', 'application/x-www-form-urlencoded'))
+        self.assertFalse(ctx.request._body_loaded)
+        self.assertEqual(ctx.request.param_input.form_input, {'a': ['1'], 'b': ['2']})
+        self.assertIsNone(ctx.request.json_input)
+
+    def test_chunked_body(self):
+        ctx = Context(Application())
+        env = make_env('POST', '/', b'{"a": 1}')
+        del env['CONTENT_LENGTH']
+        env['wsgi.input_terminated'] = True
+        ctx.request.load(env)
+        self.assertIsNone(ctx.request.body_length())
+        self.assertEqual(ctx.request.json_input, {'a': 1})
+
+        ctx = Context(Application())
+        ctx.request.load(make_env('POST', '/', b'x' * 10))
+        self.assertEqual(b''.join(ctx.request.body_stream(chunk_size=4)), b'x' * 10)
+        self.assertIsNone(ctx.request.body_data)
+
+    def test_max_body_size(self):
+        def echo(ctx: Context):
+            return ctx.request.body_data
+
+        app = Application(max_body_size=8)
+        app.add_post_mapping('/small', echo)
+        app.add_post_mapping('/big', echo, max_body_size=100)
+
+        ctx = Context(app)
+        env = make_env('POST', '/small', b'x' * 10)
+        ctx.request.load(env)
+        self.assertEqual(app._handle_with_dealers(ctx), 'Request body exceeds 8 bytes')
+        self.assertEqual(ctx.response.get_status(), HttpStatus.PayloadTooLarge)
+        self.assertEqual(env['wsgi.input'].reads, 0)
+
+        ctx = Context(app)
+        ctx.request.load(make_env('POST', '/big', b'x' * 10))
+        self.assertEqual(app._handle_with_dealers(ctx), b'x' * 10)
+
+        ctx = Context(app)
+        env = make_env('POST', '/small', b'x' * 10)
+        del env['CONTENT_LENGTH']
+        env['HTTP_TRANSFER_ENCODING'] = 'chunked'
+        ctx.request.load(env)
+        app._handle_with_dealers(ctx)
+        self.assertEqual(ctx.response.get_status(), HttpStatus.PayloadTooLarge)
+
+    def test_deadline(self):
+        app = Application()
+        app.request_timeout = 10
+
+        def remaining(ctx: Context):
+            return ctx.remaining()
+
+        app.add_get_mapping('/fast', remaining)
+        app.add_get_mapping('/slow', remaining, timeout=0)
+
+        ctx = Context(app)
+        ctx.request.load(make_env('GET', '/fast', b''))
+        self.assertTrue(9 < app._handle_with_dealers(ctx) <= 10)
+
+        ctx = Context(app)
+        env = make_env('GET', '/fast', b'')
+        env['HTTP_X_REQUEST_TIMEOUT'] = '0.5'  # header只能缩短时限
+        ctx.request.load(env)
+        self.assertTrue(0 < app._handle_with_dealers(ctx) <= 0.5)
+
+        ctx = Context(app)
+        ctx.request.load(make_env('GET', '/slow', b''))
+        app._handle_with_dealers(ctx)
+        self.assertEqual(ctx.response.get_status(), HttpStatus.GatewayTimeout)
+        self.assertIsNone(Context(app).remaining())
+
+    def test_sync_deadline(self):
+        app = Application()
+        calls = []
+
+        def sleepy(ctx: Context):
+            calls.append(1)
+            time.sleep(0.3)
+            return 'late'
+
+        app.add_get_mapping('/sleepy', sleepy, timeout=0.1)
+        ctx = Context(app)
+        ctx.request.load(make_env('GET', '/sleepy', b''))
+        resp = app._handle_with_dealers(ctx)
+        self.assertEqual(calls, [1])  # 同步的dealer执行完，但结果被丢弃
+        self.assertEqual((ctx.response.get_status(), resp), (HttpStatus.GatewayTimeout, 'Request deadline exceeded'))
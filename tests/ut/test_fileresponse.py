@@ -0,0 +1,73 @@
+import os
+import tempfile
+from unittest import TestCase
+from lessweb.application import Application
+from lessweb.fileresponse import FileResponse
+
+
+class FileWrapper:
+    def __init__(self, fp, blksize):
+        self.fp, self.blksize = fp, blksize
+
+    def __iter__(self):
+        return iter(lambda: self.fp.read(self.blksize), b'')
+
+
+class Test(TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(bytes(range(256)) * 4)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def call(self, **headers):
+        app = Application()
+        app.add_get_mapping('/file', lambda: FileResponse(self.path, chunk_size=100))
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/file'}
+        env.update(('HTTP_' + k.upper(), v) for k, v in headers.items())
+        resp = {}
+        body = app.wsgifunc()(env, lambda status, h: resp.update(h, status=status))
+        data = b''.join(body)
+        body.close()
+        return resp, body, data
+
+    def test_file_response(self):
+        resp, body, data = self.call()
+        self.assertEqual(resp['status'], '200 OK')
+        self.assertEqual(data, bytes(range(256)) * 4)
+        self.assertEqual(resp['Content-Length'], '1024')
+        self.assertEqual(resp['Content-Type'], 'text/plain')
+        self.assertTrue(body.fp.closed)
+
+        resp, body, data = self.call(range='bytes=250-259')
+        self.assertEqual(resp['status'], '206 Partial Content')
+        self.assertEqual(resp['Content-Range'], 'bytes 250-259/1024')
+        self.assertEqual(data, bytes([250, 251, 252, 253, 254, 255, 0, 1, 2, 3]))
+
+        resp, body, data = self.call(range='bytes=2000-')
+        self.assertEqual((resp['status'], resp['Content-Range'], data), ('416 Range Not Satisfiable', 'bytes */1024', b''))
+
+        resp, body, data = self.call(if_modified_since=resp['Last-Modified'])
+        self.assertEqual((resp['status'], data), ('304 Not Modified', b''))
+
+    def test_file_wrapper(self):
+        app = Application()
+        app.add_get_mapping('/file', lambda: FileResponse(self.path))
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/file', 'wsgi.file_wrapper': FileWrapper,
+               'HTTP_RANGE': 'bytes=-24'}
+        body = app.wsgifunc()(env, lambda status, h: None)
+        self.assertIsInstance(body, FileWrapper)
+        self.assertEqual(b''.join(body), bytes(range(232, 256)))
+        body.fp.close()
+
+    def test_missing_file(self):
+        app = Application()
+        app.add_get_mapping('/missing', lambda: FileResponse(self.path + '.missing'))
+        app.add_get_mapping('/dir', lambda: FileResponse(os.path.dirname(self.path)))
+        for path in ('/missing', '/dir'):
+            resp = {}
+            env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+            body = b''.join(app.wsgifunc()(env, lambda status, h: resp.update(status=status)))
+            self.assertEqual((resp['status'], body), ('404 Not Found', b'Not Found'))
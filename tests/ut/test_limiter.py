@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+from unittest import TestCase
+
+from lessweb.application import Application
+from lessweb.context import Context
+from lessweb.limiter import AIMDLimit, ConcurrencyLimiter
+from lessweb.webapi import ServiceUnavailableError
+
+
+class Test(TestCase):
+    def test_limit_and_queue(self):
+        limiter = ConcurrencyLimiter(1, max_queue=1, max_queue_time=2, retry_after=3)
+        limiter.acquire()
+        acquired = []
+        waiting = threading.Thread(target=lambda: acquired.append(limiter.acquire()))
+        waiting.start()
+        while not limiter.waiters:
+            time.sleep(0.01)
+        with self.assertRaises(ServiceUnavailableError) as cm:
+            limiter.acquire()  # 队列已满
+        self.assertEqual(cm.exception.headers, {'Retry-After': '3'})
+        limiter.release()
+        waiting.join()
+        self.assertEqual((acquired, limiter.inflight), ([None], 1))
+        limiter.max_queue_time = 0.05
+        with self.assertRaises(ServiceUnavailableError):
+            limiter.acquire()  # 排队超时
+        self.assertEqual(len(limiter.waiters), 0)
+
+    def test_aacquire(self):
+        limiter = ConcurrencyLimiter(1, max_queue=1, max_queue_time=2)
+
+        async def run():
+            await limiter.aacquire()
+            waiting = asyncio.ensure_future(limiter.aacquire())
+            await asyncio.sleep(0.01)
+            threading.Thread(target=limiter.release).start()  # 在其他线程释放
+            await waiting
+            self.assertEqual(limiter.inflight, 1)
+
+        asyncio.run(run())
+
+    def test_aimd(self):
+        aimd = AIMDLimit(target_latency=0.1, min_limit=2, max_limit=10, backoff=0.5)
+        self.assertEqual(aimd.update(4.0, 0.05, True), 4.25)
+        self.assertEqual(aimd.update(4.0, 0.5, True), 2.0)
+        self.assertEqual(aimd.update(2.0, 0.05, False), 2.0)
+        self.assertEqual(aimd.update(10.0, 0.05, True), 10.0)
+        limiter = ConcurrencyLimiter(4, adaptive=aimd)
+        limiter.acquire()
+        limiter.release(0.5)
+        self.assertEqual(limiter.limit, 2.0)
+
+    def test_load_shedding(self):
+        app = Application()
+        app.enable_load_shedding(1)
+        bound = []
+
+        async def slow(ctx: Context, n: int):
+            bound.append(n)
+            await asyncio.sleep(0.1)
+            return 'slow'
+
+        app.add_get_mapping('/slow', slow)
+        app.add_get_mapping('/health', lambda: 'ok', limiter=None)
+        asgi_app = app.asgi()
+
+        async def request(path, query=b'n=1'):
+            sent = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                sent.append(message)
+
+            await asgi_app({'type': 'http', 'method': 'GET', 'path': path, 'query_string': query, 'headers': []},
+                           receive, send)
+            return sent[0]['status'], dict(sent[0]['headers'])
+
+        async def run():
+            return await asyncio.gather(request('/slow'), request('/slow'), request('/health'))
+
+        (status1, _), (status2, headers2), (status3, _) = asyncio.run(run())
+        self.assertEqual((status1, status2, status3), (200, 503, 200))
+        self.assertEqual(headers2[b'retry-after'], b'1')
+        self.assertEqual(bound, [1])  # 被拒绝的请求没有绑定参数
+        self.assertEqual(app.limiter.inflight, 0)
+
+    def test_release_on_cancel(self):
+        app = Application()
+        app.enable_load_shedding(1)
+
+        async def cancelled(ctx: Context):
+            raise asyncio.CancelledError()
+
+        app.add_get_mapping('/cancelled', cancelled)
+        wsgi = app.wsgifunc()
+        env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': '/cancelled'}
+        with self.assertRaises(asyncio.CancelledError):
+            wsgi(env, lambda status, headers: None)
+        self.assertEqual(app.limiter.inflight, 0)
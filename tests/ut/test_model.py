@@ -1,8 +1,13 @@
-from unittest import TestCase
+from io import BytesIO
+import threading
+from typing import Iterator, List, Optional, Union
+from unittest import TestCase, mock
 from lessweb.application import Application
 from lessweb.context import Context
-from lessweb.model import request_bridge, fetch_param
+from lessweb import model
+from lessweb.model import request_bridge, model_loader, fetch_param, binding_plan
 from lessweb.storage import Storage
+from lessweb.webapi import BadParamError, HttpStatus
 
 
 class Test(TestCase):
@@ -16,6 +21,51 @@ class Test(TestCase):
         model = request_bridge(inputval, Person)
         self.assertDictEqual(Storage.of(model), {'name': 'Bob', 'age': 33, 'weight': 100})
 
+    def test_model_loader(self):
+        class Node:
+            id: int
+            parent: Optional['Node']
+            children: List['Node']
+
+        Node.__annotations__.update(parent=Optional[Node], children=List[Node])
+        loader = model_loader(List[Node])
+        self.assertIs(loader, model_loader(List[Node]))
+        nodes = request_bridge([{'id': 1, 'parent': None, 'children': [{'id': 2}]}], List[Node])
+        self.assertEqual(nodes[0].id, 1)
+        self.assertIsNone(nodes[0].parent)
+        self.assertEqual(nodes[0].children[0].id, 2)
+        self.assertFalse(hasattr(nodes[0].children[0], 'children'))
+        with self.assertRaises(ValueError) as cm:
+            loader([{'id': None}])
+        self.assertEqual(str(cm.exception), "Cannot assign None when expected <class 'int'>")
+
+    def test_model_loader_threads(self):
+        class Leaf:
+            id: int
+
+        started, release = threading.Event(), threading.Event()
+        build_loader = model._build_loader
+        results = []
+
+        def slow_build(target_type):
+            if target_type is Leaf:
+                started.set()
+                release.wait(5)
+            return build_loader(target_type)
+
+        with mock.patch.object(model, '_build_loader', slow_build):
+            builder = threading.Thread(target=lambda: model_loader(Leaf))
+            builder.start()
+            started.wait(5)
+            self.assertNotIn(Leaf, model._loaders)  # 构建中的占位不公开给其他线程
+            reader = threading.Thread(target=lambda: results.append(model_loader(Leaf)({'id': '1'}).id))
+            reader.start()
+            release.set()
+            builder.join()
+            reader.join()
+        self.assertEqual(results, [1])
+        self.assertEqual(model._building, {})
+
     def test_fetch_param(self):
         def get_person(ctx: Context, /, name: str, age: int, weight: int, createAt: int = 2):
             pass
@@ -25,3 +75,50 @@ class Test(TestCase):
         args, param = fetch_param(ctx, get_person)
         self.assertListEqual(args, [ctx])
         self.assertDictEqual(param, {'name': 'Bob', 'age': 33, 'weight': 100, 'createAt': 9})
+
+    def test_binding_plan(self):
+        def get_person(name: str, age: int = 1, *, weight: Optional[int]):
+            pass
+        plan = binding_plan(get_person)
+        self.assertIs(plan, binding_plan(get_person))
+        ctx = Context(Application())
+        ctx.request.param_input.load_query("name=Bob&weight=100", encoding='utf8')
+        self.assertEqual(plan.bind(ctx), ([], {'name': 'Bob', 'weight': 100}))
+        ctx = Context(Application())
+        ctx.request.param_input.load_query("name=Bob&weight=x", encoding='utf8')
+        with self.assertRaises(BadParamError) as cm:
+            plan.bind(ctx)
+        self.assertEqual(cm.exception.param, 'weight')
+
+        def get_many(ids: Union[int, str]):
+            pass
+        app = Application()
+        with self.assertRaises(TypeError):
+            app.add_get_mapping('/many', get_many)
+        self.assertListEqual(app.mapping, [])
+
+    def test_iterator_binding(self):
+        class Item:
+            id: int
+
+        seen = []
+
+        def ingest(items: Iterator[Item], /):
+            for item in items:
+                seen.append(item.id)
+            return len(seen)
+
+        app = Application()
+        app.add_post_mapping('/ingest', ingest)
+        for body, result in [(b'[{"id": 1}, {"id": 2}]', 2), (b'[{"id": 3}, {"id": "x"}]', 400),
+                             (b'[{"id": 4}, ', 400)]:
+            seen.clear()
+            ctx = Context(app)
+            ctx.request.load({'REQUEST_METHOD': 'POST', 'PATH_INFO': '/ingest', 'CONTENT_TYPE': 'application/json',
+                              'CONTENT_LENGTH': str(len(body)), 'wsgi.input': BytesIO(body)})
+            response = app._handle_with_dealers(ctx)
+            if result == 400:
+                self.assertEqual(ctx.response.get_status(), HttpStatus.BadRequest)
+                self.assertEqual(response['param'], '[1]')
+            else:
+                self.assertEqual(response, result)
@@ -0,0 +1,39 @@
+import hashlib
+import os
+import tempfile
+from unittest import TestCase
+from lessweb.multipart import parse_multipart
+
+
+BODY = (b'preamble\r\n'
+        b'------xyz\r\n'
+        b'Content-Disposition: form-data; name="title"\r\n'
+        b'\r\n'
+        b'hello\r\n--world\r\n'
+        b'------xyz\r\n'
+        b'Content-Disposition: form-data; name="a"; filename="a.bin"\r\n'
+        b'Content-Type: application/octet-stream\r\n'
+        b'\r\n' + b'0123456789' * 100 + b'\r\n'
+        b'------xyz--\r\n')
+
+
+class Test(TestCase):
+    def test_parse_multipart(self):
+        for chunk_size in (1, 7, len(BODY)):
+            form_input, file_input = {}, {}
+            chunks = (BODY[i:i + chunk_size] for i in range(0, len(BODY), chunk_size))
+            parse_multipart(chunks, b'----xyz', 'utf-8', form_input, file_input, spool_size=100)
+            self.assertDictEqual(form_input, {'title': ['hello\r\n--world']})
+            upfile = file_input['a'][0]
+            self.assertEqual((upfile.filename, upfile.content_type, upfile.size), ('a.bin', 'application/octet-stream', 1000))
+            self.assertTrue(upfile.file._rolled)
+            self.assertEqual(upfile.digest('md5'), hashlib.md5(b'0123456789' * 100).hexdigest())
+            self.assertEqual(upfile.mmap()[:10], b'0123456789')
+            with tempfile.TemporaryDirectory() as tmpdir:
+                path = os.path.join(tmpdir, 'a.bin')
+                upfile.save_to(path)
+                self.assertEqual(os.path.getsize(path), 1000)
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            parse_multipart([BODY[:-20]], b'----xyz', 'utf-8', {}, {})
@@ -0,0 +1,51 @@
+import os
+import signal
+import socket
+import tempfile
+from unittest import TestCase
+
+from lessweb.application import Application
+from lessweb.prefork import Supervisor, listen_socket
+
+
+class Test(TestCase):
+    def test_listen_socket(self):
+        sock1 = listen_socket('127.0.0.1', 0, reuse_port=True)
+        port = sock1.getsockname()[1]
+        sock2 = listen_socket('127.0.0.1', port, reuse_port=True)
+        self.assertEqual(sock2.getsockname()[1], port)
+        sock1.close()
+        sock2.close()
+
+    def test_supervisor_restart(self):
+        with tempfile.NamedTemporaryFile('r') as log:
+            def worker(index: int):
+                with open(log.name, 'a') as f:
+                    f.write('%d\n' % index)
+                with open(log.name) as f:
+                    if len(f.readlines()) < 4:
+                        raise RuntimeError('crash')  # 前几次崩溃，由supervisor重启
+                os.kill(os.getppid(), signal.SIGTERM)
+
+            handler = signal.getsignal(signal.SIGTERM)
+            Supervisor(worker, workers=2, restart_delay=0).run()
+            self.assertIs(signal.getsignal(signal.SIGTERM), handler)
+            self.assertGreaterEqual(len(log.readlines()), 4)
+
+    def test_post_fork(self):
+        class Plugin:
+            forked = 0
+
+            def init_app(self, app):
+                pass
+
+            def post_fork(self):
+                self.forked += 1
+
+        app = Application()
+        plugin = Plugin()
+        app.add_plugin(plugin)
+        executor = app.executor
+        app.post_fork()
+        self.assertEqual(plugin.forked, 1)
+        self.assertIsNot(app.executor, executor)
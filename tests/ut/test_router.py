@@ -0,0 +1,50 @@
+import re
+from unittest import TestCase
+from lessweb.application import Mapping
+from lessweb.router import Router
+from lessweb.utils import re_standardize
+from lessweb.webapi import NotFoundError
+
+
+def make_router(*routes):
+    router = Router()
+    for pattern, method in routes:
+        router.add(Mapping(pattern, method, None, '', re.compile(re_standardize(pattern))))
+    return router
+
+
+class Test(TestCase):
+    def test_static_and_param(self):
+        router = make_router(('/add/{x}/{y}', 'GET'), ('/add/1/{y}', 'GET'), ('/hello', 'GET'), ('', 'GET'))
+        route, groupdict = router.lookup('/add/1/2', 'GET')
+        self.assertEqual(route.pattern, '/add/{x}/{y}')
+        self.assertDictEqual(groupdict, {'x': '1', 'y': '2'})
+        self.assertEqual(router.lookup('/hello', 'GET')[0].pattern, '/hello')
+        self.assertEqual(router.lookup('', 'GET')[0].pattern, '')
+        for path in ['/add//2', '/add/1/2/', '/hello/', '/']:
+            with self.assertRaises(NotFoundError) as cm:
+                router.lookup(path, 'GET')
+            self.assertListEqual(cm.exception.methods, [])
+
+    def test_first_match_with_regex(self):
+        router = make_router(('/api/(?P<m>.*)/index.php', 'GET'), ('/api/{m}/index.php', 'GET'), ('.*', '*'))
+        route, groupdict = router.lookup('/api/a/b/index.php', 'GET')
+        self.assertEqual(route.pattern, '/api/(?P<m>.*)/index.php')
+        self.assertDictEqual(groupdict, {'m': 'a/b'})
+        route, groupdict = router.lookup('/api/a/index.php', 'POST')
+        self.assertEqual(route.pattern, '.*')
+        self.assertDictEqual(groupdict, {})
+
+    def test_method_not_allowed(self):
+        router = make_router(('/user/{id}', 'GET'), ('/user/{id}', 'OPTIONS'), ('/user/1', 'DELETE'),
+                             ('/user/{id}', 'PUT'))
+        self.assertEqual(router.lookup('/user/1', 'PUT')[0].method, 'PUT')
+        with self.assertRaises(NotFoundError) as cm:
+            router.lookup('/user/1', 'POST')
+        self.assertListEqual(cm.exception.methods, ['GET', 'DELETE', 'PUT'])
+
+    def test_multi_param_segment(self):
+        router = make_router(('/x/{a}{b}', 'GET'), ('/x/{c}', 'GET'))
+        route, groupdict = router.lookup('/x/12', 'GET')
+        self.assertEqual(route.pattern, '/x/{a}{b}')
+        self.assertDictEqual(groupdict, {'a': '1', 'b': '2'})
@@ -0,0 +1,147 @@
+import asyncio
+import threading
+import time
+from unittest import TestCase
+
+from lessweb.context import Context
+from lessweb.application import Application
+from lessweb.server import serve
+
+
+def make_app():
+    app = Application()
+
+    def echo(ctx: Context):
+        return {'json': ctx.request.json_input, 'path': ctx.request.path}
+
+    async def hello(ctx: Context, name: str):
+        return 'Hello ' + name
+
+    def rows(ctx: Context):
+        yield 'a'
+        yield 'b'
+
+    app.add_post_mapping('/echo', echo)
+    app.add_get_mapping('/hello', hello)
+    app.add_head_mapping('/hello', hello)
+    app.add_get_mapping('/rows', rows)
+    return app
+
+
+async def read_response(reader, method='GET'):
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+    headers = dict(line.split(': ', 1) for line in head.split('\r\n')[1:-2])
+    if headers.get('Transfer-Encoding') == 'chunked':
+        body = b''
+        while True:
+            size = int(await reader.readline(), 16)
+            body += (await reader.readexactly(size + 2))[:-2]
+            if size == 0:
+                break
+    elif method == 'HEAD':
+        body = b''
+    else:
+        body = await reader.readexactly(int(headers.get('Content-Length', 0)))
+    return head.split('\r\n', 1)[0], headers, body
+
+
+def exchange(request, count=1, homepath='', methods=()):
+    async def run():
+        server = await serve(make_app(), '127.0.0.1', 0, homepath)
+        port = server.sockets[0].getsockname()[1]
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request)
+        responses = [await read_response(reader, methods[i] if i < len(methods) else 'GET') for i in range(count)]
+        rest = await asyncio.wait_for(reader.read(), 5)  # Connection: close时服务器关闭连接
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return responses, rest
+    return asyncio.run(run())
+
+
+class Test(TestCase):
+    def test_pipelining(self):
+        body = b'{"a": 1}'
+        responses, rest = exchange(
+            b'GET /api/hello?name=x HTTP/1.1\r\nHost: h\r\n\r\n'
+            b'POST /api/echo HTTP/1.1\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n%s'
+            b'POST /api/echo HTTP/1.1\r\nContent-Type: application/json\r\nTransfer-Encoding: chunked\r\n\r\n'
+            b'3\r\n{"a\r\n5;x=y\r\n": 2}\r\n0\r\n\r\n'
+            b'GET /api/rows HTTP/1.1\r\n\r\n'
+            b'HEAD /api/hello?name=x HTTP/1.1\r\nConnection: close\r\n\r\n' % (len(body), body), 5, '/api', ['GET'] * 4 + ['HEAD'])
+        self.assertEqual([r[0] for r in responses], ['HTTP/1.1 200 OK'] * 5)
+        self.assertEqual(responses[0][2], b'Hello x')
+        self.assertEqual(responses[1][2], b'{"json": {"a": 1}, "path": "/echo"}')
+        self.assertEqual(responses[2][2], b'{"json": {"a": 2}, "path": "/echo"}')
+        self.assertEqual(responses[3][1]['Transfer-Encoding'], 'chunked')
+        self.assertEqual(responses[3][2], b'ab')
+        self.assertEqual(responses[4][1]['Connection'], 'close')
+        self.assertEqual(rest, b'')
+
+    def test_http10_and_errors(self):
+        [(status, headers, body)], rest = exchange(b'GET /rows HTTP/1.0\r\n\r\n')
+        self.assertEqual(headers['Connection'], 'close')
+        self.assertEqual(rest, b'ab')  # HTTP/1.0的流式响应以关闭连接结束
+        responses, rest = exchange(b'GET /none HTTP/1.1\r\n\r\nGET /hello HTTP/1.1\r\nBad Header\r\n\r\n', 2)
+        self.assertEqual([r[0] for r in responses], ['HTTP/1.1 404 Not Found', 'HTTP/1.1 400 Bad Request'])
+        responses, _ = exchange(b'POST /echo HTTP/1.1\r\nContent-Length: 1\r\nTransfer-Encoding: chunked\r\n\r\n')
+        self.assertEqual(responses[0][0], 'HTTP/1.1 400 Bad Request')
+        responses, rest = exchange(b'POST /echo HTTP/1.1\r\nContent-Type: application/json\r\n'
+                                   b'Transfer-Encoding: chunked\r\n\r\nzz\r\n{}\r\n0\r\n\r\nGET /rows HTTP/1.1\r\n\r\n')
+        self.assertEqual(responses[0][0], 'HTTP/1.1 400 Bad Request')
+        self.assertEqual(responses[0][1]['Connection'], 'close')
+        self.assertEqual(responses[0][2], b'Malformed request body')
+        self.assertEqual(rest, b'')  # 分块格式错误之后不再解析后面的请求
+
+    def test_read_timeout(self):
+        async def run():
+            server = await serve(make_app(), '127.0.0.1', 0, read_timeout=0.1)
+            port = server.sockets[0].getsockname()[1]
+            results = []
+            for request in (b'GET /hello?name=x HTTP/1.1\r\nHost', b'POST /echo HTTP/1.1\r\nContent-Length: 9\r\n\r\n{}'):
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(request)  # 发送一部分后停止
+                results.append(await asyncio.wait_for(reader.read(), 5))
+                writer.close()
+            server.close()
+            await server.wait_closed()
+            return results
+
+        partial_head, partial_body = asyncio.run(run())
+        self.assertEqual(partial_head, b'')  # 超时后关闭连接
+        self.assertEqual(partial_body, b'')
+
+    def test_stream_stops_on_disconnect(self):
+        app = Application()
+        produced = []
+        closed = threading.Event()
+
+        def forever(ctx: Context):
+            try:
+                while True:
+                    produced.append(1)
+                    yield 'x' * 1024
+                    time.sleep(0.001)
+            finally:
+                closed.set()
+
+        app.add_get_mapping('/forever', forever)
+
+        async def run():
+            server = await serve(app, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /forever HTTP/1.1\r\nHost: x\r\n\r\n')
+            await reader.readuntil(b'\r\n\r\n')
+            await reader.readexactly(4096)
+            writer.close()
+            await asyncio.get_running_loop().run_in_executor(None, closed.wait, 5)
+            server.close()
+            await server.wait_closed()
+
+        asyncio.run(run())
+        self.assertTrue(closed.is_set())  # 客户端断开后generator被close
+        count = len(produced)
+        time.sleep(0.1)
+        self.assertEqual(len(produced), count)
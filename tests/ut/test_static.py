@@ -0,0 +1,54 @@
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+from lessweb.application import Application
+
+
+class Test(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, 'js'))
+        with open(os.path.join(self.root, 'js', 'app.js'), 'w') as f:
+            f.write('console.log(1);\n' * 200)
+        with open(os.path.join(self.root, 'logo.png'), 'wb') as f:
+            f.write(b'\x89PNG' * 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_static_assets(self):
+        app = Application()
+        app.add_static(self.root, '/assets')
+        url = app.static_url('js/app.js')
+        self.assertRegex(url, r'^/assets/js/app\.[0-9a-f]{12}\.js$')
+        self.assertTrue(os.path.isfile(os.path.join(self.root, 'js', 'app.js.gz')))
+        self.assertFalse(os.path.isfile(os.path.join(self.root, 'logo.png.gz')))
+        wsgi = app.wsgifunc()
+
+        def call(path, **headers):
+            env = {'REQUEST_METHOD': 'GET', 'PATH_INFO': path}
+            env.update(('HTTP_' + k.upper(), v) for k, v in headers.items())
+            resp = {}
+            body = wsgi(env, lambda status, h: resp.update(h, status=status))
+            data = b''.join(body)
+            if hasattr(body, 'close'):
+                body.close()
+            return resp, data
+
+        resp, data = call(url, accept_encoding='gzip')
+        self.assertEqual(resp['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(resp['Content-Encoding'], 'gzip')
+        self.assertEqual(resp['Content-Type'], 'application/javascript')
+        self.assertEqual(gzip.decompress(data), b'console.log(1);\n' * 200)
+
+        resp, data = call('/assets/js/app.js')
+        self.assertEqual(resp['Cache-Control'], 'no-cache')
+        self.assertNotIn('Content-Encoding', resp)
+        self.assertEqual(data, b'console.log(1);\n' * 200)
+
+        resp, data = call('/assets/logo.png', accept_encoding='gzip')
+        self.assertEqual((resp['Content-Type'], data), ('image/png', b'\x89PNG' * 10))
+        resp, data = call('/assets/../secret')
+        self.assertEqual(resp['status'], '404 Not Found')